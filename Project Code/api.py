@@ -0,0 +1,373 @@
+# api.py
+# Headless JSON/Arrow API over the forecasts, rollups and product search the dashboards use,
+# for machine consumers that should not render a Streamlit page per request.
+#
+#   uvicorn api:app --port 8000      (run from this directory)
+#
+#   GET  /forecast/{dataset}/{series}?steps=12    one series' forecast and interval bands (oil, wage or hpi)
+#   GET  /forecasts[?dataset=oil]                 the precomputed forecast table (bulk)
+#   GET  /rollup/{dataset}[?year=2020&month=6]    regional monthly means (all months when omitted)
+#   GET  /hpi/predict?region=...&year=2025[&month=January&city=...&beds=3&baths=2&province=...]
+#   GET  /search_product?product=milk             also POST with a form, as static/script.js does
+#   GET  /recommendations?items=whole milk,yogurt[&limit=10]   "frequently bought with" a cart
+#   GET  /basket?items=english cucumber,milk 2% 4 l[&k=2]        where a shopping list is cheapest
+#   GET  /metrics                                 stage timings and cache counters (Prometheus text)
+#
+# Responses carry an ETag derived from the dataset versions behind them (and, for forecasts,
+# the forecast table and champion registry files), and a matching If-None-Match gets
+# 304 Not Modified. Tabular endpoints answer with Arrow IPC (stream format) when asked with
+# `Accept: application/vnd.apache.arrow.stream` or `?format=arrow`.
+# Fits that are not in the forecast table run in a process pool so the event loop stays free.
+import asyncio
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow responses are optional; JSON is always available
+    pa = None
+
+from basket_optimizer import plan_basket
+from data_store import DATASETS, STORES, dataset_version
+from forecasting import (BANDS, CHAMPIONS, FORECAST_TABLE, champion_model, forecast_values, hpi_series, lookup_forecast,
+                         oil_series, wage_series)
+from housing_projections import get_projections
+from instrumentation import prometheus_text
+from panels import get_panel
+from product_search import get_index
+from recommendations import RULES_INDEX, get_rule_index
+from rollups import BUILDERS, get_rollup
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+API_WORKERS = int(os.environ.get('DASHBOARD_API_WORKERS', '2'))
+
+# Function preparing one series of each dataset from its panel
+SERIES = {
+    'oil': oil_series,
+    'wage': wage_series,
+    'hpi': hpi_series,
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+    # Raised in the worker processes too, so it is pickled with both of its arguments
+    def __reduce__(self):
+        return ApiError, (self.status_code, self.message)
+
+
+# Function to prepare a series, raising a 404 for unknown datasets or keys and a 422 for series that cannot be
+# forecast (e.g. too short)
+def prepare_series(dataset, series_key):
+    if dataset not in SERIES:
+        raise ApiError(404, f'Unknown dataset {dataset!r}; expected one of {sorted(SERIES)}')
+    panel = get_panel(dataset)
+    if series_key not in panel:
+        raise ApiError(404, f'Unknown {dataset} series {series_key!r}')
+    try:
+        return SERIES[dataset](panel, series_key)
+    except ValueError as exc:
+        raise ApiError(422, str(exc)) from None
+
+
+# Function to forecast a series from scratch (runs in a worker process)
+def compute_forecast(dataset, series_key, steps):
+    y = prepare_series(dataset, series_key)
+    try:
+        return forecast_values(dataset, series_key, y, steps).to_numpy().tolist()
+    except ValueError as exc:
+        # The model cannot be fitted to this series (e.g. multiplicative seasonality on a non-positive value)
+        raise ApiError(422, str(exc)) from None
+
+
+# Function to read a list query parameter: comma-separated, repeated, or both
+def list_param(request, name):
+    values = [value.strip() for param in request.query_params.getlist(name) for value in param.split(',')]
+    values = [value for value in values if value]
+    if not values:
+        raise ApiError(400, f'Missing query parameter {name!r}')
+    return values
+
+
+# Function to build the ETag for a response from everything it depends on
+def make_etag(*parts):
+    return '"' + hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:20] + '"'
+
+
+# Function to stat the files a forecast is read or chosen from besides its dataset: the forecast table
+# and the champion registry -> [(mtime_ns, size) or None per file]
+def forecast_sources():
+    sources = []
+    for path in (FORECAST_TABLE, CHAMPIONS):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            sources.append(None)
+            continue
+        sources.append((stat.st_mtime_ns, stat.st_size))
+    return sources
+
+
+# Function to check whether the client asked for Arrow
+def wants_arrow(request):
+    return request.query_params.get('format') == 'arrow' or ARROW_STREAM in request.headers.get('accept', '')
+
+
+# Function to encode a DataFrame as an Arrow IPC stream
+def arrow_bytes(frame):
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# Function to answer with 304, Arrow or JSON.
+# `frame` is the tabular form of the result (for Arrow); `payload` the JSON body.
+def respond(request, etag, payload, frame=None):
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+    if frame is not None and wants_arrow(request):
+        if pa is None:
+            raise ApiError(406, 'Arrow responses need pyarrow installed')
+        return Response(arrow_bytes(frame), media_type=ARROW_STREAM, headers=headers)
+    return JSONResponse(payload, headers=headers)
+
+
+# Function to read an integer query parameter
+def int_param(request, name, default=None):
+    value = request.query_params.get(name)
+    if value is None:
+        if default is None:
+            raise ApiError(400, f'Missing query parameter {name!r}')
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(400, f'Query parameter {name!r} must be an integer') from None
+
+
+async def forecast(request):
+    dataset, series_key = request.path_params['dataset'], request.path_params['series']
+    steps = int_param(request, 'steps', 12)
+    if not 1 <= steps <= 120:
+        raise ApiError(400, 'steps must be between 1 and 120')
+
+    y = await run_in_threadpool(prepare_series, dataset, series_key)
+    version = dataset_version(dataset)
+    etag = make_etag('forecast', dataset, series_key, steps, version, forecast_sources())
+    if etag in request.headers.get('if-none-match', ''):
+        return respond(request, etag, None)
+
+    entry = await run_in_threadpool(lookup_forecast, dataset, series_key, steps)
+    if entry is not None:
+        source = 'table'
+        model = entry.get('model', champion_model(dataset, series_key))
+        values = entry['forecast'][:steps].tolist()
+        # Quantiles of the simulated paths; bands missing from an older table are None
+        bands = {band: entry[band][:steps].tolist() if band in entry else None for band in BANDS}
+    else:
+        source = 'fit'
+        model = champion_model(dataset, series_key)
+        loop = asyncio.get_running_loop()
+        values = await loop.run_in_executor(request.app.state.pool, compute_forecast, dataset, series_key, steps)
+        bands = dict.fromkeys(BANDS)
+
+    dates = pd.date_range(y.index.max(), periods=steps + 1, freq='MS')[1:].strftime('%Y-%m-%d').tolist()
+    payload = {'dataset': dataset, 'series': series_key, 'dataset_version': version, 'source': source,
+               'model': model, 'dates': dates, 'forecast': values, **bands}
+    frame = pd.DataFrame({'date': dates, 'forecast': values, **bands})
+    return respond(request, etag, payload, frame)
+
+
+async def forecasts(request):
+    if not os.path.exists(FORECAST_TABLE):
+        raise ApiError(503, 'The forecast table has not been built; run batch_forecast.py')
+    dataset = request.query_params.get('dataset')
+    stat = os.stat(FORECAST_TABLE)
+    etag = make_etag('forecasts', dataset, stat.st_mtime_ns, stat.st_size)
+    if etag in request.headers.get('if-none-match', ''):
+        return respond(request, etag, None)
+
+    table = await run_in_threadpool(pd.read_csv, FORECAST_TABLE)
+    if dataset is not None:
+        table = table[table['dataset'] == dataset]
+    return respond(request, etag, {'rows': table.to_dict(orient='records')}, table)
+
+
+async def rollup(request):
+    dataset = request.path_params['dataset']
+    if dataset not in BUILDERS:
+        raise ApiError(404, f'No rollup for {dataset!r}; expected one of {sorted(BUILDERS)}')
+    data = await run_in_threadpool(get_rollup, dataset)
+    year, month = request.query_params.get('year'), request.query_params.get('month')
+    etag = make_etag('rollup', dataset, year, month, dataset_version(dataset))
+
+    if year is None and month is None:
+        # Every month in long form: one row per (year, month, region) with data
+        years, months, regions = np.meshgrid(data.years, np.arange(1, 13), np.arange(len(data.regions)),
+                                             indexing='ij')
+        frame = pd.DataFrame({'year': years.ravel(), 'month': months.ravel(),
+                              'region': data.regions[regions.ravel()], 'value': data.values.ravel()})
+        frame = frame.dropna(subset=['value'])
+    else:
+        frame = data.frame(int_param(request, 'year'), int_param(request, 'month'), region_column='region',
+                           value_column='value').dropna(subset=['value'])
+    payload = {'dataset': dataset, 'rows': json.loads(frame.to_json(orient='records'))}
+    return respond(request, etag, payload, frame)
+
+
+async def hpi_predict(request):
+    region = request.query_params.get('region')
+    if not region:
+        raise ApiError(400, "Missing query parameter 'region'")
+    year = int_param(request, 'year')
+    month = request.query_params.get('month', 'January')
+
+    hpi_panel = await run_in_threadpool(get_panel, 'hpi')
+    # Same region matching and forecast window as housing.forecast_hpi
+    matching = hpi_panel.match(region)
+    if len(matching) != 1:
+        raise ApiError(404 if not matching else 400,
+                       f'Region {region!r} matches {len(matching)} columns: {matching[:10]}')
+    column = matching[0]
+    try:
+        start_date = pd.to_datetime(f'{year}-{month}-01')
+    except ValueError:
+        raise ApiError(400, f'Unrecognised month {month!r}') from None
+    future_dates = pd.date_range(start=start_date, end=f'{year + 3}-12-31', freq='M')
+
+    version = dataset_version('hpi')
+    params = {key: request.query_params.get(key) for key in ('city', 'beds', 'baths', 'province')}
+    etag = make_etag('hpi', column, str(start_date.date()), params, version,
+                     dataset_version('housing') if os.path.exists(DATASETS['housing'][0]) else None,
+                     forecast_sources())
+    if etag in request.headers.get('if-none-match', ''):
+        return respond(request, etag, None)
+
+    entry = await run_in_threadpool(lookup_forecast, 'hpi', column, len(future_dates))
+    if entry is not None:
+        values = entry['forecast'][:len(future_dates)].tolist()
+    else:
+        loop = asyncio.get_running_loop()
+        values = await loop.run_in_executor(request.app.state.pool, compute_forecast, 'hpi', column,
+                                            len(future_dates))
+    payload = {'region': column, 'dataset_version': version,
+               'dates': future_dates.strftime('%Y-%m-%d').tolist(), 'forecast': values,
+               'forecasted_hpi': values[-1]}
+
+    if params['city'] is not None:
+        if not os.path.exists(DATASETS['housing'][0]):
+            raise ApiError(503, 'housing.csv is not available')
+        projections = await run_in_threadpool(get_projections)
+        current = projections.current_price(params['province'], params['city'], int_param(request, 'beds'),
+                                            int_param(request, 'baths'))
+        if current is None:
+            raise ApiError(404, 'No listings for the selected criteria')
+        # Same arithmetic as housing.predict_price: base price at HPI 100, scaled to the forecast
+        current_price, payload['listings'] = current
+        payload['current_price'] = current_price
+        payload['predicted_price'] = current_price * (values[-1] / 100)
+
+    frame = pd.DataFrame({'date': payload['dates'], 'forecast': values})
+    return respond(request, etag, payload, frame)
+
+
+async def search_product(request):
+    params = dict(request.query_params)
+    if request.method == 'POST':
+        params.update(await request.form())
+    query = next((params[key] for key in ('product', 'query', 'q', 'name') if params.get(key)), '')
+    limit = int_param(request, 'limit', 50)
+
+    index = await run_in_threadpool(get_index)
+    etag = make_etag('search', query, limit, index.sources)
+    results = await run_in_threadpool(index.search, query, limit)
+    frame = pd.DataFrame(results, columns=['Name', 'Price', 'Store'])
+    return respond(request, etag, {'results': results}, frame)
+
+
+async def recommendations(request):
+    cart = list_param(request, 'items')
+    limit = int_param(request, 'limit', 10)
+    if not 1 <= limit <= 100:
+        raise ApiError(400, 'limit must be between 1 and 100')
+
+    index = await run_in_threadpool(get_rule_index)
+    if index is None:
+        raise ApiError(503, 'The rule index has not been built; run recommendations.py build')
+    stat = os.stat(RULES_INDEX)
+    etag = make_etag('recommendations', sorted(set(cart)), limit, stat.st_mtime_ns, stat.st_size)
+    if etag in request.headers.get('if-none-match', ''):
+        return respond(request, etag, None)
+
+    suggestions = index.recommend(cart, limit)
+    frame = pd.DataFrame([{'item': suggestion['item'], 'because': ', '.join(suggestion['because']),
+                           'confidence': suggestion['confidence'], 'lift': suggestion['lift'],
+                           'support': suggestion['support'],
+                           'store': (suggestion['cheapest'] or {}).get('store'),
+                           'price': (suggestion['cheapest'] or {}).get('price')} for suggestion in suggestions],
+                         columns=['item', 'because', 'confidence', 'lift', 'support', 'store', 'price'])
+    return respond(request, etag, {'cart': sorted(set(cart)), 'suggestions': suggestions}, frame)
+
+
+async def basket(request):
+    items = list_param(request, 'items')
+    k = int_param(request, 'k', 2)
+    if k < 1:
+        raise ApiError(400, 'k must be at least 1')
+    etag = make_etag('basket', items, k, [dataset_version(f'store_{store}') for store in STORES])
+    if etag in request.headers.get('if-none-match', ''):
+        return respond(request, etag, None)
+
+    plan = await run_in_threadpool(plan_basket, items, k)
+    frame = pd.DataFrame(plan['split']['items'], columns=['item', 'store', 'product', 'price'])
+    return respond(request, etag, plan, frame)
+
+
+async def metrics(request):
+    return PlainTextResponse(prometheus_text(), media_type='text/plain; version=0.0.4')
+
+
+async def api_error(request, exc):
+    return JSONResponse({'error': exc.message}, status_code=exc.status_code)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.pool = ProcessPoolExecutor(max_workers=API_WORKERS)
+    try:
+        yield
+    finally:
+        app.state.pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route('/forecast/{dataset}/{series:path}', forecast),
+        Route('/forecasts', forecasts),
+        Route('/rollup/{dataset}', rollup),
+        Route('/hpi/predict', hpi_predict),
+        Route('/search_product', search_product, methods=['GET', 'POST']),
+        Route('/recommendations', recommendations),
+        Route('/basket', basket),
+        Route('/metrics', metrics),
+    ],
+    exception_handlers={ApiError: api_error},
+    lifespan=lifespan,
+)
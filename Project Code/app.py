@@ -1,11 +1,19 @@
 # app.py
 import streamlit as st
-from food import food_dashboard
-from oil import oil_dashboard
-from housing import housing_dashboard
-from wage import wage_dashboard
+import importlib
+from instrumentation import render_timer, debug_panel
+from food_inflation import load_cpi_index
 import os
 
+# Dashboard module and entry point of every page. They are imported on first navigation,
+# so a session that only sees the Home screen never loads pandas, matplotlib or statsmodels.
+PAGES = {
+    "Food": ("food", "food_dashboard"),
+    "Oil": ("oil", "oil_dashboard"),
+    "Housing": ("housing", "housing_dashboard"),
+    "Wage": ("wage", "wage_dashboard"),
+}
+
 # Setting up the page configuration
 st.set_page_config(page_title="Inflation Dashboard", page_icon="📊", layout="wide")
 
@@ -50,6 +58,44 @@ def hide_streamlit_style():
     """
     st.markdown(hide_menu_style, unsafe_allow_html=True)
 
+# Function to import a page's dashboard module (once per process) and render it
+def show_page(page):
+    module_name, function_name = PAGES[page]
+    getattr(importlib.import_module(module_name), function_name)()
+
+# Function to draw the forecast CPI-food index written by batch_forecast.py.
+# The chart is built from the JSON file alone, so the front screen still loads no pandas;
+# the static CPI image stands in until the batch job has run.
+def cpi_chart():
+    index = load_cpi_index()
+    entry = index['groups'].get(index['headline']) if index else None
+    if entry is None:
+        st.image("static/cpi.png", caption="Consumer Price Index (CPI) Trend in Canada", use_column_width=True)
+        return
+
+    history = entry['history_months']
+    # The forecast line starts at the last month of history so the two lines join
+    lines = [{'date': month, 'value': value, 'series': 'Index from food prices'}
+             for month, value in zip(entry['months'][:history], entry['index'][:history])]
+    lines += [{'date': month, 'value': value, 'series': 'Forecast'}
+              for month, value in zip(entry['months'][history - 1:], entry['index'][history - 1:])]
+    points = [{'date': f'{year}-07', 'value': value, 'series': 'CPI (annual)'} for year, value in entry['cpi'].items()]
+    x = {'field': 'date', 'type': 'temporal', 'title': None}
+    y = {'field': 'value', 'type': 'quantitative', 'title': 'Index (2002=100)', 'scale': {'zero': False}}
+    color = {'field': 'series', 'type': 'nominal', 'title': None, 'legend': {'orient': 'bottom'}}
+    # Data inside the layers stays in the spec; top-level data would be converted through pandas
+    st.vega_lite_chart({'layer': [
+        {'data': {'values': lines}, 'mark': 'line',
+         'encoding': {'x': x, 'y': y, 'color': color, 'strokeDash': {'field': 'series', 'legend': None}}},
+        {'data': {'values': points}, 'mark': {'type': 'point', 'filled': True, 'size': 20},
+         'encoding': {'x': x, 'y': y, 'color': color}},
+    ]}, use_container_width=True)
+
+    last_year = max(entry['annual'])
+    st.caption(f"Food CPI forecast from {len(entry['products'])} StatCan food prices: "
+               f"{entry['annual'][last_year]:.1f} in {last_year} "
+               f"({entry['inflation'][last_year]:+.1f}% that year)")
+
 # Front screen with inflation details, CPI image, and navigation buttons
 def front_screen():
     st.markdown("<h1 style='text-align: center; color: #4e54c8;'>Inflation Forecast and Smart Purchasing Dashboard</h1>", unsafe_allow_html=True)
@@ -74,7 +120,7 @@ def front_screen():
             </div>
         """, unsafe_allow_html=True)
 
-        st.image("static/cpi.png", caption="Consumer Price Index (CPI) Trend in Canada", use_column_width=True)
+        cpi_chart()
 
         
 
@@ -179,14 +225,13 @@ def front_screen():
 if 'page' not in st.session_state:
     st.session_state.page = "Home"
 
-if st.session_state.page == "Home":
-    hide_streamlit_style()
-    front_screen()
-elif st.session_state.page == "Food":
-    food_dashboard()
-elif st.session_state.page == "Oil":
-    oil_dashboard()
-elif st.session_state.page == "Housing":
-    housing_dashboard()
-elif st.session_state.page == "Wage":
-    wage_dashboard()
+with render_timer(st.session_state.page):
+    if st.session_state.page == "Home":
+        hide_streamlit_style()
+        front_screen()
+    elif st.session_state.page in PAGES:
+        show_page(st.session_state.page)
+
+# Hidden instrumentation panel: open figures, RSS and render times (?debug=1)
+if st.query_params.get("debug") == "1":
+    debug_panel()
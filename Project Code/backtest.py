@@ -0,0 +1,248 @@
+# backtest.py
+# Rolling-origin backtest that picks the forecast model of every oil, wage, HPI and food price series.
+# Each candidate in models.MODELS is fit on the data up to each of the last ORIGINS forecast
+# origins (STRIDE months apart) and scored on the HORIZON months that followed with MASE:
+# the mean absolute error divided by the in-sample error of a seasonal naive forecast, so
+# scores compare across series of any level. The candidate with the lowest mean MASE becomes
+# the series' champion, except that the dataset's default model keeps the title unless a
+# challenger beats it by more than CHAMPION_MARGIN.
+#
+# Every (series, candidate) is a task for a process pool, and its score is appended to a
+# checkpoint file as soon as it finishes, so an interrupted run resumes where it stopped.
+# Scores for an older dataset version or a different configuration are not reused.
+#
+#   python backtest.py [--workers N] [--datasets oil wage hpi food_prices] [--models hw_mul holt arima ...] [--restart]
+#
+# The champions are written to cache/champions.json, which forecasting.champion_model reads;
+# run batch_forecast.py afterwards to rebuild the forecast table with them.
+import argparse
+import hashlib
+import json
+import os
+import time
+import warnings
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from data_store import dataset_version
+from food_prices import get_food_panel
+from forecasting import CHAMPIONS, all_series, load_champions
+from models import DEFAULT_MODELS, MODELS, fit_forecast
+from panels import get_panel
+
+# Months forecast from each origin, number of origins and months between them
+HORIZON = 12
+ORIGINS = 6
+STRIDE = 6
+# Shortest training series an origin may leave
+MIN_TRAIN = 36
+# Seasonal period of the naive forecast that scales the errors
+SEASONAL_PERIODS = 12
+# Relative MASE improvement a challenger needs to replace the dataset's default model
+CHAMPION_MARGIN = 0.02
+
+CHECKPOINT = os.path.join('cache', 'backtest_checkpoint.jsonl')
+
+
+# Function to fingerprint the backtest settings a candidate's score depends on
+def config_hash(model):
+    settings = [HORIZON, ORIGINS, STRIDE, MIN_TRAIN, SEASONAL_PERIODS, MODELS[model]]
+    return hashlib.sha1(json.dumps(settings, default=str).encode()).hexdigest()[:12]
+
+
+# Function to build the checkpoint key of one (series, candidate) evaluation
+def task_key(dataset, series_key, version, model):
+    return f'{dataset}\x1f{series_key}\x1f{version}\x1f{model}\x1f{config_hash(model)}'
+
+
+# Function to list the forecast origins of a series of length n, oldest first
+def forecast_origins(n):
+    origins = [n - HORIZON - k * STRIDE for k in range(ORIGINS)]
+    return sorted(origin for origin in origins if origin >= MIN_TRAIN)
+
+
+# Function to compute the MASE denominator: mean absolute error of a naive forecast in-sample
+def mase_scale(train):
+    for lag in (SEASONAL_PERIODS, 1):
+        if len(train) > lag:
+            scale = np.mean(np.abs(train[lag:] - train[:-lag]))
+            if scale > 0:
+                return scale
+    return np.nan
+
+
+# Function to score one candidate on one series at every origin (runs in a worker process)
+def evaluate(task):
+    dataset, series_key, version, model, values = task
+    warnings.simplefilter('ignore')
+    start = time.perf_counter()
+    result = {'key': task_key(dataset, series_key, version, model), 'dataset': dataset, 'series': series_key,
+              'dataset_version': version, 'model': model}
+    try:
+        origins = forecast_origins(len(values))
+        if not origins:
+            raise ValueError(f'{len(values)} observations leave no forecast origin')
+        mase, smape = [], []
+        for origin in origins:
+            train, actual = values[:origin], values[origin:origin + HORIZON]
+            forecast = fit_forecast(model, train, len(actual))[0]
+            if not np.all(np.isfinite(forecast)):
+                raise ValueError('model produced non-finite forecasts')
+            error = np.abs(actual - forecast)
+            mase.append(error.mean() / mase_scale(train))
+            smape.append(np.mean(2 * error / (np.abs(actual) + np.abs(forecast))))
+        result.update(mase=float(np.nanmean(mase)), smape=float(np.mean(smape)), origins=len(origins), error=None)
+    except Exception as exc:
+        result.update(mase=None, smape=None, origins=0, error=f'{type(exc).__name__}: {exc}')
+    result['seconds'] = round(time.perf_counter() - start, 4)
+    return result
+
+
+# Function to read the scores finished so far -> {key: result}
+def load_checkpoint(path=CHECKPOINT):
+    scores = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write leaves a partial last line
+                    continue
+                scores[result['key']] = result
+    except OSError:
+        pass
+    return scores
+
+
+# Function to build the evaluation tasks, skipping those already in the checkpoint
+def build_tasks(datasets, models, done):
+    versions = {name: dataset_version(name) for name in datasets}
+
+    tasks, series = [], []
+    for dataset, series_key, prepare in all_series(get_panel('oil'), get_panel('wage'), get_panel('hpi'), get_food_panel()):
+        if dataset not in datasets:
+            continue
+        try:
+            values = prepare().to_numpy(dtype=float)
+        except Exception:
+            # Series the dashboards cannot forecast (e.g. too short) are not backtested either
+            continue
+        series.append((dataset, series_key, versions[dataset]))
+        for model in models:
+            if task_key(dataset, series_key, versions[dataset], model) not in done:
+                tasks.append((dataset, series_key, versions[dataset], model, values))
+    return tasks, series
+
+
+# Function to pick the champion of every series from its candidates' scores
+def choose_champions(series, models, scores):
+    champions = []
+    for dataset, series_key, version in series:
+        candidates = {}
+        for model in models:
+            result = scores.get(task_key(dataset, series_key, version, model))
+            if result is not None and result['error'] is None and np.isfinite(result['mase']):
+                candidates[model] = result['mase']
+        if not candidates:
+            continue
+
+        default = DEFAULT_MODELS[dataset]
+        best = min(candidates, key=candidates.get)
+        if default in candidates and candidates[best] > candidates[default] * (1 - CHAMPION_MARGIN):
+            best = default
+        champions.append({'dataset': dataset, 'series': series_key, 'dataset_version': version, 'model': best,
+                          'mase': round(candidates[best], 4),
+                          'default_mase': round(candidates[default], 4) if default in candidates else None,
+                          'scores': {model: round(mase, 4) for model, mase in sorted(candidates.items())}})
+    return champions
+
+
+# Function to write the champion registry atomically
+def write_champions(champions, path=CHAMPIONS):
+    registry = {
+        'built': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {'horizon': HORIZON, 'origins': ORIGINS, 'stride': STRIDE, 'min_train': MIN_TRAIN,
+                   'metric': 'mase', 'champion_margin': CHAMPION_MARGIN},
+        'series': champions,
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(registry, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+    return registry
+
+
+# Function to run every outstanding evaluation in a process pool and write the champion registry
+def run(datasets=tuple(DEFAULT_MODELS), models=tuple(MODELS), workers=None, checkpoint=CHECKPOINT,
+        restart=False, champions_path=CHAMPIONS):
+    start = time.perf_counter()
+    # The default model is always scored so a challenger has something to beat
+    models = list(dict.fromkeys(list(models) + [DEFAULT_MODELS[name] for name in datasets]))
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    scores = load_checkpoint(checkpoint)
+    tasks, series = build_tasks(datasets, models, scores)
+    resumed = sum(1 for dataset, series_key, version in series for model in models
+                  if task_key(dataset, series_key, version, model) in scores)
+
+    os.makedirs(os.path.dirname(checkpoint) or '.', exist_ok=True)
+    with open(checkpoint, 'a') as log, ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(evaluate, task) for task in tasks]
+        try:
+            for future in as_completed(futures):
+                result = future.result()
+                scores[result['key']] = result
+                # One line per finished evaluation; flushed so an interruption loses nothing finished
+                log.write(json.dumps(result, default=str) + '\n')
+                log.flush()
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    champions = choose_champions(series, models, scores)
+    # Champions of datasets left out of this run stay as they were
+    kept = [entry for (dataset, _), entry in load_champions(champions_path).items() if dataset not in datasets]
+    write_champions(kept + champions, champions_path)
+    failures = [scores[task_key(dataset, series_key, version, model)]
+                for dataset, series_key, version in series for model in models
+                if scores.get(task_key(dataset, series_key, version, model), {}).get('error')]
+    return {
+        'champions': champions,
+        'evaluated': len(tasks),
+        'resumed': resumed,
+        'failures': failures,
+        'total_seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest candidate models and pick a champion per series')
+    parser.add_argument('--datasets', nargs='+', choices=sorted(DEFAULT_MODELS), default=sorted(DEFAULT_MODELS))
+    parser.add_argument('--models', nargs='+', choices=sorted(MODELS), default=list(MODELS))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--checkpoint', default=CHECKPOINT)
+    parser.add_argument('--restart', action='store_true', help='ignore the scores of earlier runs')
+    args = parser.parse_args()
+
+    try:
+        report = run(args.datasets, args.models, args.workers, args.checkpoint, args.restart)
+    except KeyboardInterrupt:
+        print(f'Interrupted; finished evaluations are kept in {args.checkpoint} and the next run resumes from them')
+        raise SystemExit(130)
+    champions = report['champions']
+    print(f"Evaluated {report['evaluated']} (series, model) pairs in {report['total_seconds']}s, "
+          f"{report['resumed']} reused from {args.checkpoint}; {len(champions)} champions -> {CHAMPIONS}")
+    for model, count in Counter(champion['model'] for champion in champions).most_common():
+        print(f'  {model}: {count} series')
+    improved = [champion for champion in champions
+                if champion['default_mase'] and champion['mase'] < champion['default_mase']]
+    if improved:
+        gain = np.median([1 - champion['mase'] / champion['default_mase'] for champion in improved])
+        print(f'  {len(improved)} series beat their default model (median MASE {gain:.0%} lower)')
+    for failure in report['failures'][:10]:
+        print(f"  failed: {failure['dataset']}/{failure['series']} {failure['model']}: {failure['error']}")
+    print('Run batch_forecast.py to rebuild the forecast table with the new champions.')
@@ -0,0 +1,285 @@
+# basket_mining.py
+# Frequent itemsets and association rules for basket.csv and transaction_data.csv.
+# Transactions are streamed from the CSV files in chunks and never held in full or
+# one-hot encoded. Each partition of transactions becomes one bitset per frequent item
+# (one bit per transaction), and itemsets are mined depth-first (Eclat) by AND-ing
+# bitsets and counting bits.
+#
+# The partition size follows from the memory budget. When the data needs more than one
+# partition, partitions are mined in parallel with a proportional support threshold and
+# the union of their itemsets is recounted exactly in a second pass (the SON algorithm),
+# so the result does not depend on the budget.
+#
+#   python basket_mining.py [basket.csv transaction_data.csv] [--min-support 0.001] [--max-len 3]
+import argparse
+import itertools
+import math
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+TRANSACTION_FILES = ['basket.csv', 'transaction_data.csv']
+
+# Default memory budget for the partitions being mined by every worker together. It does not
+# cover the interpreter and libraries (~110 MB) or the CSV chunk being parsed (~40 MB).
+MEMORY_BUDGET_MB = int(os.environ.get('DASHBOARD_MINING_MB', '256'))
+CHUNK_ROWS = 50_000
+# Working memory per (transaction, item) pair while a partition is packed and counted
+PAIR_BYTES = 64
+
+
+# Function to stream transactions from wide CSV files, one chunk at a time.
+# Every column holds one item; empty cells are skipped and repeated items counted once.
+# Yields (rows, codes, names, transactions): row numbers from 0 within the chunk, and
+# chunk-local item codes indexing `names`.
+def read_chunks(paths, chunksize=CHUNK_ROWS):
+    for path in paths:
+        for chunk in pd.read_csv(path, dtype=str, chunksize=chunksize):
+            items = chunk.stack()
+            codes, names = pd.factorize(items.to_numpy())
+            # Whitespace is stripped once per distinct name rather than once per cell
+            codes, names = pd.factorize(pd.Index(names).str.strip().to_numpy()[codes])
+            keep = names[codes] != ''
+            rows = items.index.get_level_values(0).to_numpy()[keep]
+            codes = codes[keep]
+
+            # Rows without any item are not transactions; the rest are renumbered
+            labels, rows = np.unique(rows, return_inverse=True)
+            pairs = np.unique(rows.astype(np.int64) * len(names) + codes)
+            yield (pairs // len(names)).astype(np.int32), (pairs % len(names)).astype(np.int32), names, len(labels)
+
+
+# Function to pack (row, item id) pairs into one bitset per item -> (items, words) uint64
+def pack_bitsets(rows, ids, n_rows, n_items):
+    n_words = (n_rows + 63) // 64
+    bits = np.zeros(n_items * n_words * 8, dtype=np.uint8)
+    if not len(rows):
+        # A partition without any frequent item: every bitset stays empty (reduceat needs a value)
+        return bits.view(np.uint64).reshape(n_items, n_words)
+    flat = ids.astype(np.int64) * (n_words * 8) + (rows >> 3)
+    weights = np.left_shift(1, rows & 7).astype(np.uint8)
+    order = np.argsort(flat)
+    flat, weights = flat[order], weights[order]
+    starts = np.flatnonzero(np.r_[True, flat[1:] != flat[:-1]])
+    # Each (item, row) pair is unique, so adding the bits of one byte equals OR-ing them
+    bits[flat[starts]] = np.add.reduceat(weights, starts)
+    return bits.view(np.uint64).reshape(n_items, n_words)
+
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+_H01 = np.uint64(0x0101010101010101)
+
+
+# Function to count the set bits of every row of a bitset array (SWAR popcount on 64-bit words)
+def popcount(bits):
+    x = bits - ((bits >> np.uint64(1)) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return ((x * _H01) >> np.uint64(56)).sum(axis=-1, dtype=np.int64)
+
+
+# Function to count every pair of items at once -> (items, items) co-occurrence counts
+def pair_counts(rows, ids, n_rows, n_items):
+    onehot = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, ids)), shape=(n_rows, n_items))
+    return (onehot.T @ onehot).toarray()
+
+
+# Function to mine every itemset with at least `min_count` transactions -> {item id tuple: count}.
+# `pairs` holds the pair counts, so only frequent pairs are ever joined.
+def eclat(bits, min_count, max_len, pairs):
+    found = {}
+
+    def extend(prefix, prefix_bits, tail):
+        if not prefix:
+            joined, counts = bits, popcount(bits)
+        elif len(prefix) == 1:
+            counts = pairs[prefix[0], tail]
+            joined = None
+        else:
+            joined = bits[tail] & prefix_bits
+            counts = popcount(joined)
+        keep = counts >= min_count
+        tail, counts = tail[keep], counts[keep]
+        if len(prefix) == 1 and max_len > 2:
+            joined = bits[tail] & prefix_bits
+        elif joined is not None:
+            joined = joined[keep]
+
+        for j in range(len(tail)):
+            itemset = prefix + (int(tail[j]),)
+            found[itemset] = int(counts[j])
+            if len(itemset) < max_len and j + 1 < len(tail):
+                extend(itemset, joined[j], tail[j + 1:])
+
+    extend((), None, np.arange(len(bits)))
+    return found
+
+
+# Function to mine one partition (runs in a worker process)
+def mine_partition(task):
+    rows, ids, n_rows, n_items, min_support, max_len = task
+    bits = pack_bitsets(rows, ids, n_rows, n_items)
+    pairs = pair_counts(rows, ids, n_rows, n_items)
+    return eclat(bits, max(1, math.ceil(min_support * n_rows)), max_len, pairs)
+
+
+# Function to count candidate itemsets in one partition (runs in a worker process)
+def count_partition(task):
+    rows, ids, n_rows, n_items, candidates = task
+    bits = pack_bitsets(rows, ids, n_rows, n_items)
+    return [int(popcount(np.bitwise_and.reduce(bits[list(itemset)], axis=0))) for itemset in candidates]
+
+
+# Function to group streamed chunks into partitions of about `partition_rows` transactions,
+# yielding (rows, item ids, transactions) with items outside `codes` dropped
+def partitions(paths, codes, partition_rows, chunksize):
+    parts, n_rows = [], 0
+    for rows, local, names, n_chunk in read_chunks(paths, chunksize):
+        lookup = np.array([codes.get(name, -1) for name in names], dtype=np.int32)
+        ids = lookup[local]
+        keep = ids >= 0
+        parts.append((rows[keep] + n_rows, ids[keep]))
+        n_rows += n_chunk
+        if n_rows >= partition_rows:
+            yield np.concatenate([r for r, _ in parts]), np.concatenate([i for _, i in parts]), n_rows
+            parts, n_rows = [], 0
+    if n_rows:
+        yield np.concatenate([r for r, _ in parts]), np.concatenate([i for _, i in parts]), n_rows
+
+
+# Function to run `fn` over tasks in a pool, keeping at most `workers` tasks in flight
+def bounded_map(fn, tasks, workers):
+    if workers == 1:
+        yield from map(fn, tasks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for task in tasks:
+            pending.append(pool.submit(fn, task))
+            if len(pending) >= workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+class MiningResult:
+    def __init__(self, itemsets, n_transactions, stats):
+        self.itemsets = itemsets              # {tuple of item names: transaction count}
+        self.n_transactions = n_transactions
+        self.stats = stats
+
+    # Function to return the frequent itemsets as a DataFrame (support is a fraction)
+    def frame(self):
+        return pd.DataFrame({
+            'itemsets': list(self.itemsets),
+            'support': np.array(list(self.itemsets.values()), dtype=float) / self.n_transactions,
+        })
+
+
+# Function to mine the frequent itemsets of the transaction files
+def mine(paths=TRANSACTION_FILES, min_support=0.001, max_len=3, memory_mb=MEMORY_BUDGET_MB,
+         workers=None, chunksize=CHUNK_ROWS):
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    # First pass: item supports
+    item_counts, n_transactions = Counter(), 0
+    for _, local, names, n_chunk in read_chunks(paths, chunksize):
+        item_counts.update(dict(zip(names, np.bincount(local, minlength=len(names)).tolist())))
+        n_transactions += n_chunk
+    min_count = max(1, math.ceil(min_support * n_transactions))
+
+    # Rarest items first keeps the tails that are AND-ed together short
+    items = sorted((item for item, count in item_counts.items() if count >= min_count),
+                   key=lambda item: (item_counts[item], item))
+    codes = {item: i for i, item in enumerate(items)}
+
+    # Bitsets plus one intermediate level per itemset length, and the partition's pairs, per worker
+    items_per_row = sum(item_counts[item] for item in items) / max(1, n_transactions)
+    bytes_per_row = max(1, len(items)) * (max_len + 2) / 8 + items_per_row * PAIR_BYTES
+    partition_rows = max(chunksize, int(memory_mb * 2 ** 20 / (bytes_per_row * workers)))
+    n_partitions = max(1, math.ceil(n_transactions / partition_rows))
+    if n_partitions == 1:
+        partition_rows = n_transactions
+        workers = 1
+
+    # Second pass: itemsets of each partition; exact when everything fits in one
+    tasks = ((rows, ids, n_rows, len(items), min_support, max_len)
+             for rows, ids, n_rows in partitions(paths, codes, partition_rows, chunksize))
+    candidates = {}
+    for found in bounded_map(mine_partition, tasks, workers):
+        for itemset, count in found.items():
+            candidates[itemset] = candidates.get(itemset, 0) + count
+
+    if n_partitions > 1:
+        # Third pass: exact counts of every candidate over all transactions
+        candidate_list = list(candidates)
+        totals = np.zeros(len(candidate_list), dtype=np.int64)
+        tasks = ((rows, ids, n_rows, len(items), candidate_list)
+                 for rows, ids, n_rows in partitions(paths, codes, partition_rows, chunksize))
+        for counts in bounded_map(count_partition, tasks, workers):
+            totals += counts
+        candidates = dict(zip(candidate_list, totals.tolist()))
+
+    itemsets = {tuple(sorted(items[i] for i in itemset)): count
+                for itemset, count in candidates.items() if count >= min_count}
+    stats = {
+        'transactions': n_transactions,
+        'items': len(item_counts),
+        'frequent_items': len(items),
+        'partitions': n_partitions,
+        'partition_rows': partition_rows,
+        'workers': workers,
+        'candidates': len(candidates),
+        'itemsets': len(itemsets),
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    return MiningResult(itemsets, n_transactions, stats)
+
+
+# Function to derive association rules from frequent itemsets.
+# Columns follow the usual antecedents/consequents/support/confidence/lift layout.
+def association_rules(result, min_confidence=0.1, min_lift=1.0):
+    counts = result.itemsets
+    n = result.n_transactions
+    records = []
+    for itemset, count in counts.items():
+        if len(itemset) < 2:
+            continue
+        for size in range(1, len(itemset)):
+            for antecedent in itertools.combinations(itemset, size):
+                consequent = tuple(item for item in itemset if item not in antecedent)
+                confidence = count / counts[antecedent]
+                lift = confidence / (counts[consequent] / n)
+                if confidence >= min_confidence and lift >= min_lift:
+                    records.append((antecedent, consequent, counts[antecedent] / n, counts[consequent] / n,
+                                    count / n, confidence, lift))
+    return pd.DataFrame.from_records(records, columns=[
+        'antecedents', 'consequents', 'antecedent support', 'consequent support', 'support',
+        'confidence', 'lift']).sort_values(['lift', 'confidence'], ascending=False, ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mine frequent itemsets and association rules')
+    parser.add_argument('paths', nargs='*', default=TRANSACTION_FILES)
+    parser.add_argument('--min-support', type=float, default=0.001)
+    parser.add_argument('--max-len', type=int, default=3)
+    parser.add_argument('--min-confidence', type=float, default=0.1)
+    parser.add_argument('--memory-mb', type=int, default=MEMORY_BUDGET_MB)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    result = mine(args.paths, args.min_support, args.max_len, args.memory_mb, args.workers)
+    rules = association_rules(result, args.min_confidence)
+    print(', '.join(f'{key}: {value}' for key, value in result.stats.items()))
+    print(f'{len(rules)} rules')
+    for rule in rules.head(10).itertuples():
+        print(f"  {', '.join(rule.antecedents)} -> {', '.join(rule.consequents)}  "
+              f"conf {rule.confidence:.3f}  lift {rule.lift:.2f}")
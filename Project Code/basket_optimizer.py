@@ -0,0 +1,244 @@
+# basket_optimizer.py
+# "Where is my list cheapest?" across the grocery price lists.
+# Store products are normalized into canonical products (name tokens without the pack
+# size, plus the size in grams, millilitres or units), kept in a products x stores price
+# matrix with unit prices alongside. A shopping list is matched against the canonical
+# names and costed for every store at once; the best split across up to k stores is
+# found by scoring every store combination in one NumPy pass.
+#
+#   python basket_optimizer.py [-k 2] "english cucumber" "milk 2% 4 l" "bananas"
+import argparse
+import itertools
+import re
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_store import STORES, dataset_version, get_dataset
+from product_search import tokenize
+
+# Pack sizes, e.g. "450 g", "1.7 kg", "24 x 500 ml", "1,000 ml", "1,5 l", "(2L)", "12 pack"
+SIZE_RE = re.compile(r'(?:(\d+)\s*x\s*)?(\d+(?:[.,]\d+)?)\s*'
+                     r'(kg|mg|g|ml|l|lbs?|oz|packs?|pk|count|ct|ea|pieces)\b')
+# A thousands separator: a comma followed by exactly three digits ("1,000 ml"; "1,5 l" is a decimal comma)
+THOUSANDS_RE = re.compile(r'(?<=\d),(?=\d{3}(?!\d))')
+# Unit -> (base unit, factor to the base unit)
+UNITS = {
+    'mg': ('g', 0.001), 'g': ('g', 1.0), 'kg': ('g', 1000.0), 'lb': ('g', 453.592), 'lbs': ('g', 453.592),
+    'oz': ('g', 28.3495), 'ml': ('ml', 1.0), 'l': ('ml', 1000.0),
+    'pack': ('ea', 1.0), 'packs': ('ea', 1.0), 'pk': ('ea', 1.0), 'count': ('ea', 1.0), 'ct': ('ea', 1.0),
+    'ea': ('ea', 1.0), 'pieces': ('ea', 1.0),
+}
+STOPWORDS = {'a', 'and', 'of', 'the', 'with'}
+
+# The best split considers at most this many stores
+MAX_SPLIT_STORES = 4
+# Matches may have at most this many more words than the closest match ("eggs" should not
+# be priced as "pc blue menu hard boiled eggs omega 3" when plain eggs are listed)
+EXTRA_WORDS = 3
+
+
+# Function to parse the pack size of a product name -> (quantity in base units, base unit) or None
+def parse_size(text):
+    matches = list(SIZE_RE.finditer(THOUSANDS_RE.sub('', str(text).lower())))
+    if not matches:
+        return None
+    count, amount, unit = matches[-1].groups()
+    base, factor = UNITS[unit]
+    return float(amount.replace(',', '.')) * factor * (int(count) if count else 1), base
+
+
+# Function to normalize a product name -> (canonical name, size or None)
+def normalize_name(text):
+    text = str(text)
+    size = parse_size(text)
+    words = [word for word in tokenize(SIZE_RE.sub(' ', THOUSANDS_RE.sub('', text.lower()))) if word not in STOPWORDS]
+    return ' '.join(dict.fromkeys(words)), size
+
+
+class Catalogue:
+    # Canonical products with their lowest price in every store
+    def __init__(self, names, quantities, units, prices, stores):
+        self.names = names            # (P,) canonical names
+        self.quantities = quantities  # (P,) pack size in base units, NaN when unknown
+        self.units = units            # (P,) 'g', 'ml', 'ea' or ''
+        self.prices = prices          # (P, S) lowest price per store, NaN when not stocked
+        self.stores = stores
+        self.lengths = np.array([len(name.split()) for name in names], dtype=np.int32)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.unit_prices = prices / quantities[:, None]
+
+        postings = {}
+        for i, name in enumerate(names):
+            for token in name.split():
+                postings.setdefault(token, []).append(i)
+        self.postings = {token: np.array(ids, dtype=np.int32) for token, ids in postings.items()}
+
+    # Function to build the catalogue from a frame with Name, Price and Store columns
+    @classmethod
+    def from_frame(cls, df, stores):
+        df = df[df['Name'].notna() & df['Price'].notna()]
+        # The same product name is listed by many stores, so each name is normalized once
+        codes, unique_names = pd.factorize(df['Name'])
+        normalized = [normalize_name(name) for name in unique_names]
+        names = np.array([name for name, _ in normalized], dtype=object)
+        quantities = np.array([size[0] if size else np.nan for _, size in normalized])
+        units = np.array([size[1] if size else '' for _, size in normalized], dtype=object)
+        frame = pd.DataFrame({
+            'name': names[codes],
+            'quantity': quantities[codes],
+            'unit': units[codes],
+            'store': pd.Categorical(df['Store'].to_numpy(), categories=stores).codes,
+            'price': df['Price'].to_numpy(dtype=float),
+        })
+        frame = frame[frame['name'] != '']
+
+        # One canonical product per (name, size); NaN sizes are grouped with each other
+        keys = frame[['name', 'quantity', 'unit']].fillna({'quantity': -1.0})
+        product_ids, products = pd.MultiIndex.from_frame(keys).factorize()
+        prices = np.full((len(products), len(stores)), np.inf)
+        np.minimum.at(prices, (product_ids, frame['store'].to_numpy()), frame['price'].to_numpy())
+        prices[np.isinf(prices)] = np.nan
+
+        quantities = products.get_level_values(1).to_numpy(dtype=float)
+        quantities[quantities < 0] = np.nan
+        return cls(products.get_level_values(0).to_numpy(dtype=object), quantities,
+                   products.get_level_values(2).to_numpy(dtype=object), prices, list(stores))
+
+    # Function to return the ids of the canonical products containing every word of a list item
+    def match(self, words):
+        ids = None
+        for word in words:
+            postings = self.postings.get(word)
+            if postings is None:
+                return np.empty(0, dtype=np.int32)
+            ids = postings if ids is None else np.intersect1d(ids, postings, assume_unique=True)
+        return ids if ids is not None else np.empty(0, dtype=np.int32)
+
+    # Function to cost every list item in every store -> (costs (I, S), chosen product ids (I, S))
+    # An item with a size ("milk 4 l") is costed by unit price for that amount; otherwise
+    # the cheapest matching product is taken. Items a store cannot supply cost inf.
+    def item_costs(self, items):
+        costs = np.full((len(items), len(self.stores)), np.inf)
+        chosen = np.full((len(items), len(self.stores)), -1)
+        for i, item in enumerate(items):
+            name, size = normalize_name(item)
+            ids = self.match(name.split())
+            if size is not None:
+                ids = ids[self.units[ids] == size[1]]
+            if not len(ids):
+                continue
+            extra = self.lengths[ids]
+            ids = ids[extra <= extra.min() + EXTRA_WORDS]
+            if size is not None:
+                candidates = self.unit_prices[ids] * size[0]
+            else:
+                candidates = self.prices[ids]
+            candidates = np.where(np.isnan(candidates), np.inf, candidates)
+            best = candidates.argmin(axis=0)
+            costs[i] = candidates[best, np.arange(len(self.stores))]
+            chosen[i] = np.where(np.isfinite(costs[i]), ids[best], -1)
+        return costs, chosen
+
+
+# Function to find the cheapest way to buy the items using at most `k` stores.
+# Returns (store indices, total, store index per item or -1 when none of them stocks it).
+def best_split(costs, k):
+    best = None
+    for size in range(1, min(k, MAX_SPLIT_STORES, costs.shape[1]) + 1):
+        combos = np.array(list(itertools.combinations(range(costs.shape[1]), size)))
+        # (items, combos, size) -> cost of each item at the cheapest store of each combination
+        per_item = costs[:, combos].min(axis=2)
+        missing = np.isinf(per_item).sum(axis=0)
+        totals = np.where(np.isinf(per_item), 0.0, per_item).sum(axis=0)
+        # Cover as many items as possible first, then minimize the total
+        choice = np.lexsort((totals, missing))[0]
+        if best is None or (missing[choice], totals[choice]) < best[:2]:
+            best = (missing[choice], totals[choice], combos[choice])
+
+    _, total, stores = best
+    in_split = costs[:, stores]
+    assignment = np.where(np.isfinite(in_split.min(axis=1)), stores[in_split.argmin(axis=1)], -1)
+    return stores, float(total), assignment
+
+
+_lock = threading.Lock()
+_current = {'versions': None, 'catalogue': None}
+
+
+# Function to return the catalogue of every store, rebuilt when a price list changes
+def get_catalogue():
+    versions = tuple(dataset_version(f'store_{store}') for store in STORES)
+    with _lock:
+        if _current['versions'] == versions:
+            return _current['catalogue']
+
+    frames = [get_dataset(f'store_{store}').assign(Store=store) for store in STORES]
+    catalogue = Catalogue.from_frame(pd.concat(frames, ignore_index=True), STORES)
+    with _lock:
+        _current['versions'] = versions
+        _current['catalogue'] = catalogue
+    return catalogue
+
+
+# Function to cost a shopping list in every store and find the best split across up to `k` stores
+def plan_basket(items, k=2, catalogue=None):
+    if k < 1:
+        raise ValueError(f'k must be at least 1 store, got {k}')
+    catalogue = catalogue if catalogue is not None else get_catalogue()
+    if not len(catalogue.stores):
+        raise ValueError('The catalogue has no stores to plan the list in')
+    costs, chosen = catalogue.item_costs(items)
+
+    found = np.isfinite(costs)
+    totals = np.where(found, costs, 0.0).sum(axis=0)
+    missing = (~found).sum(axis=0)
+    order = np.lexsort((totals, missing))
+    stores = [{'store': catalogue.stores[s], 'total': round(float(totals[s]), 2), 'missing': int(missing[s])}
+              for s in order]
+
+    split_stores, split_total, assignment = best_split(costs, k)
+    split_items = []
+    for i, item in enumerate(items):
+        s = assignment[i]
+        if s < 0:
+            split_items.append({'item': item, 'store': None, 'product': None, 'price': None})
+            continue
+        product = chosen[i, s]
+        size = catalogue.quantities[product]
+        split_items.append({
+            'item': item,
+            'store': catalogue.stores[s],
+            'product': catalogue.names[product] + (f' ({size:g} {catalogue.units[product]})' if size == size else ''),
+            'price': round(float(costs[i, s]), 2),
+        })
+
+    return {
+        'stores': stores,
+        'split': {'stores': [catalogue.stores[s] for s in split_stores], 'total': round(split_total, 2),
+                  'items': split_items},
+        'unmatched': [item for i, item in enumerate(items) if not found[i].any()],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find where a shopping list is cheapest')
+    parser.add_argument('items', nargs='+')
+    parser.add_argument('-k', type=int, default=2, help='most stores to split the list across')
+    args = parser.parse_args()
+
+    catalogue = get_catalogue()
+    start = time.perf_counter()
+    plan = plan_basket(args.items, args.k, catalogue)
+    print(f'Planned in {(time.perf_counter() - start) * 1000:.1f} ms')
+    for row in plan['stores'][:5]:
+        print(f"  {row['store']}: ${row['total']:.2f}" + (f" ({row['missing']} missing)" if row['missing'] else ''))
+    split = plan['split']
+    print(f"Best split over {', '.join(split['stores'])}: ${split['total']:.2f}")
+    for row in split['items']:
+        if row['store'] is not None:
+            print(f"  {row['item']} -> {row['product']} at {row['store']} ${row['price']:.2f}")
+    for item in plan['unmatched']:
+        print(f'  not found anywhere: {item}')
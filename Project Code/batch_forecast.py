@@ -0,0 +1,305 @@
+# batch_forecast.py
+# Batch job that fits every oil province, wage region, HPI column and food product in a
+# process pool and writes the forecast table the dashboards read from, along with the CPI
+# indexes the food forecasts roll up into (food_inflation.py).
+#
+#   python batch_forecast.py [--engine numpy|statsmodels] [--workers N] [--table cache/forecast_table.csv]
+#
+# Every series is fit with its champion model (forecasting.champion_model). The default
+# numpy engine fits every group of aligned Holt-Winters series (same dataset, model and
+# dates) in one batched pass; the statsmodels engine fits one series per task. Other
+# model families are fit one series at a time by either engine. Pages fitting a series
+# missing from the table use the numpy engine (forecasting.fit_values), so its table holds
+# the same forecasts they would fit; the statsmodels engine is kept for comparison.
+# Both simulate N_PATHS future paths per series from the fitted model and store the
+# quantiles in BANDS next to the point forecast, so the pages draw fan charts from the table.
+import argparse
+import json
+import os
+import pickle
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import holtwinters
+from data_store import get_dataset, dataset_version
+from forecast_cache import fit_model, values_hash
+from food_inflation import CPI_INDEX, build_index, write_cpi_index
+from food_prices import get_food_panel
+from forecasting import BANDS, FORECAST_TABLE, MODEL_SPECS, all_series, champion_model, forecast_steps
+from models import MODELS, fit_forecast
+from panels import get_panel
+
+# Simulated future paths per series behind the prediction interval bands
+N_PATHS = int(os.environ.get('DASHBOARD_FORECAST_PATHS', '2000'))
+# Fixed seed so rebuilding an unchanged dataset writes the same bands
+SIMULATION_SEED = 2024
+
+
+# Function to build the forecast rows for one series.
+# `paths` are the simulated futures (n_paths, steps) the interval bands are read from.
+def forecast_rows(dataset, series_key, version, model, y, forecast, paths):
+    forecast = np.asarray(forecast)
+    if not np.all(np.isfinite(forecast)):
+        raise ValueError('model produced non-finite forecasts')
+    steps = len(forecast)
+
+    quantiles = np.quantile(np.asarray(paths), list(BANDS.values()), axis=0)
+    dates = pd.date_range(y.index.max(), periods=steps + 1, freq='MS')[1:]
+    rows = pd.DataFrame({
+        'dataset': dataset,
+        'series': series_key,
+        'dataset_version': version,
+        'model': model,
+        'step': np.arange(1, steps + 1),
+        'date': dates,
+        'forecast': forecast,
+    })
+    for band, values in zip(BANDS, quantiles):
+        rows[band] = values
+    return rows
+
+
+# Function to express a fitted statsmodels model as a holtwinters panel of one -> (state, params, sigma).
+# statsmodels' own simulate treats smoothing_trend as the state-space beta (alpha * beta in the
+# recursions it fits with), so both engines simulate through holtwinters.simulate instead.
+def statsmodels_state(model_fit, spec):
+    nobs = len(model_fit.level)
+    m = spec['seasonal_periods'] if spec.get('seasonal') else 1
+    season = np.zeros(m)
+    if spec.get('seasonal'):
+        # The last season of fitted indices, placed by month slot as holtwinters keeps them
+        season[np.arange(nobs - m, nobs) % m] = np.asarray(model_fit.season)[-m:]
+    state = {'level': np.array([np.asarray(model_fit.level)[-1]]),
+             'trend': np.array([np.asarray(model_fit.trend)[-1] if spec.get('trend') else 0.0]),
+             'season': season[None, :], 't': nobs}
+    params = {'alpha': np.array([model_fit.params['smoothing_level']]),
+              'beta': np.array([model_fit.params['smoothing_trend']]),
+              'gamma': np.array([model_fit.params['smoothing_seasonal']])}
+    return state, params, np.sqrt([model_fit.sse / nobs])
+
+
+# Function to fit one series with statsmodels and return its forecast rows (runs in a worker process)
+def fit_series(task):
+    dataset, series_key, version, model, y = task
+    warnings.simplefilter('ignore')
+    start = time.perf_counter()
+    try:
+        steps = forecast_steps(y.index.max())
+        family, spec = MODELS[model]
+        if family == 'holtwinters':
+            model_fit = fit_model(y, spec, version, series_key)
+            forecast = model_fit.predict(start=len(y), end=len(y) + steps - 1)
+            state, params, sigma = statsmodels_state(model_fit, spec)
+            paths = holtwinters.simulate(state, params, sigma, steps, N_PATHS, spec.get('trend'),
+                                         spec.get('seasonal'), state['season'].shape[1],
+                                         np.random.default_rng(SIMULATION_SEED))[0]
+        else:
+            forecast, paths = fit_forecast(model, y, steps, N_PATHS, np.random.default_rng(SIMULATION_SEED))
+        rows = forecast_rows(dataset, series_key, version, model, y, forecast, paths)
+        return [{'dataset': dataset, 'series': series_key, 'seconds': time.perf_counter() - start,
+                 'rows': rows, 'model': None, 'error': None}]
+    except Exception as exc:
+        return [{'dataset': dataset, 'series': series_key, 'seconds': time.perf_counter() - start,
+                 'rows': None, 'error': f'{type(exc).__name__}: {exc}'}]
+
+
+# Function to capture what is needed to continue one series' smoothing from where the fit ended
+def model_record(model, result, i, y, sse):
+    state = result.state
+    return {
+        'model': model,
+        'spec': MODELS[model][1],
+        'params': result.series_params(i),
+        'state': {'level': float(state['level'][i]), 'trend': float(state['trend'][i]),
+                  'season': state['season'][i].copy(), 't': state['t']},
+        'nobs': len(y),
+        'sse': float(sse),
+        'last_date': y.index.max(),
+        'checksum': values_hash(y),
+    }
+
+
+# Function to fit a group of aligned series in one batched pass (runs in a worker process)
+def fit_group(tasks):
+    dataset, _, _, model, y = tasks[0]
+    index = y.index
+    family, spec = MODELS[model]
+    if family != 'holtwinters':
+        return [fit_single(task) for task in tasks]
+
+    start = time.perf_counter()
+    try:
+        panel = np.vstack([y.to_numpy(dtype=float) for _, _, _, _, y in tasks])
+        result = holtwinters.fit(panel, **spec)
+        steps = forecast_steps(index.max())
+        forecast = result.forecast(steps)
+        # (S, N_PATHS, steps) for the whole group in one pass
+        paths = result.simulate(steps, N_PATHS, np.random.default_rng(SIMULATION_SEED))
+    except Exception as exc:
+        if len(tasks) == 1:
+            return [{'dataset': dataset, 'series': tasks[0][1], 'seconds': time.perf_counter() - start,
+                     'rows': None, 'error': f'{type(exc).__name__}: {exc}'}]
+        # Fit the series one at a time so a single bad series does not sink the group
+        return [outcome for task in tasks for outcome in fit_group([task])]
+
+    # The batched fit is shared, so each series is charged an equal part of it
+    seconds = (time.perf_counter() - start) / len(tasks)
+    outcomes = []
+    for i, (_, series_key, version, _, y) in enumerate(tasks):
+        try:
+            rows = forecast_rows(dataset, series_key, version, model, y, forecast[i], paths[i])
+            outcomes.append({'dataset': dataset, 'series': series_key, 'seconds': seconds,
+                             'rows': rows, 'model': model_record(model, result, i, y, result.sse[i]),
+                             'error': None})
+        except Exception as exc:
+            outcomes.append({'dataset': dataset, 'series': series_key, 'seconds': seconds,
+                             'rows': None, 'error': f'{type(exc).__name__}: {exc}'})
+    return outcomes
+
+
+# Function to fit one series whose champion is not a Holt-Winters model.
+# There is no smoothing state to carry forward, so incremental.py refits these.
+def fit_single(task):
+    dataset, series_key, version, model, y = task
+    start = time.perf_counter()
+    try:
+        forecast, paths = fit_forecast(model, y, forecast_steps(y.index.max()), N_PATHS,
+                                       np.random.default_rng(SIMULATION_SEED))
+        rows = forecast_rows(dataset, series_key, version, model, y, forecast, paths)
+        return {'dataset': dataset, 'series': series_key, 'seconds': time.perf_counter() - start,
+                'rows': rows, 'model': None, 'error': None}
+    except Exception as exc:
+        return {'dataset': dataset, 'series': series_key, 'seconds': time.perf_counter() - start,
+                'rows': None, 'error': f'{type(exc).__name__}: {exc}'}
+
+
+# Function to group tasks whose series share a dataset, a model and an identical date index
+def group_tasks(tasks):
+    groups = {}
+    for task in tasks:
+        dataset, _, _, model, y = task
+        groups.setdefault((dataset, model, tuple(y.index)), []).append(task)
+    return list(groups.values())
+
+
+# Function to build the task list for every series
+def build_tasks():
+    versions = {name: dataset_version(name) for name in MODEL_SPECS}
+
+    tasks, failures = [], []
+    for dataset, series_key, prepare in all_series(get_panel('oil'), get_panel('wage'), get_panel('hpi'), get_food_panel()):
+        try:
+            tasks.append((dataset, series_key, versions[dataset], champion_model(dataset, series_key), prepare()))
+        except Exception as exc:
+            failures.append({'dataset': dataset, 'series': series_key, 'seconds': 0.0,
+                             'error': f'{type(exc).__name__}: {exc}'})
+    return tasks, failures
+
+
+# Function to return where the fitted Holt-Winters states for a forecast table are kept.
+# incremental.py uses them to warm-update forecasts when new months arrive.
+def states_path(table_path):
+    return os.path.splitext(table_path)[0] + '_states.pkl'
+
+
+# Function to return where the CPI indexes rolled up from a forecast table's food forecasts are kept
+def cpi_index_path(table_path):
+    if table_path == FORECAST_TABLE:
+        return CPI_INDEX
+    return os.path.splitext(table_path)[0] + '_cpi_index.json'
+
+
+# Function to load the saved model states -> {(dataset, series): record}
+def load_model_states(path):
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+
+
+# Function to save the model states atomically
+def save_model_states(states, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(states, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+# Function to write a forecast table atomically
+def write_table(table, table_path):
+    os.makedirs(os.path.dirname(table_path) or '.', exist_ok=True)
+    tmp_path = f'{table_path}.{os.getpid()}.tmp'
+    table.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, table_path)
+
+
+# Function to fit every series in parallel and write the forecast table and report
+def run(table_path=FORECAST_TABLE, workers=None, engine='numpy'):
+    start = time.perf_counter()
+    tasks, failures = build_tasks()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        if engine == 'numpy':
+            batches = pool.map(fit_group, group_tasks(tasks))
+        else:
+            batches = pool.map(fit_series, tasks)
+        results = [result for batch in batches for result in batch]
+
+    frames, timings, states = [], [], {}
+    for result in results:
+        if result['error'] is None:
+            frames.append(result['rows'])
+            if result['model'] is not None:
+                states[(result['dataset'], result['series'])] = result['model']
+            timings.append({'dataset': result['dataset'], 'series': result['series'],
+                            'seconds': round(result['seconds'], 4)})
+        else:
+            failures.append({key: result[key] for key in ('dataset', 'series', 'seconds', 'error')})
+
+    write_table(pd.concat(frames, ignore_index=True), table_path)
+    save_model_states(states, states_path(table_path))
+
+    # The food products' forecasts roll up into the CPI indexes the front screen shows
+    food = {result['series']: result['rows']['forecast'].to_numpy() for result in results
+            if result['dataset'] == 'food_prices' and result['error'] is None}
+    if food:
+        index = build_index(get_food_panel(), food, get_dataset('cpi'), dataset_version('food_prices'))
+        write_cpi_index(index, cpi_index_path(table_path))
+
+    report = {
+        'table': table_path,
+        'cpi_index': cpi_index_path(table_path) if food else None,
+        'engine': engine,
+        'series_fitted': len(timings),
+        'series_failed': len(failures),
+        'total_seconds': round(time.perf_counter() - start, 3),
+        'timings': sorted(timings, key=lambda t: -t['seconds']),
+        'failures': failures,
+    }
+    with open(os.path.splitext(table_path)[0] + '_report.json', 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Precompute forecasts for every series')
+    parser.add_argument('--table', default=FORECAST_TABLE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--engine', choices=['numpy', 'statsmodels'], default='numpy')
+    args = parser.parse_args()
+
+    report = run(args.table, args.workers, args.engine)
+    print(f"Fitted {report['series_fitted']} series in {report['total_seconds']}s, "
+          f"{report['series_failed']} failed -> {report['table']}")
+    if report['cpi_index']:
+        print(f"CPI indexes -> {report['cpi_index']}")
+    for timing in report['timings'][:5]:
+        print(f"  slowest: {timing['dataset']}/{timing['series']} {timing['seconds']}s")
+    for failure in report['failures']:
+        print(f"  failed: {failure['dataset']}/{failure['series']}: {failure['error']}")
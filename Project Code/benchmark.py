@@ -0,0 +1,908 @@
+# benchmark.py
+# Benchmarks for the dashboard hot paths. Each benchmark prints a short report and,
+# with --json, writes its numbers to a file so runs can be compared across commits.
+#
+#   python benchmark.py holtwinters [--json results.json]
+#   python benchmark.py intervals [--paths 2000]       (simulated prediction intervals)
+#   python benchmark.py rollup
+#   python benchmark.py search
+#   python benchmark.py basket [--scale 10] [--items 50]
+#   python benchmark.py mining [--transactions 10000000] [--memory-mb 256]
+#   python benchmark.py recommendations               (carts through the /recommendations API route)
+#   python benchmark.py housing [--scale 10]
+#   python benchmark.py food [--scale 100]            (food price ingest: peak RSS before and after)
+#   python benchmark.py charts                        (trend chart payload and render time: PNG vs client-side)
+#   python benchmark.py imports                       (import time per module, Home first paint)
+#   python benchmark.py pages [--interactions 30]     (loadtest.py adds concurrent sessions)
+#   python benchmark.py pool [--sessions 8]           (on-demand fits: script threads vs forecast workers)
+#   python benchmark.py panels                        (per-request series reshaping: frames vs monthly panels)
+import argparse
+import json
+import time
+import warnings
+
+import numpy as np
+
+
+# Function to time a callable, returning (best seconds over `repeat` runs, last result)
+def timed(fn, repeat=3):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# Function to compare the vectorized Holt-Winters engine with the per-series statsmodels loop
+def bench_holtwinters(args):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    import holtwinters
+    from forecasting import MODEL_SPECS, hpi_series, wage_series
+    from panels import get_panel
+
+    hpi, wage = get_panel('hpi'), get_panel('wage')
+    panels = {
+        'hpi': np.vstack([hpi_series(hpi, region).to_numpy(dtype=float) for region in hpi.regions]),
+        'wage': np.vstack([wage_series(wage, region).to_numpy(dtype=float) for region in wage.regions]),
+    }
+
+    results = {}
+    for name, panel in panels.items():
+        spec = MODEL_SPECS[name]
+
+        def statsmodels_loop():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                return [ExponentialSmoothing(row, **spec).fit() for row in panel]
+
+        loop_seconds, fits = timed(statsmodels_loop, repeat=args.repeat)
+        engine_seconds, result = timed(lambda: holtwinters.fit(panel, **spec), repeat=args.repeat)
+
+        reference = np.vstack([fit.forecast(48) for fit in fits])
+        sse_ratio = result.sse / np.array([fit.sse for fit in fits])
+        forecast_error = np.median(np.abs(result.forecast(48) - reference) / np.abs(reference), axis=1)
+        results[name] = {
+            'series': panel.shape[0],
+            'months': panel.shape[1],
+            'statsmodels_loop_s': round(loop_seconds, 4),
+            'numpy_engine_s': round(engine_seconds, 4),
+            'speedup': round(loop_seconds / engine_seconds, 1),
+            'sse_ratio_median': round(float(np.median(sse_ratio)), 4),
+            'sse_ratio_max': round(float(sse_ratio.max()), 4),
+            'forecast_mdape_median': round(float(np.median(forecast_error)), 4),
+            'forecast_mdape_max': round(float(forecast_error.max()), 4),
+        }
+    return results
+
+
+# Function to compare simulating every path in one vectorized pass with simulating one path at a time
+def bench_intervals(args):
+    import holtwinters
+    from forecasting import MAX_STEPS, MODEL_SPECS, hpi_series, wage_series
+    from panels import get_panel
+
+    hpi, wage = get_panel('hpi'), get_panel('wage')
+    panels = {
+        'hpi': np.vstack([hpi_series(hpi, region).to_numpy(dtype=float) for region in hpi.regions]),
+        'wage': np.vstack([wage_series(wage, region).to_numpy(dtype=float) for region in wage.regions]),
+    }
+
+    results = {}
+    for name, panel in panels.items():
+        result = holtwinters.fit(panel, **MODEL_SPECS[name])
+        rng = np.random.default_rng(0)
+
+        def path_loop():
+            return np.stack([result.simulate(MAX_STEPS, 1, rng)[:, 0] for _ in range(args.paths)], axis=1)
+
+        loop_seconds, _ = timed(path_loop, repeat=args.repeat)
+        vector_seconds, paths = timed(lambda: result.simulate(MAX_STEPS, args.paths, rng), repeat=args.repeat)
+
+        # The simulated median should sit on the point forecast, and the 95% band should widen with the horizon
+        forecast = result.forecast(MAX_STEPS)
+        lower, median, upper = np.quantile(paths, [0.025, 0.5, 0.975], axis=1)
+        results[name] = {
+            'series': panel.shape[0],
+            'paths': args.paths,
+            'steps': MAX_STEPS,
+            'path_loop_s': round(loop_seconds, 4),
+            'vectorized_s': round(vector_seconds, 4),
+            'speedup': round(loop_seconds / vector_seconds, 1),
+            'median_vs_forecast_max_pct': round(float(np.max(np.abs(median - forecast) / np.abs(forecast))) * 100, 3),
+            'band_width_step_1': round(float(np.median(upper[:, 0] - lower[:, 0])), 3),
+            'band_width_step_48': round(float(np.median(upper[:, -1] - lower[:, -1])), 3),
+        }
+    return results
+
+
+# Function to compare the per-interaction cost of a regional bar chart's data before and after the rollup
+def bench_rollup(args):
+    import pandas as pd
+
+    import panels
+    import rollups
+    from data_store import get_dataset
+
+    # The slicing each regional page did on every interaction before the rollup existed
+    def mask_groupby(df, region_column):
+        def query(year, month):
+            filtered_df = df[(df['Date'].dt.year == year) & (df['Date'].dt.month == month)]
+            return filtered_df.groupby(region_column)['Value'].mean()
+        return query
+
+    def slice_mean(df):
+        def query(year, month):
+            start_date = pd.Timestamp(year, month, 1)
+            end_date = start_date + pd.DateOffset(months=1) - pd.DateOffset(days=1)
+            return df.loc[start_date:end_date].apply(pd.to_numeric, errors='coerce').mean()
+        return query
+
+    cases = {
+        'oil': (lambda: mask_groupby(get_dataset('oil'), 'Province')),
+        'wage': (lambda: mask_groupby(get_dataset('wage'), 'Geography')),
+        'hpi': (lambda: slice_mean(get_dataset('hpi'))),
+    }
+
+    results = {}
+    for name, make_query in cases.items():
+        query = make_query()
+        rollup_seconds, rollup = timed(lambda: rollups.BUILDERS[name](panels.BUILDERS[name](get_dataset(name))),
+                                       repeat=args.repeat)
+        interactions = [(int(year), month) for year in rollup.years for month in range(1, 13)]
+
+        before_seconds, _ = timed(lambda: [query(*key) for key in interactions], repeat=args.repeat)
+        after_seconds, _ = timed(lambda: [rollup.lookup(*key) for key in interactions], repeat=args.repeat)
+
+        # Both paths must agree on every month
+        mismatches = 0
+        for key in interactions:
+            expected = query(*key)
+            regions, values = rollup.lookup(*key)
+            actual = pd.Series(values, index=regions)
+            expected = pd.to_numeric(expected, errors='coerce').reindex(actual.index)
+            mismatches += not np.allclose(actual.to_numpy(), expected.to_numpy(dtype=float), equal_nan=True)
+
+        results[name] = {
+            'interactions': len(interactions),
+            'rollup_build_s': round(rollup_seconds, 4),
+            'before_per_interaction_ms': round(before_seconds / len(interactions) * 1000, 4),
+            'after_per_interaction_ms': round(after_seconds / len(interactions) * 1000, 4),
+            'speedup': round(before_seconds / after_seconds, 1),
+            'mismatched_months': mismatches,
+        }
+    return results
+
+
+# Function to compare product search through the inverted index with a scan over every price list
+def bench_search(args):
+    import pandas as pd
+
+    import product_search
+    from data_store import STORES, get_dataset
+
+    queries = ['english cucumber', 'milk 2%', 'chicken breast', 'banana', 'cheddar chees',
+               'orange juice', 'greek yogurt', 'brea', 'frozen pizza', 'olive oil']
+
+    build_seconds, index = timed(product_search.build_index, repeat=1)
+    product_search.save_index(index, product_search.SEARCH_INDEX)
+    load_seconds, _ = timed(lambda: product_search.load_index(product_search.SEARCH_INDEX), repeat=args.repeat)
+
+    catalogue = pd.concat([get_dataset(f'store_{store}').assign(Store=store) for store in STORES],
+                          ignore_index=True)
+
+    # Case-insensitive substring match of every word, as a plain scan would do it
+    def scan(query):
+        mask = pd.Series(True, index=catalogue.index)
+        for word in query.lower().split():
+            mask &= catalogue['Name'].str.lower().str.contains(word, regex=False, na=False)
+        return catalogue[mask].sort_values('Price').head(50)
+
+    scan_seconds, _ = timed(lambda: [scan(query) for query in queries], repeat=args.repeat)
+    index_seconds, _ = timed(lambda: [index.search(query) for query in queries], repeat=args.repeat)
+    latencies = []
+    for query in queries:
+        latencies.append(timed(lambda: index.search(query), repeat=args.repeat)[0] * 1000)
+
+    return {'search': {
+        'products': len(index.names),
+        'tokens': len(index.vocabulary),
+        'index_build_s': round(build_seconds, 3),
+        'index_load_s': round(load_seconds, 3),
+        'scan_per_query_ms': round(scan_seconds / len(queries) * 1000, 2),
+        'index_per_query_ms': round(index_seconds / len(queries) * 1000, 2),
+        'index_max_query_ms': round(max(latencies), 2),
+        'speedup': round(scan_seconds / index_seconds, 1),
+    }}
+
+
+# Function to time basket planning on synthetic shopping lists over an enlarged catalogue
+def bench_basket(args):
+    import pandas as pd
+
+    import basket_optimizer
+    from data_store import STORES, get_dataset
+
+    frame = pd.concat([get_dataset(f'store_{store}').assign(Store=store) for store in STORES],
+                      ignore_index=True)
+    frame = frame[frame['Name'].notna() & frame['Price'].notna()]
+
+    # Each copy gets its own brand word and slightly different prices, so the canonical
+    # products and the prices per store grow with the scale
+    rng = np.random.default_rng(0)
+    copies = [frame] + [frame.assign(Name='brand' + str(copy) + ' ' + frame['Name'],
+                                     Price=frame['Price'] * rng.uniform(0.8, 1.2, len(frame)))
+                        for copy in range(1, args.scale)]
+    synthetic = pd.concat(copies, ignore_index=True)
+
+    build_seconds, catalogue = timed(lambda: basket_optimizer.Catalogue.from_frame(synthetic, STORES), repeat=1)
+
+    # Lists are made of the first one to three words of random catalogue products
+    names = catalogue.names
+    lists = []
+    for _ in range(args.lists):
+        picks = rng.choice(len(names), args.items, replace=False)
+        lists.append([' '.join(names[i].split()[:rng.integers(1, 4)]) for i in picks])
+
+    results = {}
+    for k in (1, 2, 3):
+        latencies = [timed(lambda: basket_optimizer.plan_basket(items, k, catalogue), repeat=args.repeat)[0]
+                     for items in lists]
+        results[f'k={k}'] = {
+            'catalogue_rows': len(synthetic),
+            'canonical_products': len(names),
+            'catalogue_build_s': round(build_seconds, 3),
+            'items_per_list': args.items,
+            'mean_ms': round(float(np.mean(latencies)) * 1000, 2),
+            'p95_ms': round(float(np.percentile(latencies, 95)) * 1000, 2),
+            'max_ms': round(float(np.max(latencies)) * 1000, 2),
+        }
+    return results
+
+
+# Function to mine synthetic transactions and report the peak memory of the mining processes
+def _mine_in_child(path, min_support, memory_mb, workers):
+    import resource
+
+    import basket_mining
+
+    result = basket_mining.mine([path], min_support, memory_mb=memory_mb, workers=workers)
+    rules = basket_mining.association_rules(result)
+    # Peak RSS of this process and of its own workers, in bytes
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+    return result.stats, len(rules), peak
+
+
+# Function to time the mining engine on synthetic transactions resampled from basket.csv
+def bench_mining(args):
+    import os
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    import pandas as pd
+
+    baskets = pd.read_csv('basket.csv', dtype=str)
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'transactions.csv')
+        start = time.perf_counter()
+        written = 0
+        while written < args.transactions:
+            rows = min(1_000_000, args.transactions - written)
+            sample = baskets.iloc[rng.integers(0, len(baskets), rows)]
+            sample.to_csv(path, mode='a', index=False, header=written == 0)
+            written += rows
+        generate_seconds = time.perf_counter() - start
+
+        # Mining runs in a fresh process so its peak memory is not mixed with the generator's
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            stats, rules, peak = pool.submit(_mine_in_child, path, args.min_support,
+                                             args.memory_mb, args.workers).result()
+        file_bytes = os.path.getsize(path)
+
+    return {'mining': {
+        **stats,
+        'rules': rules,
+        'csv_mb': round(file_bytes / 2 ** 20, 1),
+        'generate_s': round(generate_seconds, 1),
+        'transactions_per_s': round(stats['transactions'] / stats['seconds']),
+        'memory_budget_mb': args.memory_mb,
+        'peak_process_rss_mb': round(peak / 2 ** 20, 1),
+        # What a one-hot boolean frame of every item would need
+        'one_hot_mb': round(stats['transactions'] * stats['items'] / 2 ** 20, 1),
+    }}
+
+
+# Function to send one GET through an ASGI app in this process -> (status, headers, body); no server needed
+async def _asgi_get(app, path, params=(), headers=()):
+    from urllib.parse import urlencode
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': urlencode(params).encode(),
+             'headers': [(name.encode(), value.encode()) for name, value in headers],
+             'client': ('127.0.0.1', 0), 'server': ('benchmark', 80)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = next(message for message in messages if message['type'] == 'http.response.start')
+    body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+    return start['status'], {name.decode(): value.decode() for name, value in start['headers']}, body
+
+
+# Function to time cart recommendations through the API route, checking each answer against the index
+def bench_recommendations(args):
+    import asyncio
+
+    import recommendations
+    from api import app
+
+    if recommendations.get_rule_index() is None:
+        recommendations.publish(recommendations.build_index())
+    index = recommendations.get_rule_index()
+    items = sorted({item for key in index.keys for item in key.split('\x1f')})
+    rng = np.random.default_rng(0)
+    carts = [list(rng.choice(items, size=min(size, len(items)), replace=False)) for size in (1, 2, 3, 5) * 5]
+
+    async def run():
+        latencies, suggestions = [], 0
+        for cart in carts:
+            # Half the carts as one comma-separated parameter, half as repeated parameters
+            params = [('items', ','.join(cart))] if len(latencies) % 2 else [('items', item) for item in cart]
+            start = time.perf_counter()
+            status, headers, body = await _asgi_get(app, '/recommendations', params)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert status == 200, body
+            answer = json.loads(body)['suggestions']
+            assert answer == json.loads(json.dumps(index.recommend(cart))), cart
+            suggestions += len(answer)
+            # Asked again with its ETag, the same cart is not recomputed
+            status, _, _ = await _asgi_get(app, '/recommendations', params, [('if-none-match', headers['etag'])])
+            assert status == 304, status
+        status, _, _ = await _asgi_get(app, '/recommendations')
+        assert status == 400, status
+        return latencies, suggestions
+
+    latencies, suggestions = asyncio.run(run())
+    return {'recommendations': {
+        'rules': index.info['rules'],
+        'carts': len(carts),
+        'suggestions': suggestions,
+        'route_p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'route_max_ms': round(max(latencies), 2),
+    }}
+
+
+# Function to load the food price table whole, as data_store did before the streaming reader
+def _read_food_whole(path):
+    import pandas as pd
+
+    df = pd.read_csv(path, encoding='utf-8-sig')
+    df['REF_DATE'] = pd.to_datetime(df['REF_DATE'], format='%Y-%m')
+    df['VALUE'] = pd.to_numeric(df['VALUE'], errors='coerce')
+    for col in df.columns.drop(['REF_DATE', 'VALUE']):
+        df[col] = df[col].astype('category')
+    return df
+
+
+# Function to load the food price table one way and report (seconds, peak RSS, bytes held, prices)
+def _food_in_child(path, mode):
+    import resource
+
+    import data_store
+    import food_prices
+
+    start = time.perf_counter()
+    if mode == 'whole':
+        df = _read_food_whole(path)
+        held, prices = int(df.memory_usage(index=True, deep=True).sum()), int(df['VALUE'].notna().sum())
+    elif mode == 'long':
+        # The registry's compact long frame
+        df = data_store.read_food_prices(path)
+        held, prices = int(df.memory_usage(index=True, deep=True).sum()), int(df['VALUE'].notna().sum())
+    elif mode == 'panel':
+        panel = food_prices.read_panel(path)
+        held, prices = panel.nbytes(), int(np.isfinite(panel.values).sum())
+    else:
+        # Interpreter and imports only, the floor under every loader
+        held, prices = 0, 0
+    seconds = time.perf_counter() - start
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, held, prices
+
+
+# Function to compare the peak memory of loading the food price table whole and streamed
+def bench_food(args):
+    import os
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    import pandas as pd
+
+    source = 'Canadian_Food_Prices_Historical.csv'
+    raw = pd.read_csv(source, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # The table repeated as `scale` geographies, shaped like the full multi-geography StatCan table
+        path = os.path.join(tmp, 'food_prices.csv')
+        start = time.perf_counter()
+        for i in range(args.scale):
+            copy = raw.assign(GEO=raw['GEO'] if i == 0 else f'Geography {i}')
+            copy.to_csv(path, mode='a', index=False, header=i == 0)
+        generate_seconds = time.perf_counter() - start
+
+        for mode in ('baseline', 'whole', 'long', 'panel'):
+            # Each load runs in a fresh process so the peaks do not mix
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                seconds, peak, held, prices = pool.submit(_food_in_child, path, mode).result()
+            results[mode] = {'prices': prices, 'seconds': round(seconds, 3), 'peak_rss_mb': round(peak / 2 ** 20, 1),
+                             'held_mb': round(held / 2 ** 20, 2)}
+        csv_mb = os.path.getsize(path) / 2 ** 20
+
+    floor = results['baseline']['peak_rss_mb']
+    for mode in ('whole', 'long', 'panel'):
+        results[mode]['peak_above_baseline_mb'] = round(results[mode]['peak_rss_mb'] - floor, 1)
+    results['baseline'].update(csv_mb=round(csv_mb, 1), generate_s=round(generate_seconds, 1))
+    return results
+
+
+# Function to compare the trend charts' matplotlib PNGs with the downsampled client-side specs.
+# Every chart state is rendered once each way, as a chart cache miss would; payloads are the
+# PNG bytes and the JSON spec st.vega_lite_chart sends.
+def bench_charts(args):
+    import pandas as pd
+    from matplotlib.figure import Figure
+
+    from chart_cache import CHART_DPI, encode_figure, plot_fan
+    from client_charts import CHART_POINTS, chart_spec
+    from data_store import get_dataset
+    from forecasting import MAX_STEPS, forecast_bands, forecast_values, hpi_series
+    from panels import get_panel
+
+    oil_df, wage_df, hpi_df = get_dataset('oil'), get_dataset('wage'), get_dataset('hpi')
+    oil_df = oil_df[(oil_df['Date'].dt.year >= 1990) & (oil_df['Date'].dt.year <= 2024)]
+
+    # The charts as the pages drew them before: (lines, bands, draw, dpi) per chart state
+    def oil_trend(province):
+        rows = oil_df[oil_df['Province'] == province]
+
+        def draw():
+            fig = Figure(figsize=(10, 5))
+            ax = fig.subplots()
+            ax.plot(rows['Date'], rows['Value'], label=province)
+            ax.legend()
+            return fig
+        return [(province, rows['Date'], rows['Value'], {})], None, draw, CHART_DPI
+
+    def wage_trend():
+        trend = wage_df[(wage_df['Date'].dt.year >= 1990) & (wage_df['Date'].dt.year <= 2024)]
+        trend = trend.groupby('Date')['Value'].mean()
+
+        def draw():
+            fig = Figure(figsize=(12, 6))
+            ax = fig.subplots()
+            ax.plot(trend.index, trend.values, marker='o', linestyle='-')
+            ax.grid(True)
+            return fig
+        return [('Average Weekly Earnings', trend.index, trend.values, {})], None, draw, CHART_DPI
+
+    def hpi_trend(region, forecast=False):
+        data = hpi_df[region].resample('M').mean()
+        lines = [(f'{region} HPI', data.index, data.values, {'color': 'blue', 'width': 2})]
+        dates = values = bands = None
+        if forecast:
+            dates = pd.date_range(data.index.max(), periods=MAX_STEPS + 1, freq='M')[1:]
+            values = forecast_values('hpi', region, hpi_series(get_panel('hpi'), region), MAX_STEPS).to_numpy()
+            bands = forecast_bands('hpi', region, MAX_STEPS)
+            lines.append(('Forecast', dates, values, {'color': 'red', 'dash': True, 'width': 2}))
+
+        def draw():
+            fig = Figure(figsize=(14, 8))
+            ax = fig.subplots()
+            ax.plot(data.index, data.values, label=f'{region} HPI', color='blue', linewidth=2)
+            if forecast:
+                if bands is not None:
+                    plot_fan(ax, dates, bands, color='red')
+                ax.plot(dates, values, label='Forecast', color='red', linestyle='--', linewidth=2)
+            ax.legend(loc='upper left')
+            return fig
+        return lines, (dates, bands) if bands is not None else None, draw, 100
+
+    regions = list(hpi_df.select_dtypes('number').columns)
+    charts = {
+        'oil.product_trend': [oil_trend(province) for province in oil_df['Province'].unique()],
+        'wage.product_trend': [wage_trend()],
+        'housing.plot_hpi': [hpi_trend(region) for region in regions],
+        'housing.plot_hpi_forecast': [hpi_trend(region, forecast=True) for region in regions],
+    }
+
+    results = {}
+    for name, states in charts.items():
+        png_bytes, png_ms, spec_bytes, spec_ms, zoom_bytes, zoom_ms, points = [], [], [], [], [], [], []
+        for lines, bands, draw, dpi in states:
+            seconds, png = timed(lambda: encode_figure(draw(), dpi=dpi), repeat=args.repeat)
+            png_bytes.append(len(png))
+            png_ms.append(seconds * 1000)
+
+            seconds, spec = timed(lambda: json.dumps(chart_spec(lines, bands=bands)), repeat=args.repeat)
+            spec_bytes.append(len(spec))
+            spec_ms.append(seconds * 1000)
+            points.append(sum(len(values) for _, _, values, _ in lines))
+
+            # Zooming into the last five years of history fetches that slice at full resolution
+            end = pd.DatetimeIndex(lines[0][1]).max()
+            window = (end - pd.DateOffset(years=5), end)
+            seconds, spec = timed(lambda: json.dumps(chart_spec(lines, bands=bands, window=window)),
+                                  repeat=args.repeat)
+            zoom_bytes.append(len(spec))
+            zoom_ms.append(seconds * 1000)
+
+        results[name] = {
+            'states': len(states),
+            'raw_points': int(np.median(points)),
+            'png_kb': round(np.median(png_bytes) / 1024, 1),
+            'spec_kb': round(np.median(spec_bytes) / 1024, 1),
+            'zoom_spec_kb': round(np.median(zoom_bytes) / 1024, 1),
+            'payload_reduction': round(np.median(png_bytes) / np.median(spec_bytes), 1),
+            'png_render_ms': round(float(np.median(png_ms)), 2),
+            'spec_build_ms': round(float(np.median(spec_ms)), 2),
+            'zoom_build_ms': round(float(np.median(zoom_ms)), 2),
+            'render_speedup': round(float(np.median(png_ms) / np.median(spec_ms)), 1),
+        }
+    results['settings'] = {'chart_points': CHART_POINTS, 'png_dpi': CHART_DPI}
+    return results
+
+
+# Function to compare the prediction page's per-request masks with the precomputed projections
+def bench_housing(args):
+    import itertools
+    import os
+    import tempfile
+
+    import pandas as pd
+
+    import housing_projections
+    from data_store import DATASETS, get_dataset
+    from panels import get_panel
+
+    hpi_panel = get_panel('hpi')
+    if os.path.exists(DATASETS['housing'][0]):
+        housing_df = get_dataset('housing')
+    else:
+        # Synthetic listings in the HPI regions' cities when housing.csv is not available
+        rng = np.random.default_rng(0)
+        cities = sorted({column.split(',')[0] for column in hpi_panel.regions})
+        rows = args.scale * 10_000
+        housing_df = pd.DataFrame({'Province': rng.choice(['Ontario', 'Quebec', 'British Columbia'], rows),
+                                   'City': rng.choice(cities, rows),
+                                   'Number_Beds': rng.integers(1, 6, rows),
+                                   'Number_Baths': rng.integers(1, 6, rows),
+                                   'Price': rng.uniform(2e5, 2e6, rows)})
+
+    build_seconds, projections = timed(lambda: housing_projections.build_projections(housing_df, hpi_panel),
+                                       repeat=args.repeat)
+    groups = projections.groups[:200]
+
+    def masks():
+        for province, city, beds, baths in groups:
+            filtered = housing_df[(housing_df['City'] == city) & (housing_df['Number_Beds'] == beds) &
+                                  (housing_df['Number_Baths'] == baths) & (housing_df['Province'] == province)]
+            filtered['Price'].mean()
+
+    def lookups():
+        for (province, city, beds, baths), month in itertools.product(groups, housing_projections.MONTHS):
+            projections.predict(city, beds, baths, province, 2025, month)
+
+    mask_seconds, _ = timed(masks, repeat=args.repeat)
+    lookup_seconds, _ = timed(lookups, repeat=args.repeat)
+    with tempfile.TemporaryDirectory() as tmp:
+        export_seconds, frame = timed(lambda: housing_projections.export_parquet(os.path.join(tmp, 'p.parquet'),
+                                                                                 projections), repeat=1)
+    return {'housing': {
+        'listings': len(housing_df),
+        'groups': len(projections.groups),
+        'build_s': round(build_seconds, 3),
+        'mask_per_request_ms': round(mask_seconds / len(groups) * 1000, 3),
+        'lookup_per_request_ms': round(lookup_seconds / (len(groups) * 12) * 1000, 4),
+        'projections': len(frame),
+        'parquet_export_s': round(export_seconds, 3),
+    }}
+
+
+# Modules timed by the import benchmark, and the heavy dependencies it reports them loading
+IMPORT_MODULES = ['instrumentation', 'data_store', 'forecasting', 'chart_cache', 'rollups',
+                  'oil', 'wage', 'housing', 'food', 'api']
+HEAVY_MODULES = ['numpy', 'pandas', 'matplotlib', 'matplotlib.pyplot', 'statsmodels', 'scipy', 'pyarrow']
+
+# Renders the Home screen in a fresh interpreter and reports how long it took
+FIRST_PAINT_SCRIPT = """
+import json, sys, time
+heavy = {heavy!r}
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file('app.py', default_timeout=120)
+before = [name for name in heavy if name in sys.modules]
+ready = time.perf_counter()
+at.run()
+print(json.dumps({{'harness_ms': (ready - start) * 1000, 'first_paint_ms': (time.perf_counter() - ready) * 1000,
+                  'error': at.exception[0].value if at.exception else None,
+                  'loaded': [name for name in heavy if name in sys.modules and name not in before]}}))
+"""
+
+
+# Function to time importing one module in a fresh interpreter (python -X importtime)
+def import_profile(module):
+    import subprocess
+    import sys
+
+    code = f"import sys; import {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if proc.returncode:
+        return {'error': proc.stderr.strip().splitlines()[-1]}
+
+    # Lines read "import time: self [us] | cumulative | name", with nested imports indented
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, total, name = line.split('|')
+        cumulative.setdefault(name.strip(), int(total))
+    loaded = [name for name in proc.stdout.strip().split(',') if name]
+    return {'import_ms': round(cumulative.get(module, 0) / 1000, 1),
+            'loads': ','.join(loaded) or '-',
+            **{f'{name}_ms': round(cumulative[name] / 1000, 1) for name in loaded if name in cumulative}}
+
+
+# Function to report import time per module and the Home screen's time to first paint
+def bench_imports(args):
+    import subprocess
+    import sys
+
+    results = {module: import_profile(module) for module in IMPORT_MODULES}
+    paints = []
+    for _ in range(args.repeat):
+        proc = subprocess.run([sys.executable, '-c', FIRST_PAINT_SCRIPT.format(heavy=HEAVY_MODULES)],
+                              capture_output=True, text=True)
+        paints.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    results['home_first_paint'] = {
+        'first_paint_ms': round(min(paint['first_paint_ms'] for paint in paints), 1),
+        'harness_ms': round(min(paint['harness_ms'] for paint in paints), 1),
+        'loads': ','.join(paints[-1]['loaded']) or '-',
+        'error': paints[-1]['error'],
+    }
+    return results
+
+
+# Function to compare the per-request reshaping the pages did on the cleaned frames with panel lookups
+def bench_panels(args):
+    import pandas as pd
+
+    import panels
+    from data_store import get_dataset
+
+    oil_df, wage_df, hpi_df = get_dataset('oil'), get_dataset('wage'), get_dataset('hpi')
+    built = {}
+    for name in panels.BUILDERS:
+        seconds, built[name] = timed(lambda: panels.BUILDERS[name](get_dataset(name)), repeat=args.repeat)
+        built[name].seconds = seconds
+    oil, wage, hpi = built['oil'], built['wage'], built['hpi']
+    province, region, city = 'Ontario', 'Ontario', 'Toronto'
+
+    # What each page did per rerun before, next to what it does now
+    def oil_forecast_series():
+        rows = oil_df[oil_df['Province'] == province].sort_values(by='Date')
+        rows['Value'] = rows['Value'].ffill().bfill()
+        return rows.set_index('Date')['Value']
+
+    def oil_trend():
+        rows = oil_df[(oil_df['Date'].dt.year >= 1990) & (oil_df['Date'].dt.year <= 2024)]
+        return rows[rows['Province'] == province]
+
+    def wage_trend():
+        rows = wage_df[(wage_df['Date'].dt.year >= 1990) & (wage_df['Date'].dt.year <= 2024)]
+        return rows.groupby('Date')['Value'].mean()
+
+    def hpi_forecast_series():
+        columns = [column for column in hpi_df.columns if city in column]
+        return hpi_df[columns[0]]
+
+    # Weekly earnings next to the HPI of the same province and month
+    def affordability_merge():
+        hpi_long = hpi_df.select_dtypes('number').resample('MS').mean().rename_axis('Date').reset_index()
+        hpi_long = hpi_long.melt(id_vars='Date', var_name='Geography', value_name='HPI')
+        return wage_df.merge(hpi_long, on=['Geography', 'Date'])
+
+    def affordability_align():
+        left, right = wage.align(hpi)
+        regions = [name for name in left.regions if name in right]
+        return left.take(regions).values / right.take(regions).values
+
+    cases = {
+        'oil.price_forecasting': (oil_forecast_series, lambda: oil.filled(province)),
+        'oil.product_trend': (oil_trend, lambda: oil.series(province, '1990-01', '2024-12')),
+        'wage.product_trend': (wage_trend, lambda: wage.window('1990-01', '2024-12').mean()),
+        'housing.forecast_hpi': (hpi_forecast_series, lambda: hpi.filled(hpi.match(city)[0])),
+        'housing.plot_hpi': (lambda: hpi_df[f'{city}, Ontario'].resample('M').mean(),
+                             lambda: hpi.resample('M')[f'{city}, Ontario']),
+        'wage_vs_hpi': (affordability_merge, affordability_align),
+    }
+    results = {}
+    for name, (before, after) in cases.items():
+        # Timed over 100 calls, as a page makes one per rerun
+        frame_seconds, _ = timed(lambda: [before() for _ in range(100)], repeat=args.repeat)
+        panel_seconds, _ = timed(lambda: [after() for _ in range(100)], repeat=args.repeat)
+        results[name] = {'frame_us': round(frame_seconds * 1e4, 1), 'panel_us': round(panel_seconds * 1e4, 1),
+                         'speedup': round(frame_seconds / panel_seconds, 1)}
+    results['panels'] = {f'{name}_build_ms': round(panel.seconds * 1000, 2) for name, panel in built.items()}
+    results['panels'].update({f'{name}_kb': round(panel.nbytes() / 1024, 1) for name, panel in built.items()})
+    results['panels']['frames_kb'] = round(sum(int(df.memory_usage(index=True, deep=True).sum())
+                                               for df in (oil_df, wage_df, hpi_df)) / 1024, 1)
+    return results
+
+
+# Function to compare on-demand fits on the script threads with fits in the forecast worker pool.
+# `--sessions` threads each ask for their own series at once; a probe thread standing in for another
+# session's script thread measures how late it is woken while they wait.
+def bench_pool(args):
+    import os
+    import pickle
+    import shutil
+    import tempfile
+    import threading
+
+    # No precomputed forecasts and an empty fit cache, so every request fits
+    cache_dir = tempfile.mkdtemp(prefix='forecast-cache-')
+    os.environ['DASHBOARD_FORECAST_CACHE'] = cache_dir
+    os.environ['DASHBOARD_FORECAST_TABLE'] = os.path.join(cache_dir, 'missing.csv')
+
+    from data_store import dataset_version
+    from forecast_cache import forecast_cache
+    from forecast_pool import forecast_pool
+    from forecasting import champion_model, fit_values, series_of
+    from panels import get_panel
+
+    requests = []
+    for dataset in ('oil', 'wage', 'hpi'):
+        for series_key, prepare in series_of(dataset, get_panel(dataset)):
+            try:
+                requests.append((dataset, series_key, prepare()))
+            except ValueError:
+                continue
+    # The last series is kept back for the identical-requests run
+    sessions = [requests[:-1][i::args.sessions] for i in range(args.sessions)]
+
+    def in_process(dataset, series_key, y):
+        return fit_values(champion_model(dataset, series_key), series_key, y, 12, dataset_version(dataset))
+
+    def pooled(dataset, series_key, y):
+        return forecast_pool.forecast(dataset, series_key, y, 12).result()
+
+    # Runs every session's requests on its own thread -> (seconds, worst and p99 probe lateness in ms)
+    def run(fit):
+        stop, lateness = threading.Event(), []
+
+        def probe():
+            while not stop.is_set():
+                start = time.perf_counter()
+                time.sleep(0.001)
+                lateness.append((time.perf_counter() - start - 0.001) * 1000)
+
+        def session(jobs):
+            for job in jobs:
+                fit(*job)
+
+        prober = threading.Thread(target=probe)
+        prober.start()
+        threads = [threading.Thread(target=session, args=(jobs,)) for jobs in sessions]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+        stop.set()
+        prober.join()
+        return seconds, max(lateness), float(np.percentile(lateness, 99))
+
+    def fresh_cache():
+        forecast_cache.clear(disk=True)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    results = {}
+    try:
+        fresh_cache()
+        seconds, worst, p99 = run(in_process)
+        results['script_thread'] = {'seconds': round(seconds, 2), 'probe_max_ms': round(worst, 1),
+                                    'probe_p99_ms': round(p99, 1)}
+
+        # Workers and shared blocks are ready before timing, as they are once a page has loaded
+        forecast_pool._pool()
+        for dataset in ('oil', 'wage', 'hpi'):
+            forecast_pool.shared(dataset, dataset_version(dataset))
+        fresh_cache()
+        seconds, worst, p99 = run(pooled)
+        results['worker_pool'] = {'seconds': round(seconds, 2), 'probe_max_ms': round(worst, 1),
+                                  'probe_p99_ms': round(p99, 1), 'workers': forecast_pool.workers}
+        results['worker_pool']['probe_max_reduction'] = round(results['script_thread']['probe_max_ms'] / worst, 1)
+
+        # Every session asks for one series no one has fitted yet: the pool fits it once
+        before = forecast_pool.stats()
+        dataset, series_key, y = requests[-1]
+        futures = [forecast_pool.forecast(dataset, series_key, y, 6 + i) for i in range(args.sessions)]
+        for future in futures:
+            future.result()
+        after = forecast_pool.stats()
+        results['identical_requests'] = {'requests': args.sessions, 'fits': after['misses'] - before['misses'],
+                                         'shared': after['deduped'] - before['deduped']}
+
+        # What a job costs to send: the series pickled with it, or its rows of the shared block
+        block = forecast_pool.shared(dataset, dataset_version(dataset))
+        job = (block.name, block.length, *block.rows[series_key], champion_model(dataset, series_key), series_key,
+               12, dataset_version(dataset))
+        results['job_payload'] = {'series_bytes': len(pickle.dumps(y)), 'shared_job_bytes': len(pickle.dumps(job)),
+                                  'shared_block_kb': round(forecast_pool.stats()['shared_bytes'] / 1024, 1)}
+        results['settings'] = {'sessions': args.sessions, 'series': len(requests)}
+    finally:
+        forecast_pool.shutdown()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return results
+
+
+# Function to measure per-page latency, CPU, allocations and peak RSS through AppTest
+def bench_pages(args):
+    import loadtest
+
+    return loadtest.run_suite(interactions=args.interactions, sessions=())['pages']
+
+
+BENCHMARKS = {
+    'holtwinters': bench_holtwinters,
+    'intervals': bench_intervals,
+    'rollup': bench_rollup,
+    'search': bench_search,
+    'basket': bench_basket,
+    'mining': bench_mining,
+    'recommendations': bench_recommendations,
+    'housing': bench_housing,
+    'food': bench_food,
+    'charts': bench_charts,
+    'imports': bench_imports,
+    'pages': bench_pages,
+    'pool': bench_pool,
+    'panels': bench_panels,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Dashboard benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scale', type=int, default=10,
+                        help='basket: catalogue size multiple; housing: 10k synthetic listings each; '
+                             'food: geographies in the synthetic table')
+    parser.add_argument('--items', type=int, default=50, help='basket: items per shopping list')
+    parser.add_argument('--lists', type=int, default=20, help='basket: shopping lists to plan')
+    parser.add_argument('--transactions', type=int, default=1_000_000, help='mining: synthetic transactions')
+    parser.add_argument('--min-support', type=float, default=0.001, help='mining: minimum support')
+    parser.add_argument('--memory-mb', type=int, default=256, help='mining: memory budget')
+    parser.add_argument('--workers', type=int, default=None, help='mining: worker processes')
+    parser.add_argument('--interactions', type=int, default=30, help='pages: widget changes per page')
+    parser.add_argument('--sessions', type=int, default=8, help='pool: concurrent sessions asking for forecasts')
+    parser.add_argument('--paths', type=int, default=2000, help='intervals: simulated paths per series')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    results = BENCHMARKS[args.benchmark](args)
+    for name, numbers in results.items():
+        print(name)
+        for key, value in numbers.items():
+            print(f'  {key}: {value}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({args.benchmark: results}, f, indent=2)
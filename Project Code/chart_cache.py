@@ -0,0 +1,126 @@
+# chart_cache.py
+# Cache of rendered charts.
+# Most reruns ask for a chart somebody has already seen, so the encoded PNG/SVG bytes are
+# kept per (page, widget state, dataset version) and matplotlib only runs on a miss.
+# Figures are closed as soon as they are encoded so they never pile up in pyplot.
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from io import BytesIO
+
+import matplotlib
+# The backend is chosen once per process, before any figure exists
+matplotlib.use('Agg')
+import numpy as np
+
+from instrumentation import span
+
+# Total size of the encoded charts kept in memory
+MAX_CHART_BYTES = int(os.environ.get('DASHBOARD_CHART_CACHE_MB', '64')) * 1024 * 1024
+
+# Matches the resolution st.pyplot renders at; charts saved with plain savefig use 100
+CHART_DPI = 200
+
+
+# Function to turn widget values into a hashable, order-independent key
+def normalize_state(state):
+    def normalize(value):
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, (list, tuple)):
+            return tuple(normalize(v) for v in value)
+        return value
+    return tuple(sorted((str(key), normalize(value)) for key, value in state.items()))
+
+
+# Function to encode a figure and close it
+def encode_figure(fig, fmt='png', dpi=CHART_DPI):
+    buf = BytesIO()
+    try:
+        with span('render', f'savefig {fmt}'):
+            fig.savefig(buf, format=fmt, bbox_inches='tight', dpi=dpi)
+    finally:
+        # Figures made through pyplot stay registered until closed; plain Figures are not,
+        # so pyplot (and its backend setup) is never imported just to close one
+        pyplot = sys.modules.get('matplotlib.pyplot')
+        if pyplot is not None:
+            pyplot.close(fig)
+    return buf.getvalue()
+
+
+# Prediction intervals of a fan chart, widest first: (lower band, upper band, label, opacity)
+FAN_INTERVALS = [('lower', 'upper', '95% interval', 0.15), ('p10', 'p90', '80% interval', 0.25),
+                 ('p25', 'p75', '50% interval', 0.35)]
+
+
+# Function to shade a forecast's prediction intervals (the band columns from forecasting.forecast_bands)
+def plot_fan(ax, dates, bands, color='tab:orange'):
+    for low, high, label, alpha in FAN_INTERVALS:
+        if low in bands and high in bands:
+            ax.fill_between(dates, bands[low], bands[high], color=color, alpha=alpha, linewidth=0, label=label)
+
+
+class ChartCache:
+    def __init__(self, max_bytes=MAX_CHART_BYTES):
+        self.max_bytes = max_bytes
+        self._charts = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Function to return the encoded chart, calling `draw()` (which returns a Figure) on a miss
+    def render(self, page, state, version, draw, fmt='png', dpi=CHART_DPI):
+        key = (page, normalize_state(state), version, fmt, dpi)
+        with self._lock:
+            data = self._charts.get(key)
+            if data is not None:
+                self._charts.move_to_end(key)
+                self.hits += 1
+                return data
+
+        with span('render', page):
+            data = encode_figure(draw(), fmt, dpi)
+        with self._lock:
+            self.misses += 1
+            if key not in self._charts and len(data) <= self.max_bytes:
+                self._charts[key] = data
+                self._bytes += len(data)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._charts.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self.evictions += 1
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._charts.clear()
+            self._bytes = 0
+
+    # Function to report cache counters and memory use
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'charts': len(self._charts),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+# Shared cache used by every dashboard in this process
+chart_cache = ChartCache()
+
+
+# Function to render a chart through the shared cache
+def cached_chart(page, state, version, draw, fmt='png', dpi=CHART_DPI):
+    return chart_cache.render(page, state, version, draw, fmt, dpi)
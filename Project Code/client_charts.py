@@ -0,0 +1,184 @@
+# client_charts.py
+# Line charts drawn in the browser from downsampled series (Vega-Lite through st.vega_lite_chart).
+# The trend charts used to rasterize every raw point with matplotlib and send a fresh PNG on
+# each widget change. Here each series is cut to the visible date range and downsampled with
+# Largest-Triangle-Three-Buckets (LTTB) to CHART_POINTS points, which keeps the peaks and
+# troughs a line would show at the chart's width, and the points travel inline in the spec
+# as CSV text. Dragging across a chart selects a date range; the rerun that follows sends
+# that range again with the full point budget, so zooming in shows the detail the overview
+# dropped. "Reset zoom" goes back to the whole series.
+import hashlib
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from chart_cache import FAN_INTERVALS
+from instrumentation import span
+
+# Points sent per series: about one per two pixels of the ~700px main column
+CHART_POINTS = int(os.environ.get('DASHBOARD_CHART_POINTS', '350'))
+CHART_HEIGHT = 400
+# Line colours, in the order matplotlib would have picked them
+COLORS = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#8c564b']
+
+
+# Function to pick the indices LTTB keeps from a series of n points -> (points,) sorted indices.
+# The first and last points are kept; every bucket in between keeps the point forming the
+# largest triangle with the point kept before it and the mean of the next bucket.
+def lttb(x, y, points):
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # Bucket i covers [edges[i], edges[i + 1]); the last bucket's successor is the final point
+    every = (n - 2) / (points - 2)
+    edges = np.floor(np.arange(points - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+    # Mean of every bucket's successor, computed at once; only the choice within a bucket is sequential
+    sizes = np.diff(np.append(edges, n))
+    next_x = (np.add.reduceat(x, edges) / sizes)[1:]
+    next_y = (np.add.reduceat(y, edges) / sizes)[1:]
+
+    keep = np.empty(points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        if end - start == 1:
+            a = start
+        else:
+            area = np.abs((x[a] - next_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y[i] - y[a]))
+            a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+# Function to cut a series to a date window and downsample it -> (dates, values).
+# Missing values are dropped; `window` is a (start, end) pair of timestamps or None.
+def downsample(dates, values, points=CHART_POINTS, window=None):
+    dates = pd.DatetimeIndex(dates)
+    values = np.asarray(values, dtype=float)
+    mask = np.isfinite(values)
+    if window is not None:
+        mask &= (dates >= window[0]) & (dates <= window[1])
+    dates, values = dates[mask], values[mask]
+    keep = lttb(dates.asi8, values, points)
+    return dates[keep], values[keep]
+
+
+# Function to pick the power of ten the chart's values are rounded to: a thousandth of their range,
+# under half a pixel on a CHART_HEIGHT chart
+def value_step(value_range):
+    return 10.0 ** np.floor(np.log10(value_range / 1000)) if value_range > 0 else 1e-6
+
+
+# Function to encode a layer's columns as inline CSV of differences, far smaller than JSON records.
+# Dates are counted in whole months (or days, or seconds) since 1970 and values in `step`s; each row
+# holds the change from the row before, and a running sum in the browser restores them, so a smooth
+# monthly series costs a few characters a row. The restored dates land in the 'date' field.
+def layer_data(dates, step, **columns):
+    months = (dates.year - 1970) * 12 + dates.month - 1
+    if (dates == dates.normalize()).all() and (dates.is_month_start.all() or dates.is_month_end.all()):
+        ticks, unit = months, 'month start' if dates.is_month_start.all() else 'month end'
+    else:
+        seconds = dates.asi8 // 10 ** 9
+        ticks, unit = (seconds // 86400, 'day') if not (seconds % 86400).any() else (seconds, 'second')
+    counts = {'t': np.asarray(ticks, dtype=np.int64)}
+    counts.update({name: np.rint(np.asarray(values, dtype=float) / step).astype(np.int64)
+                   for name, values in columns.items()})
+    rows = [np.diff(values, prepend=0).astype(str) for values in counts.values()]
+    text = '\n'.join([','.join(f'd{name}' for name in counts)] + [','.join(row) for row in zip(*rows)])
+
+    # Dividing by a power of ten rounds to the nearest decimal, multiplying by 0.01 does not
+    scale = f'/ {1 / step:.0f}' if step < 1 else f'* {step:.0f}'
+    date = {'month start': 'utc(1970, datum.t, 1)', 'month end': 'utc(1970, datum.t + 1, 0)', 'day': 'datum.t * 86400000', 'second': 'datum.t * 1000'}[unit]
+    # Vega reads the integer columns as numbers and sums a window over every row up to the current one
+    return {'data': {'values': text, 'format': {'type': 'csv'}},
+            'transform': [{'window': [{'op': 'sum', 'field': f'd{name}', 'as': name} for name in counts]},
+                          {'calculate': date, 'as': 'date'}]
+                         + [{'calculate': f'datum.{name} {scale}', 'as': name} for name in columns if step != 1]}
+
+
+# Function to build the Vega-Lite spec of a line chart.
+# `lines` are (label, dates, values, style) tuples; style may set 'color', 'dash' and 'width'.
+# `bands` are (dates, band frame) from forecasting.forecast_bands, shaded like plot_fan.
+def chart_spec(lines, title='', y_title='', bands=None, markers=False, points=CHART_POINTS, window=None):
+    labels = [label for label, _, _, _ in lines]
+    colors = [style.get('color') or COLORS[i % len(COLORS)] for i, (_, _, _, style) in enumerate(lines)]
+    color_scale = {'domain': labels, 'range': colors}
+    # Every layer inherits the date axis
+    x = {'field': 'date', 'type': 'temporal', 'title': 'Date'}
+    if window is not None:
+        x['scale'] = {'domain': [pd.Timestamp(bound).isoformat() for bound in window]}
+
+    series = [(label, *downsample(dates, values, points, window), style) for label, dates, values, style in lines]
+    shown = np.concatenate([values for _, _, values, _ in series] + [np.zeros(0)])
+    step = value_step(float(np.ptp(shown)) if len(shown) else 0.0)
+
+    layers = []
+    if bands is not None:
+        band_dates, frame = bands
+        band_dates = pd.DatetimeIndex(band_dates)
+        in_window = np.ones(len(band_dates), dtype=bool)
+        if window is not None:
+            in_window = (band_dates >= window[0]) & (band_dates <= window[1])
+        intervals = [(low, high, alpha) for low, high, _, alpha in FAN_INTERVALS if low in frame and high in frame]
+        columns = {name: np.asarray(frame[name], dtype=float) for low, high, _ in intervals for name in (low, high)}
+        mask = in_window
+        for values in columns.values():
+            mask = mask & np.isfinite(values)
+        # One data set for every band, shaded from the widest interval in
+        if intervals and mask.any():
+            data = layer_data(band_dates[mask], step, **{name: values[mask] for name, values in columns.items()})
+            layers.append({**data, 'layer': [{'mark': {'type': 'area', 'opacity': alpha, 'color': colors[-1]},
+                                              'encoding': {'y': {'field': low, 'type': 'quantitative'},
+                                                           'y2': {'field': high}}}
+                                             for low, high, alpha in intervals]})
+
+    for i, (label, dates, values, style) in enumerate(series):
+        mark = {'type': 'line', 'strokeWidth': style.get('width', 1.5), 'point': markers}
+        if style.get('dash'):
+            mark['strokeDash'] = [6, 4]
+        layer = {**layer_data(dates, step, value=values), 'mark': mark,
+                 'encoding': {'y': {'field': 'value', 'type': 'quantitative', 'title': y_title, 'scale': {'zero': False}},
+                              'color': {'datum': label, 'scale': color_scale, 'legend': {'title': None}}}}
+        # Dragging across the first line selects the range to zoom into
+        if i == 0:
+            layer['params'] = [{'name': 'zoom', 'select': {'type': 'interval', 'encodings': ['x']}}]
+        layers.append(layer)
+    return {'title': title, 'height': CHART_HEIGHT, 'encoding': {'x': x}, 'layer': layers}
+
+
+# Function to remember the date range selected on a chart (selection bounds are epoch milliseconds)
+def _store_zoom(chart_key, window_key):
+    selection = st.session_state[chart_key]['selection'].get('zoom') or {}
+    bounds = selection.get('date')
+    if bounds:
+        st.session_state[window_key] = tuple(pd.Timestamp(int(bound), unit='ms') for bound in bounds)
+
+
+# Function to name what a chart shows (its title and line labels), so a zoom stays with the series it was made on
+def series_id(lines, title=''):
+    text = '\x1f'.join([title] + [str(label) for label, *_ in lines])
+    return hashlib.sha1(text.encode()).hexdigest()[:12]
+
+
+# Function to draw a line chart in the browser, zoomed to the range last selected on it.
+# Each series shown under `key` keeps its own zoom: another province or product opens unzoomed.
+def line_chart(key, lines, title='', y_title='', bands=None, markers=False, points=CHART_POINTS):
+    state_key = f'{key}/{series_id(lines, title)}'
+    window_key = f'{state_key}/window'
+    window = st.session_state.get(window_key)
+    with span('render', f'{key} spec'):
+        spec = chart_spec(lines, title, y_title, bands, markers, points, window)
+    # A new widget per window, so the selection that asked for it does not stay drawn
+    chart_key = f'{state_key}/chart/{window}'
+    st.vega_lite_chart(spec, key=chart_key, on_select=partial(_store_zoom, chart_key, window_key),
+                       selection_mode='zoom', use_container_width=True)
+    if window is not None:
+        st.button("Reset zoom", key=f'{state_key}/reset', on_click=st.session_state.pop, args=(window_key, None))
@@ -0,0 +1,432 @@
+# data_store.py
+# Process-wide registry of the cleaned DataFrames used by the dashboards.
+# Every Streamlit rerun used to re-read and re-clean the CSV files; the registry
+# keeps one cleaned copy per process and only reloads a dataset when its source
+# file changes on disk.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+import snapshot
+from instrumentation import span
+
+# Total memory the registry may hold before evicting the least recently used dataset
+MAX_CACHE_BYTES = int(os.environ.get('DASHBOARD_CACHE_MB', '512')) * 1024 * 1024
+
+
+# Function to load and clean the oil price data
+def read_oil(path):
+    with span('parse', path):
+        df = pd.read_csv(path)
+    with span('clean', 'oil'):
+        return clean_oil(df)
+
+
+# Function to clean raw oil price rows (also used on appended rows only)
+def clean_oil(df):
+    # Convert Date column to datetime
+    df['Date'] = pd.to_datetime(df['Date'])
+    # Convert non-numeric 'Value' entries to NaN and then to numeric
+    df['Value'] = pd.to_numeric(df['Value'], errors='coerce')
+    return df
+
+
+# Function to load and clean the weekly earnings data
+def read_wage(path):
+    with span('parse', path):
+        df = pd.read_csv(path)
+    with span('clean', 'wage'):
+        return clean_wage(df)
+
+
+# Function to clean raw weekly earnings rows (also used on appended rows only)
+def clean_wage(df):
+    df['Date'] = pd.to_datetime(df['Date'], format='%m/%d/%Y')
+
+    df = df[df['Geography'] != 'Canada']
+    df['Value'] = df['Value'].str.replace(',', '')  # Remove commas
+    df['Value'] = df['Value'].str.extract(r'(\d+)', expand=False)  # Extract only numeric parts
+    df['Value'] = df['Value'].astype(float)  # Convert to float
+    df = df.dropna(subset=['Date', 'Value'])
+    return df
+
+
+# Function to load and clean the housing price index data
+def read_hpi(path):
+    # Load the data, ignoring the first unnamed column if present
+    with span('parse', path):
+        hpi_df = pd.read_csv(path, encoding='latin1', index_col=0)
+    with span('clean', 'hpi'):
+        return clean_hpi(hpi_df)
+
+
+# Function to clean the housing price index table
+def clean_hpi(hpi_df):
+    # Remove leading and trailing spaces from column names
+    hpi_df.columns = hpi_df.columns.str.strip()
+
+    # Convert 'Month-year' to datetime and set as index
+    hpi_df['Month-year'] = pd.to_datetime(hpi_df['Month-year'], format='%b-%y')
+    hpi_df.set_index('Month-year', inplace=True)
+
+    # Filter out rows where the year is less than 1995
+    hpi_df = hpi_df[hpi_df.index.year >= 1995]
+
+    # Drop the unnecessary columns
+    hpi_df = hpi_df.drop(columns=['Type', 'Canada', 'year', 'month'])
+
+    # Sort data by date
+    hpi_df = hpi_df.sort_index()
+
+    # Handle missing data
+    hpi_df = hpi_df.ffill().bfill()
+
+    return hpi_df
+
+
+# Function to load and clean the housing listings data
+def read_housing(path):
+    with span('parse', path):
+        try:
+            housing_df = pd.read_csv(path, encoding='utf-8')
+        except UnicodeDecodeError:
+            try:
+                housing_df = pd.read_csv(path, encoding='latin1')
+            except UnicodeDecodeError:
+                housing_df = pd.read_csv(path, encoding='ISO-8859-1')
+    with span('clean', 'housing'):
+        return clean_housing(housing_df)
+
+
+# Function to clean the housing listings
+def clean_housing(housing_df):
+    # Handle Price column conversion
+    if housing_df['Price'].dtype == 'object':
+        # Remove commas and convert to numeric
+        housing_df['Price'] = pd.to_numeric(housing_df['Price'].str.replace(',', ''), errors='coerce')
+    else:
+        # Ensure Price is numeric
+        housing_df['Price'] = pd.to_numeric(housing_df['Price'], errors='coerce')
+
+    # Fill or drop missing values as needed
+    housing_df['Price'] = housing_df['Price'].fillna(housing_df['Price'].mean())
+
+    return housing_df
+
+
+# Columns kept from the StatCan food price table; the other eleven repeat what these say
+FOOD_COLUMNS = ['REF_DATE', 'GEO', 'Products', 'VALUE']
+# Rows parsed at a time, so parsing needs the same memory for any size of table
+FOOD_CHUNK_ROWS = int(os.environ.get('DASHBOARD_FOOD_CHUNK_ROWS', '100000'))
+
+
+# Function to stream the StatCan food price table as compact chunks.
+# The table is read FOOD_CHUNK_ROWS rows at a time, keeping only FOOD_COLUMNS, and each chunk
+# is reduced to integer codes and float32 values before the next is read. `categories` maps
+# REF_DATE, GEO and Products values to the codes shared by every chunk, and grows as new
+# values appear. Yields {'REF_DATE', 'GEO', 'Products': int16 codes, 'VALUE': float32}.
+def iter_food_chunks(path, categories, chunk_rows=None):
+    for col in ('REF_DATE', 'GEO', 'Products'):
+        categories.setdefault(col, {})
+    with span('parse', path):
+        # StatCan leaves VALUE empty or marks it '..'/'x'/'F' when a figure is unavailable
+        chunks = pd.read_csv(path, encoding='utf-8-sig', usecols=FOOD_COLUMNS, chunksize=chunk_rows or FOOD_CHUNK_ROWS,
+                             dtype={'REF_DATE': 'category', 'GEO': 'category', 'Products': 'category',
+                                    'VALUE': 'float32'}, na_values=['..', '...', 'x', 'F'])
+        for chunk in chunks:
+            codes = {}
+            for col, known in categories.items():
+                # Chunk-local category codes, translated into the shared codes
+                column = chunk[col].cat
+                mapping = np.array([known.setdefault(name, len(known)) for name in column.categories],
+                                   dtype=np.int32)
+                codes[col] = mapping[column.codes].astype(np.int16 if len(known) < 2 ** 15 else np.int32)
+            codes['VALUE'] = chunk['VALUE'].to_numpy(dtype=np.float32)
+            yield codes
+
+
+# Function to parse the REF_DATE values ("1995-01") of a category map into month starts
+def food_months(categories):
+    return pd.to_datetime(list(categories['REF_DATE']), format='%Y-%m').to_numpy()
+
+
+# Function to load the StatCan food price table as a compact long frame.
+# GEO and Products are categoricals and VALUE float32, so a row costs 14 bytes instead
+# of the ~550 bytes of the 15 string columns.
+def read_food_prices(path, chunk_rows=None):
+    categories = {}
+    parts = {'REF_DATE': [], 'GEO': [], 'Products': [], 'VALUE': []}
+    for codes in iter_food_chunks(path, categories, chunk_rows):
+        for col, values in codes.items():
+            parts[col].append(values)
+
+    # Function to join one column's chunks, releasing them as soon as they are joined
+    def join(col, dtype=np.int16):
+        arrays = parts.pop(col)
+        return np.concatenate(arrays) if arrays else np.array([], dtype=dtype)
+
+    with span('clean', 'food_prices'):
+        columns = {'REF_DATE': food_months(categories)[join('REF_DATE')]}
+        for col in ('GEO', 'Products'):
+            columns[col] = pd.Categorical.from_codes(join(col), categories=list(categories[col]))
+        columns['VALUE'] = join('VALUE', np.float32)
+        return pd.DataFrame(columns, copy=False)
+
+
+# Function to load the annual CPI of each product group (arranged_data.csv, one row per group and year)
+def read_cpi(path):
+    with span('parse', path):
+        df = pd.read_csv(path, encoding='utf-8-sig')
+    df = df.rename(columns={'Products and product groups': 'Group'})
+    df['Year'] = df['Year'].astype(int)
+    df['Value'] = pd.to_numeric(df['Value'], errors='coerce')
+    return df
+
+
+# Function to load a grocery store price list, parsing "$x.xx" prices into floats
+def read_store_prices(path):
+    with span('parse', path):
+        df = pd.read_csv(path, dtype={'Name': str, 'Price': str})
+    df['Price'] = pd.to_numeric(df['Price'].str.replace(r'[$,]', '', regex=True).str.strip(),
+                                errors='coerce')
+    return df
+
+
+# Grocery stores with a Name,Price list in <store>.csv
+STORES = ['Atlantic_Superstore', 'Chalo', 'Dominion', 'Farmboy', 'Independent_Grocery',
+          'Loblaws', 'Longos', 'Maxi', 'Nofrills', 'Provigo', 'Real_Canadian_Superstore',
+          'Sobeys', 'Walmart', 'Wholesale_Club', 'Zehrs']
+
+# Source file and cleaning function for every dataset the dashboards use
+DATASETS = {
+    'oil': ('Oil.csv', read_oil),
+    'wage': ('Wage.csv', read_wage),
+    'hpi': ('hpi.csv', read_hpi),
+    'housing': ('housing.csv', read_housing),
+    'food_prices': ('Canadian_Food_Prices_Historical.csv', read_food_prices),
+    'cpi': ('arranged_data.csv', read_cpi),
+}
+DATASETS.update({f'store_{store}': (f'{store}.csv', read_store_prices) for store in STORES})
+
+# Datasets whose cleaning is row-by-row, so rows appended to the CSV can be cleaned on their own
+APPENDABLE = {
+    'oil': clean_oil,
+    'wage': clean_wage,
+}
+
+
+# Function to hash the contents of a source file
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+# Function to check whether a file only grew by appended rows since `size` bytes were read.
+# Returns (new content hash, appended bytes) or None when earlier content changed.
+def appended_bytes(path, size, version):
+    with open(path, 'rb') as f:
+        head = f.read(size)
+        rest = f.read()
+    # The earlier content must be unchanged and must have ended on a complete line
+    digest = hashlib.sha1(head)
+    if len(head) != size or not head.endswith(b'\n') or digest.hexdigest()[:16] != version:
+        return None
+    digest.update(rest)
+    return digest.hexdigest()[:16], rest
+
+
+# Function to parse and clean appended CSV rows using the header of the full file
+def read_appended_rows(path, rest, clean):
+    with open(path, 'rb') as f:
+        header = f.readline()
+    with span('parse', path):
+        raw = pd.read_csv(BytesIO(header + rest), dtype=str)
+    with span('clean', 'appended rows'):
+        return clean(raw)
+
+
+# Function to estimate how much memory a cached DataFrame holds
+def frame_bytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class DatasetRegistry:
+    # Cached entries are kept in least-recently-used order:
+    # name -> {'stat': (mtime_ns, size), 'version': content hash, 'df': frame, 'bytes': size}
+    def __init__(self, datasets=DATASETS, max_bytes=MAX_CACHE_BYTES):
+        self.datasets = datasets
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in datasets}
+        self.hits = 0
+        self.misses = 0
+        self.appends = 0
+        self.evictions = 0
+
+    # Function to return the cleaned DataFrame for a dataset.
+    # The frame is shared between sessions, so callers must not modify it in place.
+    def get(self, name):
+        return self._entry(name)['df']
+
+    # Function to return the content hash of the dataset currently served
+    def version(self, name):
+        return self._entry(name)['version']
+
+    # Function to pick up changes to a dataset's source file and report what was ingested
+    def ingest(self, name):
+        with self._lock:
+            before = self._entries.get(name)
+        if before is not None:
+            previous = before['version']
+        else:
+            # In a fresh process the snapshot records what was ingested last time
+            previous = (snapshot.snapshot_info(name) or {}).get('source_version')
+        entry = self._entry(name)
+        if entry['version'] == previous:
+            return {'mode': 'unchanged', 'rows_added': 0, 'version': entry['version']}
+        return {**entry['ingest'], 'version': entry['version']}
+
+    def _entry(self, name):
+        path, reader = self.datasets[name]
+        stat = os.stat(path)
+        stat = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry['stat'] == stat:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return entry
+
+        # Only one thread loads a given dataset; the others wait and reuse its result
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None and entry['stat'] == stat:
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                    return entry
+
+            if name in APPENDABLE:
+                base = entry if entry is not None else self._snapshot_entry(name)
+                if base is not None and stat[1] > base['stat'][1]:
+                    appended = self._append(name, path, base, stat)
+                    if appended is not None:
+                        return appended
+
+            version = file_hash(path)
+            if entry is not None and entry['version'] == version:
+                # The file was touched but its contents did not change
+                with self._lock:
+                    entry['stat'] = stat
+                    self._entries.move_to_end(name)
+                    self.hits += 1
+                return entry
+
+            # Memory-mapped snapshot when it matches this version, otherwise the CSV
+            df = snapshot.load(name, path, reader, version)
+            entry = {'stat': stat, 'version': version, 'df': df, 'bytes': frame_bytes(df),
+                     'ingest': {'mode': 'reload', 'rows_added': len(df)}}
+            with self._lock:
+                self.misses += 1
+                self._store(name, entry)
+            return entry
+
+    # Function to build a stand-in entry from the last snapshot, so a new process can
+    # still ingest only the rows appended since that snapshot was written
+    def _snapshot_entry(self, name):
+        info = snapshot.snapshot_info(name)
+        if info is None or info.get('source_bytes') is None:
+            return None
+        df = snapshot.read_snapshot(name, info['source_version'])
+        if df is None:
+            return None
+        return {'stat': (None, info['source_bytes']), 'version': info['source_version'], 'df': df}
+
+    # Function to merge rows appended to the source file into the cached frame.
+    # Returns None when the file changed in some other way and needs a full reload.
+    def _append(self, name, path, entry, stat):
+        appended = appended_bytes(path, entry['stat'][1], entry['version'])
+        if appended is None:
+            return None
+        version, rest = appended
+
+        # Only the new rows are parsed and cleaned
+        delta = read_appended_rows(path, rest, APPENDABLE[name])
+        old = entry['df']
+        delta.index = delta.index + (int(old.index.max()) + 1 if len(old) else 0)
+        df = pd.concat([old, delta]) if len(delta) else old
+
+        try:
+            snapshot.write_snapshot(name, df, path, version, source_bytes=stat[1])
+        except OSError:
+            pass
+        new_entry = {'stat': stat, 'version': version, 'df': df, 'bytes': frame_bytes(df),
+                     'ingest': {'mode': 'append', 'rows_added': len(delta)}}
+        with self._lock:
+            self.appends += 1
+            self._store(name, new_entry)
+        return new_entry
+
+    # Function to replace a cached entry (callers hold self._lock).
+    # Readers holding the previous frame keep using it; it is never modified.
+    def _store(self, name, entry):
+        self._entries[name] = entry
+        self._entries.move_to_end(name)
+        self._evict()
+
+    # Function to drop least recently used datasets until the memory cap is respected
+    def _evict(self):
+        while len(self._entries) > 1 and self.total_bytes() > self.max_bytes:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def total_bytes(self):
+        return sum(entry['bytes'] for entry in self._entries.values())
+
+    # Function to drop one dataset, or every dataset, from the cache
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    # Function to report cache counters and the datasets currently held
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'appends': self.appends,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'total_bytes': self.total_bytes(),
+                'max_bytes': self.max_bytes,
+                'datasets': {name: {'version': entry['version'], 'bytes': entry['bytes']}
+                             for name, entry in self._entries.items()},
+            }
+
+
+# Shared registry used by every dashboard in this process
+registry = DatasetRegistry()
+
+
+# Function to fetch a cleaned dataset from the shared registry
+def get_dataset(name):
+    return registry.get(name)
+
+
+# Function to fetch the version (content hash) of a dataset
+def dataset_version(name):
+    return registry.version(name)
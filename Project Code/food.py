@@ -0,0 +1,175 @@
+# food.py
+import streamlit as st
+import pandas as pd
+import numpy as np
+from matplotlib.figure import Figure
+from data_store import dataset_version
+from food_prices import get_food_panel
+from food_inflation import load_cpi_index
+from forecasting import food_series, forecast_bands
+from forecast_pool import forecast_pool, page_forecast
+from chart_cache import cached_chart, encode_figure, plot_fan
+from client_charts import line_chart
+from instrumentation import render_timer, span
+
+# Function to load data
+def load_data():
+    # Dense geography x product x month prices, rebuilt when the source file changes
+    return get_food_panel()
+
+# Function to display the Product Trend page
+def product_trend(panel):
+    st.subheader("Product Trend")
+
+    # Sidebar filters
+    selected_geo = st.sidebar.selectbox("Select Geography", panel.geos)
+    selected_product = st.sidebar.selectbox("Select Product", panel.products)
+
+    series = panel.series(selected_product, selected_geo)
+    if series.empty:
+        st.write(f"No prices are available for {selected_product} in {selected_geo}.")
+        return
+
+    # Drawn in the browser from a downsampled series; zooming in fetches the finer detail
+    line_chart('food/product_trend', [(selected_product, series.index, series.values, {})],
+               title=f"{selected_product} Price Trend ({selected_geo})", y_title="Price ($)")
+
+# Function to display the Price Forecasting page
+def price_forecasting(panel):
+    st.subheader("Price Forecasting")
+
+    # Sidebar filters
+    st.sidebar.header("Forecasting Options")
+
+    # Only products StatCan still prices are forecast
+    products = panel.products[np.isfinite(panel.matrix()[:, -1])]
+    selected_product = st.sidebar.selectbox("Select Product", products)
+
+    # Dropdown for selecting future date
+    future_year = st.sidebar.selectbox("Select Year (2024-2027)", [2024, 2025, 2026, 2027])
+    future_month = st.sidebar.selectbox("Select Month", range(1, 13), index=11)
+
+    # Monthly price series of the selected product in Canada
+    try:
+        y = food_series(panel, selected_product)
+    except ValueError as exc:
+        st.write(str(exc))
+        return
+
+    # Predict future value (precomputed by batch_forecast.py, or fitted by a forecast worker on demand)
+    last_date = y.index.max()
+    steps = (future_year - last_date.year) * 12 + future_month - last_date.month
+    if steps < 1:
+        st.write(f"Prices are recorded through {last_date.month}/{last_date.year}; please select a later month.")
+        return
+    future_dates = pd.date_range(start=last_date, periods=steps + 1, freq='MS')[1:]
+    forecast = page_forecast('food_prices', selected_product, y, steps)
+    # Simulated prediction intervals stored next to the forecast (None when it was fitted on demand)
+    bands = forecast_bands('food_prices', selected_product, steps)
+
+    # Get the predicted value for the selected date
+    predicted_value = forecast.iloc[-1]
+
+    # Plot historical and forecasted prices on a figure owned by this request
+    with span('render', 'food/price_forecasting'):
+        fig = Figure(figsize=(10, 5))
+        ax = fig.subplots()
+        if bands is not None:
+            plot_fan(ax, future_dates, bands)
+        ax.plot(y.index, y.values, label='Historical Prices')
+        ax.plot(future_dates, forecast, label='Forecasted Prices', linestyle='--')
+
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Price ($)")
+        ax.set_title(f"{selected_product} Price Forecasting")
+        ax.legend()
+        png = encode_figure(fig)
+    st.image(png, use_column_width=True)
+
+    # Display the predicted value
+    st.write(f"The last recorded price ({last_date.month}/{last_date.year}) is {y.iloc[-1]:.2f}")
+    st.write(f"The predicted price for {future_month}/{future_year} is {predicted_value:.2f}")
+    if bands is not None and 'p10' in bands:
+        st.write(f"80% prediction interval: {bands['p10'].iloc[-1]:.2f} to {bands['p90'].iloc[-1]:.2f}")
+
+# Function to display the Food Inflation page
+def food_inflation():
+    st.subheader("Food Inflation")
+
+    # CPI indexes rolled up from every product's forecast; batch_forecast.py fits and writes them, the page only reads
+    with span('load', 'cpi index'):
+        index = load_cpi_index()
+    if index is None:
+        st.write("The forecast CPI indexes have not been built yet; run batch_forecast.py.")
+        return
+    if index['dataset_version'] != dataset_version('food_prices'):
+        st.warning(f"These indexes were built on {index['built']} from an earlier food price table; "
+                   "run batch_forecast.py to refresh them.")
+    groups = list(index['groups'])
+    selected_group = st.sidebar.selectbox("Select CPI Group", groups, index=groups.index(index['headline']))
+    entry = index['groups'][selected_group]
+
+    months = pd.to_datetime(entry['months'], format='%Y-%m')
+    values = np.asarray(entry['index'])
+    history = entry['history_months']
+    cpi = pd.Series(entry['cpi'], dtype=float)
+
+    # Plot the monthly index with the annual CPI it is scaled to
+    def draw():
+        fig = Figure(figsize=(10, 5))
+        ax = fig.subplots()
+        ax.plot(months[:history], values[:history], label='Index from product prices')
+        ax.plot(months[history - 1:], values[history - 1:], label='Forecast', linestyle='--')
+        ax.plot(pd.to_datetime(cpi.index + '-07'), cpi.values, 'o', markersize=3, label='CPI (annual)')
+
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Index (2002=100)")
+        ax.set_title(f"{selected_group} CPI Forecast ({index['geo']})")
+        ax.legend()
+        return fig
+    state = {'group': selected_group}
+    version = f"{index['dataset_version']}/{index['built']}"
+    st.image(cached_chart('food/food_inflation', state, version, draw), use_column_width=True)
+
+    # Annual averages and inflation, with CPI.csv where it has the year
+    inflation = pd.Series(entry['inflation'], dtype=float)
+    table = pd.DataFrame({'Index': pd.Series(entry['annual'], dtype=float), 'Inflation (%)': inflation,
+                          'CPI': cpi}).loc[lambda df: df.index >= str(months[history - 1].year - 3)]
+    table = table[table['Index'].notna()]
+    table['Source'] = np.where(table.index.astype(int) < months[history - 1].year, 'History', 'Forecast')
+    st.dataframe(table)
+    st.write(f"{len(entry['products'])} products ({entry['forecast_products']} forecast), each weighted equally, "
+             f"scaled to the {selected_group} CPI of {entry['anchor_year']}")
+
+# Function to display the food price dashboard
+def food_dashboard():
+    #st.title("Welcome to Food Price Analysis Dashboard")
+
+    # Load data
+    with span('load', 'food'):
+        panel = load_data()
+    # Forecast workers start in the background while the user picks a page
+    forecast_pool.start()
+
+    # Main navigation for the food dashboard
+    page = st.sidebar.selectbox("Select a Page", ["Home", "Product Trend", "Price Forecasting", "Food Inflation"])
+
+    if page == "Home":
+        st.markdown("""
+        <div style='font-size:36px; font-weight:bold;'>Welcome to the Food Price Analysis Dashboard</div>
+        """, unsafe_allow_html=True)
+        st.write("Use the navigation menu to explore different analyses and visualizations of Canadian food prices.")
+        st.image('static/food.jpg', use_column_width=True)
+
+    elif page == "Product Trend":
+        with render_timer("Food: Product Trend"):
+            product_trend(panel)
+    elif page == "Price Forecasting":
+        with render_timer("Food: Price Forecasting"):
+            price_forecasting(panel)
+    elif page == "Food Inflation":
+        with render_timer("Food: Food Inflation"):
+            food_inflation()
+
+if __name__ == "__main__":
+    food_dashboard()
@@ -0,0 +1,200 @@
+# food_inflation.py
+# Forecast CPI indexes rolled up from the per-product food price forecasts.
+# Every product of the StatCan food price table belongs to one product group of CPI.csv:
+# most to Food, a few to Gasoline or Health and personal care, and household paper,
+# detergent and cigarettes to no group CPI.csv lists. A group's index chains the geometric
+# mean of its products' month-on-month price changes (every product weighs the same, as in
+# StatCan's elementary indexes) over the history and the forecast months, and is scaled so
+# its average over the latest full year of history equals that group's CPI.
+#
+# batch_forecast.py writes the indexes to cache/cpi_index.json next to the forecast table.
+# The front screen only reads that file (json and NumPy, no pandas), so it draws the
+# forecast CPI-food index without fitting anything.
+#
+#   python food_inflation.py      (rebuilds the indexes and prints each group's annual inflation)
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+CPI_INDEX = os.environ.get('DASHBOARD_CPI_INDEX', os.path.join('cache', 'cpi_index.json'))
+
+# CPI group of the products that are not food; None for products in no group of CPI.csv
+NON_FOOD = {
+    'Regular, unleaded gasoline at self-service stations, cents per litre': 'Gasoline',
+    'Deodorant, 60 grams': 'Health and personal care',
+    'Shampoo, 300 millilitres': 'Health and personal care',
+    'Toothpaste, 100 millilitres': 'Health and personal care',
+    'Bathroom tissue (4 rolls)': None,
+    'Facial tissue (200 tissues)': None,
+    'Paper towels (2 rolls)': None,
+    'Laundry detergent, 4 litres': None,
+    'Cigarettes (200)': None,
+}
+# Group the front screen shows
+HEADLINE = 'Food'
+# Geography the indexes are built for
+GEO = 'Canada'
+
+
+# Function to return the CPI group of a product (None when CPI.csv has no group for it)
+def cpi_group(product):
+    return NON_FOOD.get(product, 'Food')
+
+
+# Function to chain the geometric mean of month-on-month price changes -> (T,) index starting at 1.
+# `prices` is (products, months) with NaN where a product has no price; a product only counts in
+# the months it is priced in both, so products entering or leaving do not move the index.
+def chain_index(prices):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        changes = np.diff(np.log(prices), axis=1)
+    priced = np.isfinite(changes)
+    counts = priced.sum(axis=0)
+    mean = np.where(priced, changes, 0.0).sum(axis=0) / np.maximum(counts, 1)
+    return np.exp(np.concatenate([[0.0], np.cumsum(mean)]))
+
+
+# Function to build the index of every CPI group from the food price panel and the product forecasts.
+# `forecasts` maps a product to its forecast for the months after the panel's last month.
+def build_index(panel, forecasts, cpi_df, version=None):
+    import pandas as pd
+
+    steps = min((len(forecast) for forecast in forecasts.values()), default=0)
+    history = len(panel.months)
+    months = panel.months.append(pd.date_range(panel.months[-1], periods=steps + 1, freq='MS')[1:])
+    prices = np.full((len(panel.products), history + steps), np.nan)
+    prices[:, :history] = panel.matrix(GEO)
+    for i, product in enumerate(panel.products):
+        if product in forecasts:
+            prices[i, history:] = forecasts[product][:steps]
+
+    years = months.year.to_numpy()
+    full_years = [year for year, count in zip(*np.unique(years[:history], return_counts=True)) if count == 12]
+    cpi = {group: dict(zip(rows['Year'], rows['Value'])) for group, rows in cpi_df.groupby('Group')}
+
+    groups = {}
+    for group in dict.fromkeys(cpi_group(product) for product in panel.products):
+        if group not in cpi:
+            continue
+        rows = [i for i, product in enumerate(panel.products) if cpi_group(product) == group]
+        index = chain_index(prices[rows])
+
+        # Scaled to the group's CPI in the latest full year of history CPI.csv covers
+        anchors = [year for year in full_years if year in cpi[group]]
+        if not anchors:
+            continue
+        anchor = max(anchors)
+        index *= cpi[group][anchor] / index[:history][years[:history] == anchor].mean()
+
+        annual = pd.Series(index, index=years).groupby(level=0).mean()
+        # Only years with every month priced or forecast
+        annual = annual[pd.Series(years).value_counts().sort_index() == 12]
+        groups[group] = {
+            'products': [panel.products[i] for i in rows],
+            'forecast_products': sum(panel.products[i] in forecasts for i in rows),
+            'anchor_year': int(anchor),
+            'months': [f'{month:%Y-%m}' for month in months],
+            'index': [round(float(value), 3) for value in index],
+            'history_months': history,
+            # Keyed by the year as a string, as JSON keeps them
+            'annual': {str(year): round(float(value), 2) for year, value in annual.items()},
+            'inflation': {str(year): round(float(value) * 100, 2)
+                          for year, value in annual.pct_change().dropna().items()},
+            'cpi': {str(year): float(value) for year, value in cpi[group].items()},
+        }
+    return {'built': time.strftime('%Y-%m-%dT%H:%M:%S'), 'dataset_version': version, 'geo': GEO,
+            'headline': HEADLINE, 'groups': groups}
+
+
+# Function to write the indexes atomically
+def write_cpi_index(index, path=CPI_INDEX):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, path)
+    return index
+
+
+_lock = threading.Lock()
+_current = {'stat': None, 'index': None}
+
+
+# Function to load the indexes batch_forecast.py wrote; None before it has run
+def load_cpi_index(path=CPI_INDEX):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    stat = (stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        if _current['stat'] == stat:
+            return _current['index']
+        try:
+            with open(path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return _current['index']
+        _current['stat'] = stat
+        _current['index'] = index
+        return index
+
+
+# Function to forecast every priced product -> {product: forecast}.
+# Forecasts come from the forecast table; products missing from it (or stale) are fit together
+# with the batch job's grouped Holt-Winters pass.
+def product_forecasts(panel):
+    from batch_forecast import fit_group, group_tasks
+    from data_store import dataset_version
+    from forecasting import champion_model, food_series, forecast_steps, lookup_forecast
+
+    version = dataset_version('food_prices')
+    steps = forecast_steps(panel.months.max())
+    forecasts, tasks = {}, []
+    for product in panel.products:
+        entry = lookup_forecast('food_prices', product, steps)
+        if entry is not None:
+            forecasts[product] = entry['forecast'][:steps]
+            continue
+        try:
+            tasks.append(('food_prices', product, version, champion_model('food_prices', product),
+                          food_series(panel, product, GEO)))
+        except ValueError:
+            # No longer priced or too short to forecast
+            continue
+    for group in group_tasks(tasks):
+        for outcome in fit_group(group):
+            if outcome['error'] is None:
+                forecasts[outcome['series']] = outcome['rows']['forecast'].to_numpy()
+    return forecasts
+
+
+# Function to return the indexes for the current food price table, rebuilding them when stale
+def get_cpi_index(path=CPI_INDEX):
+    from data_store import dataset_version, get_dataset
+    from food_prices import get_food_panel
+
+    index = load_cpi_index(path)
+    version = dataset_version('food_prices')
+    if index is not None and index['dataset_version'] == version:
+        return index
+    panel = get_food_panel()
+    return write_cpi_index(build_index(panel, product_forecasts(panel), get_dataset('cpi'), version), path)
+
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    index = get_cpi_index()
+    print(f"CPI indexes for {index['geo']} in {time.perf_counter() - start:.2f}s -> {CPI_INDEX}")
+    for group, entry in index['groups'].items():
+        history_end = entry['months'][entry['history_months'] - 1]
+        print(f"{group}: {len(entry['products'])} products ({entry['forecast_products']} forecast), "
+              f"scaled to CPI {entry['anchor_year']}, history to {history_end}")
+        for year, inflation in entry['inflation'].items():
+            if int(year) >= int(history_end[:4]) - 2:
+                cpi = entry['cpi'].get(year)
+                actual = f", CPI {cpi:.1f}" if cpi is not None else ''
+                print(f"  {year}: index {entry['annual'][year]:.1f} ({inflation:+.1f}%){actual}")
@@ -0,0 +1,116 @@
+# food_prices.py
+# Dense (geography x product x month) array of the StatCan food prices.
+# Canadian_Food_Prices_Historical.csv is streamed chunk by chunk (data_store.iter_food_chunks)
+# and every chunk is scattered straight into a float32 array, so loading holds one chunk plus
+# the array however many rows the table has, and a product's history is one slice.
+# The panel is rebuilt when the file's contents change.
+#
+#   python food_prices.py [--geo Canada]      (prints the panel's shape and latest prices)
+import argparse
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import DATASETS, file_hash, food_months, iter_food_chunks
+
+FOOD_CSV = DATASETS['food_prices'][0]
+
+
+class FoodPanel:
+    # Price per (geography, product, month); NaN where StatCan has no figure
+    def __init__(self, geos, products, months, values, version=None):
+        self.geos = geos            # (G,) geography names
+        self.products = products    # (P,) product names
+        self.months = months        # (T,) DatetimeIndex of month starts, sorted
+        self.values = values        # (G, P, T) float32 prices
+        self.version = version      # content hash of the source file
+        self._geo_pos = {geo: i for i, geo in enumerate(geos)}
+        self._product_pos = {product: i for i, product in enumerate(products)}
+
+    # Function to return the (product x month) prices of one geography
+    def matrix(self, geo='Canada'):
+        return self.values[self._geo_pos[geo]]
+
+    # Function to return one product's monthly prices as a Series (months without a price dropped)
+    def series(self, product, geo='Canada'):
+        values = self.values[self._geo_pos[geo], self._product_pos[product]]
+        series = pd.Series(values.astype(float), index=self.months, name=product)
+        return series.dropna()
+
+    # Function to return the prices of every product in one month -> (products, prices)
+    def month(self, date, geo='Canada'):
+        t = self.months.get_loc(pd.Timestamp(date))
+        return self.products, self.values[self._geo_pos[geo], :, t]
+
+    # Function to report the memory held by the panel
+    def nbytes(self):
+        return int(self.values.nbytes)
+
+
+# Function to grow `values` so it fits `shape`, padding with NaN
+def _fit(values, shape):
+    if all(have >= need for have, need in zip(values.shape, shape)):
+        return values
+    # Doubling keeps the number of copies logarithmic in the final size
+    grown = np.full([max(need, 2 * have) if need > have else have for have, need in zip(values.shape, shape)],
+                    np.nan, dtype=np.float32)
+    grown[tuple(slice(0, have) for have in values.shape)] = values
+    return grown
+
+
+# Function to stream the food price table into a panel
+def read_panel(path=FOOD_CSV, chunk_rows=None, version=None):
+    categories = {}
+    values = np.full((1, 1, 1), np.nan, dtype=np.float32)
+    for codes in iter_food_chunks(path, categories, chunk_rows):
+        values = _fit(values, [len(categories[col]) for col in ('GEO', 'Products', 'REF_DATE')])
+        values[codes['GEO'], codes['Products'], codes['REF_DATE']] = codes['VALUE']
+
+    # Codes follow first appearance, which depends on the chunking; the panel is sorted on every axis
+    labels = [np.array(list(categories.get(col, ())), dtype=object) for col in ('GEO', 'Products')]
+    months = food_months(categories) if categories.get('REF_DATE') else np.array([], dtype='datetime64[ns]')
+    orders = [np.argsort(names, kind='stable') for names in labels] + [np.argsort(months, kind='stable')]
+    if all(len(order) for order in orders):
+        values = values[np.ix_(*orders)]
+    else:
+        values = np.empty([len(order) for order in orders], dtype=np.float32)
+    return FoodPanel(labels[0][orders[0]], labels[1][orders[1]], pd.DatetimeIndex(months[orders[2]]), values,
+                     version)
+
+
+_lock = threading.Lock()
+_current = {'stat': None, 'panel': None}
+
+
+# Function to return the food price panel, rebuilt when the source file changes
+def get_food_panel(path=FOOD_CSV):
+    stat = os.stat(path)
+    stat = (path, stat.st_mtime_ns, stat.st_size)
+    with _lock:
+        if _current['stat'] == stat:
+            return _current['panel']
+        panel = _current['panel']
+
+    version = file_hash(path)
+    if panel is None or panel.version != version:
+        panel = read_panel(path, version=version)
+    with _lock:
+        _current['stat'] = stat
+        _current['panel'] = panel
+    return panel
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the food price panel')
+    parser.add_argument('--geo', default='Canada')
+    args = parser.parse_args()
+
+    panel = get_food_panel()
+    print(f'{len(panel.geos)} geographies x {len(panel.products)} products x {len(panel.months)} months '
+          f'({panel.months.min():%Y-%m} to {panel.months.max():%Y-%m}), {panel.nbytes() / 2 ** 20:.2f} MB')
+    products, prices = panel.month(panel.months.max(), args.geo)
+    for product, price in zip(products, prices):
+        if np.isfinite(price):
+            print(f'  {product}: {price:.2f}')
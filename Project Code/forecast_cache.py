@@ -0,0 +1,201 @@
+# forecast_cache.py
+# Cache of fitted Holt-Winters models.
+# Fitting is the expensive part of a forecast; the fitted parameters only depend on
+# the historical series and the model specification, not on the month the user
+# asks about. Parameters are kept in memory and on disk, keyed by
+# (dataset version, series key, model spec), and the model is rebuilt from them
+# without re-optimizing for any forecast horizon.
+#
+# The pages fit with the NumPy engine (holtwinters.py), whose fitted parameters and final
+# smoothing state are stored, so any horizon is one forecast_state call; batch_forecast.py's
+# statsmodels engine stores ExponentialSmoothing parameters and rebuilds the model.
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+FORECAST_CACHE_DIR = os.environ.get('DASHBOARD_FORECAST_CACHE', os.path.join('cache', 'forecasts'))
+
+
+# Function to fingerprint the values of a series
+def values_hash(y):
+    return hashlib.sha1(np.ascontiguousarray(np.asarray(y, dtype=float)).tobytes()).hexdigest()
+
+
+# Function to build the cache key for a series and model specification
+def cache_key(dataset_version, series_key, spec, y):
+    # The values fingerprint guards against callers preparing the series differently
+    payload = json.dumps([dataset_version, series_key, spec, values_hash(y)], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+# Function to fit a model with the optimizer and return the fitted results
+def fit_params(y, spec):
+    # statsmodels takes about a second to import, so it is only loaded by the first fit
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    return ExponentialSmoothing(y, **spec).fit()
+
+
+# Function to fit the NumPy engine to one series -> {'params', 'state'} of the fitted model
+def fit_state(y, spec):
+    import holtwinters
+
+    result = holtwinters.fit(np.asarray(y, dtype=float), **spec)
+    state = result.state
+    return {'params': result.series_params(0),
+            'state': {'level': float(state['level'][0]), 'trend': float(state['trend'][0]),
+                      'season': state['season'][0].copy(), 't': state['t']}}
+
+
+# Function to forecast `steps` months from a fitted NumPy engine model -> (steps,) values
+def forecast_from_state(record, spec, steps):
+    import holtwinters
+
+    state = record['state']
+    panel_state = {'level': np.array([state['level']]), 'trend': np.array([state['trend']]),
+                   'season': np.asarray(state['season'])[None, :], 't': state['t']}
+    return holtwinters.forecast_state(panel_state, steps, spec.get('trend'), spec.get('seasonal'),
+                                      panel_state['season'].shape[1])[0]
+
+
+# Function to rebuild fitted results from stored parameters without optimizing
+def rebuild(y, spec, params):
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+
+    initial = {'initial_level': params['initial_level']}
+    smoothing = {'smoothing_level': params['smoothing_level']}
+    if spec.get('trend'):
+        initial['initial_trend'] = params['initial_trend']
+        smoothing['smoothing_trend'] = params['smoothing_trend']
+        if spec.get('damped_trend'):
+            smoothing['damping_trend'] = params['damping_trend']
+    if spec.get('seasonal'):
+        initial['initial_seasonal'] = params['initial_seasons']
+        smoothing['smoothing_seasonal'] = params['smoothing_seasonal']
+
+    model = ExponentialSmoothing(y, initialization_method='known', **initial, **spec)
+    return model.fit(optimized=False, **smoothing)
+
+
+class ForecastCache:
+    def __init__(self, cache_dir=FORECAST_CACHE_DIR, max_models=256):
+        self.cache_dir = cache_dir
+        self.max_models = max_models
+        self._results = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.fit_seconds = []
+
+    # Function to return fitted statsmodels results for a series, fitting only on a cache miss
+    def fit(self, y, spec, dataset_version, series_key):
+        key = cache_key(dataset_version, series_key, spec, y)
+        return self._get(key, lambda: fit_params(y, spec), lambda results: dict(results.params),
+                         lambda params: rebuild(y, spec, params),
+                         {'dataset_version': dataset_version, 'series_key': series_key, 'spec': spec})
+
+    # Function to return the NumPy engine's fitted parameters and final state for a series ({'params', 'state'}),
+    # fitting only on a cache miss
+    def fit_state(self, y, spec, dataset_version, series_key):
+        key = cache_key(dataset_version, series_key, {**spec, 'engine': 'numpy'}, y)
+        return self._get(key, lambda: fit_state(y, spec), lambda record: record, lambda record: record,
+                         {'dataset_version': dataset_version, 'series_key': series_key, 'spec': spec,
+                          'engine': 'numpy'})
+
+    # Function to look a fitted model up in memory, then on disk, and fit it on a miss.
+    # `to_params` turns a fit into what is stored on disk and `from_params` turns that back into a fit.
+    def _get(self, key, fit, to_params, from_params, record):
+        with self._lock:
+            results = self._results.get(key)
+            if results is not None:
+                self.hits += 1
+                return results
+
+        params = self._read(key)
+        if params is not None:
+            results = from_params(params)
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            start = time.perf_counter()
+            results = fit()
+            elapsed = time.perf_counter() - start
+            self._write(key, {**record, 'params': to_params(results), 'fit_seconds': elapsed})
+            with self._lock:
+                self.misses += 1
+                self.fit_seconds.append(elapsed)
+
+        with self._lock:
+            if len(self._results) >= self.max_models:
+                # Drop the oldest entry; the parameters stay on disk
+                self._results.pop(next(iter(self._results)))
+            self._results[key] = results
+        return results
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)['params']
+        except (OSError, EOFError, pickle.UnpicklingError, KeyError):
+            return None
+
+    def _write(self, key, record):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f'{self._path(key)}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(record, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            # The in-memory cache still works on a read-only disk
+            pass
+
+    # Function to report hit rate and fit-time statistics
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            fits = self.fit_seconds
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'models_in_memory': len(self._results),
+                'fits': len(fits),
+                'fit_seconds_total': sum(fits),
+                'fit_seconds_mean': sum(fits) / len(fits) if fits else 0.0,
+                'fit_seconds_max': max(fits, default=0.0),
+            }
+
+    # Function to clear the in-memory models (and optionally the disk store)
+    def clear(self, disk=False):
+        with self._lock:
+            self._results.clear()
+        if disk and os.path.isdir(self.cache_dir):
+            for filename in os.listdir(self.cache_dir):
+                if filename.endswith('.pkl'):
+                    os.remove(os.path.join(self.cache_dir, filename))
+
+
+# Shared cache used by every dashboard in this process
+forecast_cache = ForecastCache()
+
+
+# Function to fit (or reuse) an ExponentialSmoothing model for a series
+def fit_model(y, spec, dataset_version, series_key):
+    return forecast_cache.fit(y, spec, dataset_version, series_key)
+
+
+# Function to forecast `steps` months with the NumPy engine, fitting the series only when its
+# parameters and state are not cached -> (steps,) values
+def cached_forecast(y, spec, dataset_version, series_key, steps):
+    return forecast_from_state(forecast_cache.fit_state(y, spec, dataset_version, series_key), spec, steps)
@@ -0,0 +1,432 @@
+# forecast_pool.py
+# Warm pool of forecast worker processes shared by every session of the Streamlit server.
+# Forecasts missing from the table written by batch_forecast.py used to be fitted on the
+# session's script thread, holding the GIL against every other session in the process.
+# Here they run in DASHBOARD_FORECAST_WORKERS processes started once per server, forked from
+# a fork server that has already imported pandas, NumPy and the forecast models.
+#
+# The prepared series of a dataset (oil_series, wage_series, hpi_series, food_series for every
+# key) are copied once per dataset version into a multiprocessing.shared_memory block: month
+# stamps and values of every series, end to end. A job only names the block and the rows of its
+# series, so no DataFrame is pickled per job, and a worker keeps the blocks it has attached.
+# Identical jobs in flight share one fit, finished forecasts are kept per (dataset version,
+# series and its values, model, horizon), and the page shows a spinner while it waits for a worker.
+#
+#   DASHBOARD_FORECAST_WORKERS=0 fits on the script thread as before.
+import atexit
+import multiprocessing
+import os
+import sys
+import threading
+import types
+import warnings
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from data_store import dataset_version
+from forecast_cache import values_hash
+from forecasting import champion_model, fit_values, forecast_steps, lookup_forecast, series_of
+from instrumentation import span
+from panels import get_panel
+
+FORECAST_WORKERS = int(os.environ.get('DASHBOARD_FORECAST_WORKERS', '2'))
+# Finished forecasts kept in the server process
+MAX_RESULTS = 256
+# Shared blocks a worker keeps attached
+MAX_ATTACHED = 8
+
+
+class SharedSeries:
+    # Prepared series of one dataset version in one shared memory block:
+    # `length` int64 month stamps (ns) followed by `length` float64 values
+    def __init__(self, dataset, version, series):
+        self.dataset = dataset
+        self.version = version
+        self.length = sum(len(y) for y in series.values())
+        self.shm = shared_memory.SharedMemory(create=True, size=max(16 * self.length, 1))
+        self.name = self.shm.name
+        stamps, values = _views(self.shm, self.length)
+        self.rows = {}          # series key -> (start, stop)
+        self.fingerprints = {}  # series key -> (last month stamp, values hash)
+        start = 0
+        for series_key, y in series.items():
+            stop = start + len(y)
+            stamps[start:stop] = y.index.asi8
+            values[start:stop] = y.to_numpy(dtype=float)
+            self.rows[series_key] = (start, stop)
+            self.fingerprints[series_key] = fingerprint(y)
+            start = stop
+        del stamps, values
+        self.jobs = 0           # jobs in flight reading the block
+        self.retired = False    # a newer version replaced it
+
+    def nbytes(self):
+        return 16 * self.length
+
+    # Function to check that `y` is the series the block holds under `series_key`
+    def holds(self, series_key, y):
+        return series_key in self.rows and self.fingerprints[series_key] == fingerprint(y)
+
+    # Function to free the block once nothing reads it
+    def release(self):
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Function to identify a prepared series by its last month and its values
+def fingerprint(y):
+    return (int(y.index.asi8[-1]) if len(y) else None, values_hash(y))
+
+
+# Function to view a shared block as its (stamps, values) arrays
+def _views(shm, length):
+    stamps = np.ndarray(length, dtype=np.int64, buffer=shm.buf)
+    values = np.ndarray(length, dtype=np.float64, buffer=shm.buf, offset=8 * length)
+    return stamps, values
+
+
+# Blocks attached by this worker process: name -> (SharedMemory, stamps, values)
+_attached = OrderedDict()
+
+
+# Function to attach a shared block in a worker, keeping the MAX_ATTACHED most recent ones
+def _attach(name, length):
+    block = _attached.get(name)
+    if block is not None:
+        _attached.move_to_end(name)
+        return block
+    shm = shared_memory.SharedMemory(name=name)
+    block = _attached[name] = (shm, *_views(shm, length))
+    while len(_attached) > MAX_ATTACHED:
+        old = _attached.popitem(last=False)[1]
+        old[0].close()
+    return block
+
+
+# Function to load statsmodels' ARIMA in a new worker, so the first ARIMA champion does not pay for the import
+def _warm():
+    # Index warnings from statsmodels would go to the server's log on every fit
+    warnings.simplefilter('ignore')
+    from statsmodels.tsa.arima.model import ARIMA  # noqa: F401
+
+
+# Function to forecast one series of a shared block (runs in a worker process)
+def _forecast_shared(name, length, start, stop, model, series_key, steps, version):
+    _, stamps, values = _attach(name, length)
+    # The series is copied out of the block, so the fitted model cached in the worker holds no view of it
+    y = pd.Series(values[start:stop].copy(), index=pd.DatetimeIndex(stamps[start:stop].view('datetime64[ns]')))
+    return fit_values(model, series_key, y, steps, version)
+
+
+# Function to start processes under a bare __main__ module.
+# Streamlit installs the page script as __main__, and a fork server or spawned worker would import
+# (and so run) it; the jobs only need this module, which the workers import by name.
+@contextmanager
+def _bare_main():
+    main = sys.modules['__main__']
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+
+# Function to return a finished future holding `value`
+def _done(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+class ForecastPool:
+    def __init__(self, workers=FORECAST_WORKERS, max_results=MAX_RESULTS):
+        self.workers = workers
+        self.max_results = max_results
+        self._executor = None
+        self._blocks = {}               # dataset -> SharedSeries of the version served
+        self._retired = []              # replaced blocks still read by jobs in flight
+        self._in_flight = {}            # job key -> Future
+        self._results = OrderedDict()   # job key -> forecast
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._build_locks = {}
+        self._starter = None
+        self.start_error = None
+        self.hits = 0
+        self.deduped = 0
+        self.misses = 0
+        self.failures = 0
+
+    # Function to start the workers in the background, so the caller does not wait for them
+    def start(self):
+        with self._lock:
+            if self._starter is None and self.workers > 0:
+                self._starter = threading.Thread(target=self._start_workers, name='forecast-pool-start', daemon=True)
+                self._starter.start()
+
+    def _start_workers(self):
+        try:
+            self._pool()
+        except (OSError, RuntimeError) as exc:
+            # Also raised when the process exits while workers start; the first fit tries again
+            self.start_error = repr(exc)
+
+    # Function to return the process pool, starting its workers on first use
+    def _pool(self):
+        with self._start_lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                # The server runs a thread per session, so workers come from a fork server rather than a fork
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                if context.get_start_method() == 'forkserver':
+                    context.set_forkserver_preload(['forecast_pool', 'statsmodels.tsa.arima.model'])
+                executor = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_warm)
+                try:
+                    # Every worker is started now rather than by the first fits
+                    for _ in range(self.workers):
+                        self._submit(executor, os.getpid)
+                except Exception:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+                self._executor = executor
+            return self._executor
+
+    # Function to queue a job; a submit may also start a worker, which must not import the page script
+    @staticmethod
+    def _submit(executor, fn, *args):
+        with _bare_main():
+            return executor.submit(fn, *args)
+
+    # Function to return the shared block of a dataset version, copying its series in on first use
+    def shared(self, dataset, version):
+        with self._lock:
+            block = self._blocks.get(dataset)
+            if block is not None and block.version == version:
+                return block
+            build_lock = self._build_locks.setdefault(dataset, threading.Lock())
+
+        # Only one thread copies a dataset; the others wait and reuse its block
+        with build_lock:
+            with self._lock:
+                block = self._blocks.get(dataset)
+                if block is not None and block.version == version:
+                    return block
+            with span('load', f'{dataset} shared series'):
+                if dataset == 'food_prices':
+                    from food_prices import get_food_panel
+                    data = get_food_panel()
+                else:
+                    data = get_panel(dataset)
+                series = {}
+                for series_key, prepare in series_of(dataset, data):
+                    try:
+                        series[series_key] = prepare()
+                    except ValueError:
+                        # Too short to forecast; the page reports it before asking for a fit
+                        continue
+                block = SharedSeries(dataset, version, series)
+
+            with self._lock:
+                old = self._blocks.get(dataset)
+                self._blocks[dataset] = block
+                if old is not None:
+                    old.retired = True
+                    self._retired.append(old)
+                    self._release_retired()
+            return block
+
+    # Function to free replaced blocks no job reads any more (callers hold self._lock)
+    def _release_retired(self):
+        for block in [block for block in self._retired if block.jobs == 0]:
+            self._retired.remove(block)
+            block.release()
+
+    # Function to forecast a series in a worker -> Future of at least `steps` values.
+    # The whole stored horizon is fitted, so every month a user can pick reuses the same job,
+    # and a request matching a job in flight gets that job's future.
+    def forecast(self, dataset, series_key, y, steps):
+        version = dataset_version(dataset)
+        model = champion_model(dataset, series_key)
+        horizon = max(steps, forecast_steps(y.index.max()))
+        # The series' fingerprint is part of the key, so a series prepared another way is its own job
+        key = (dataset, version, series_key, model, horizon, fingerprint(y))
+        with self._lock:
+            values = self._results.get(key)
+            if values is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return _done(values)
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.deduped += 1
+                return future
+
+        block = self.shared(dataset, version)
+        executor = self._pool()
+        with self._lock:
+            # Another session may have asked for the same forecast meanwhile
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.deduped += 1
+                return future
+            if block.holds(series_key, y):
+                future = self._submit(executor, _forecast_shared, block.name, block.length, *block.rows[series_key],
+                                      model, series_key, horizon, version)
+            else:
+                # A series prepared some other way travels with the job
+                future = self._submit(executor, fit_values, model, series_key, y, horizon, version)
+            block.jobs += 1
+            self._in_flight[key] = future
+            self.misses += 1
+        future.add_done_callback(partial(self._finished, key, block))
+        return future
+
+    # Function to record a finished job and release its block
+    def _finished(self, key, block, future):
+        with self._lock:
+            # The entry may already be a new job, submitted after this one failed and was discarded
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            block.jobs -= 1
+            self._release_retired()
+            if future.cancelled() or future.exception() is not None:
+                self.failures += 1
+                return
+            self._results[key] = future.result()
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+    # Function to drop a failed job from the jobs in flight, so the next request for it submits a new one
+    # rather than sharing the failure
+    def discard(self, future):
+        with self._lock:
+            for key in [key for key, job in self._in_flight.items() if job is future]:
+                del self._in_flight[key]
+
+    # Function to stop the workers; the next fit starts new ones (a crashed worker breaks the whole pool)
+    def reset(self):
+        with self._start_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # Function to stop the workers and free every shared block
+    def shutdown(self):
+        self.reset()
+        with self._lock:
+            for block in list(self._blocks.values()) + self._retired:
+                block.release()
+            self._blocks.clear()
+            self._retired.clear()
+
+    # Function to report job counters and the shared memory held
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.deduped + self.misses
+            return {
+                'workers': self.workers,
+                'started': self._executor is not None,
+                'start_error': self.start_error,
+                'hits': self.hits,
+                'deduped': self.deduped,
+                'misses': self.misses,
+                'failures': self.failures,
+                'hit_rate': (self.hits + self.deduped) / lookups if lookups else 0.0,
+                'in_flight': len(self._in_flight),
+                'results': len(self._results),
+                'shared_bytes': sum(block.nbytes() for block in list(self._blocks.values()) + self._retired),
+                'blocks': {dataset: {'version': block.version, 'series': len(block.rows), 'bytes': block.nbytes()}
+                           for dataset, block in self._blocks.items()},
+            }
+
+
+# Shared pool used by every session of this server
+forecast_pool = ForecastPool()
+atexit.register(forecast_pool.shutdown)
+
+
+# Function to show a spinner while the page waits; outside a Streamlit script run nothing is shown
+@contextmanager
+def _waiting(text):
+    if 'streamlit' in sys.modules:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        if get_script_run_ctx(suppress_warning=True) is not None:
+            import streamlit as st
+
+            with st.spinner(text):
+                yield
+            return
+    yield
+
+
+# Function to fit series in the workers, all submitted before any is waited on -> {series key: forecast}.
+# Series the workers cannot fit are left out, for the caller to fit on the script thread.
+def _pooled_values(dataset, series, steps):
+    if forecast_pool.workers < 1 or not series:
+        return {}
+    try:
+        futures = {series_key: forecast_pool.forecast(dataset, series_key, y, steps)
+                   for series_key, y in series.items()}
+    except BrokenProcessPool:
+        # A worker died; the next fits get new workers and these run on the script thread
+        forecast_pool.reset()
+        return {}
+    except Exception:
+        # Workers or shared memory are unavailable here (OSError), the pool is shut down (RuntimeError),
+        # or the dataset's shared block could not be built; the series are fitted on the script thread
+        return {}
+    if not all(future.done() for future in futures.values()):
+        label = next(iter(futures)) if len(futures) == 1 else f'{len(futures)} {dataset} series'
+        with _waiting(f"Fitting the forecast model for {label}..."):
+            wait(futures.values())
+
+    forecasts = {}
+    broken = False
+    for series_key, future in futures.items():
+        try:
+            forecasts[series_key] = future.result()
+        except BrokenProcessPool:
+            forecast_pool.discard(future)
+            broken = True
+        except (Exception, CancelledError):
+            # The fit failed in the worker, or the job was cancelled by a reset; it runs on the script thread
+            forecast_pool.discard(future)
+    if broken:
+        forecast_pool.reset()
+    return forecasts
+
+
+# Function to forecast `steps` months after the end of every series in `series` (key -> y) for a page,
+# as forecasting.forecast_values does -> {series key: `steps` values}.
+# The precomputed table is read first; the other series are fitted in the workers while the page shows a spinner.
+def page_forecasts(dataset, series, steps):
+    forecasts = {}
+    for series_key in series:
+        entry = lookup_forecast(dataset, series_key, steps)
+        if entry is not None:
+            forecasts[series_key] = entry['forecast'][:steps]
+    missing = {series_key: y for series_key, y in series.items() if series_key not in forecasts}
+    forecasts.update(_pooled_values(dataset, missing, steps))
+    for series_key, y in missing.items():
+        if series_key not in forecasts:
+            forecasts[series_key] = fit_values(champion_model(dataset, series_key), series_key, y, steps,
+                                               dataset_version(dataset))
+    return {series_key: forecasts[series_key][:steps] for series_key in series}
+
+
+# Function to forecast `steps` months after the end of `y` for a page -> Series numbered after `y`
+def page_forecast(dataset, series_key, y, steps):
+    with span('fit', f'{dataset}/{series_key}'):
+        values = page_forecasts(dataset, {series_key: y}, steps)[series_key]
+    return pd.Series(values, index=pd.RangeIndex(len(y), len(y) + steps))
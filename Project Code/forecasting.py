@@ -0,0 +1,208 @@
+# forecasting.py
+# Series preparation and forecast lookup shared by the dashboards and the batch job.
+# The pages read precomputed forecasts from the table written by batch_forecast.py
+# and only fit a model in the request path when the table is missing or stale.
+# Each series is forecast with its champion model from the registry backtest.py writes,
+# or with its dataset's default model until a backtest has run.
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import dataset_version
+from forecast_cache import cached_forecast
+from instrumentation import span
+from models import DEFAULT_MODELS, MODELS, fit_forecast
+
+# Holt-Winters specification of each dataset's default model
+MODEL_SPECS = {dataset: MODELS[name][1] for dataset, name in DEFAULT_MODELS.items()}
+
+# The pages ask for at most 48 months ahead ((2027 - 2024) * 12 + 12)
+MAX_STEPS = 48
+# Every series is forecast at least until the end of this month
+FORECAST_END = pd.Timestamp('2027-12-01')
+
+# Quantile of the simulated paths stored in each band column of the forecast table.
+# lower/upper bound the 95% interval, p10/p90 the 80% one and p25/p75 the 50% one.
+BANDS = {'lower': 0.025, 'p10': 0.10, 'p25': 0.25, 'p75': 0.75, 'p90': 0.90, 'upper': 0.975}
+
+FORECAST_TABLE = os.environ.get('DASHBOARD_FORECAST_TABLE', os.path.join('cache', 'forecast_table.csv'))
+CHAMPIONS = os.environ.get('DASHBOARD_CHAMPIONS', os.path.join('cache', 'champions.json'))
+
+
+# Function to prepare the oil price series for one province of the oil panel (panels.get_panel('oil'))
+def oil_series(panel, province):
+    # Every month from the province's first row to its last, gaps filled (see Panel.filled)
+    return panel.filled(province)
+
+
+# Function to prepare the weekly earnings series for one region of the wage panel
+def wage_series(panel, region):
+    y = panel.filled(region)
+
+    # Filter out non-positive values
+    y = y[y > 0]
+
+    # Ensure there are at least 24 months of data
+    if len(y) < 24:
+        raise ValueError("Not enough data to compute initial seasonals.")
+
+    return y
+
+
+# Function to prepare the HPI series for one region of the HPI panel
+def hpi_series(panel, column):
+    return panel.filled(column)
+
+
+# Function to prepare the monthly price series of one product of the food price panel
+def food_series(panel, product, geo='Canada'):
+    y = panel.series(product, geo)
+
+    # Products StatCan stopped pricing are not forecast
+    if y.empty or y.index.max() < panel.months.max():
+        raise ValueError(f"{product} is no longer priced")
+
+    # Months without a price inside the series keep the last price
+    y = y.asfreq('MS').ffill()
+    if len(y) < 24:
+        raise ValueError("Not enough data to compute initial seasonals.")
+    return y
+
+
+# Function to list every (series key, series) of one dataset; `data` is its panel (or the food price panel)
+def series_of(dataset, data):
+    if dataset == 'oil':
+        for province in data.regions:
+            yield province, lambda p=province: oil_series(data, p)
+    elif dataset == 'wage':
+        for region in data.regions:
+            yield region, lambda r=region: wage_series(data, r)
+    elif dataset == 'hpi':
+        for column in data.regions:
+            yield column, lambda c=column: hpi_series(data, c)
+    elif dataset == 'food_prices':
+        # Products StatCan stopped pricing are not forecast
+        for product in data.products[np.isfinite(data.matrix()[:, -1])]:
+            yield product, lambda p=product: food_series(data, p)
+
+
+# Function to list every (dataset, series key, series) the dashboards can forecast
+def all_series(oil_panel, wage_panel, hpi_panel, food_panel=None):
+    sources = {'oil': oil_panel, 'wage': wage_panel, 'hpi': hpi_panel, 'food_prices': food_panel}
+    for dataset, data in sources.items():
+        if data is not None:
+            for series_key, series in series_of(dataset, data):
+                yield dataset, series_key, series
+
+
+# Function to compute the number of forecast steps stored for a series
+def forecast_steps(last_date):
+    months_to_end = (FORECAST_END.year - last_date.year) * 12 + FORECAST_END.month - last_date.month
+    return max(MAX_STEPS, months_to_end)
+
+
+_champions_lock = threading.Lock()
+_champions = {'stat': None, 'series': {}}
+
+
+# Function to load the champion registry -> {(dataset, series): entry}; empty before the first backtest
+def load_champions(path=CHAMPIONS):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    stat = (stat.st_mtime_ns, stat.st_size)
+
+    with _champions_lock:
+        if _champions['stat'] == stat:
+            return _champions['series']
+        try:
+            with open(path) as f:
+                registry = json.load(f)
+        except (OSError, ValueError):
+            # Keep the champions already loaded if the file cannot be read
+            return _champions['series']
+        _champions['stat'] = stat
+        _champions['series'] = {(entry['dataset'], entry['series']): entry for entry in registry['series']}
+        return _champions['series']
+
+
+# Function to return the name of the model a series is forecast with (a key of models.MODELS)
+def champion_model(dataset, series_key):
+    entry = load_champions().get((dataset, series_key))
+    if entry is not None and entry['model'] in MODELS:
+        return entry['model']
+    return DEFAULT_MODELS[dataset]
+
+
+_table_lock = threading.Lock()
+_table = {'stat': None, 'index': {}}
+
+
+# Function to load the precomputed forecast table into a (dataset, series) index
+def load_forecast_table(path=FORECAST_TABLE):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    stat = (stat.st_mtime_ns, stat.st_size)
+
+    with _table_lock:
+        if _table['stat'] == stat:
+            return _table['index']
+
+        table = pd.read_csv(path)
+        index = {}
+        for (dataset, series_key), rows in table.groupby(['dataset', 'series'], sort=False):
+            rows = rows.sort_values('step')
+            entry = {'version': rows['dataset_version'].iloc[0], 'forecast': rows['forecast'].to_numpy()}
+            if 'model' in rows:
+                entry['model'] = rows['model'].iloc[0]
+            # Tables written before the simulated bands only carry lower/upper
+            entry.update({band: rows[band].to_numpy() for band in BANDS if band in rows})
+            index[(dataset, series_key)] = entry
+        _table['stat'] = stat
+        _table['index'] = index
+        return index
+
+
+# Function to look up a precomputed forecast; None when the table is missing or stale
+def lookup_forecast(dataset, series_key, steps):
+    entry = load_forecast_table().get((dataset, series_key))
+    if entry is None or entry['version'] != dataset_version(dataset) or len(entry['forecast']) < steps:
+        return None
+    return entry
+
+
+# Function to fit model `model` to `y` and forecast `steps` months -> (steps,) values.
+# Holt-Winters models use the NumPy engine batch_forecast.py fills the table with, so a forecast
+# fitted on demand is the one the table would hold. Their fitted parameters and state are cached
+# under `version` per series, so a rerun or another horizon does not fit again.
+def fit_values(model, series_key, y, steps, version):
+    family, params = MODELS[model]
+    if family == 'holtwinters':
+        return cached_forecast(y, params, version, series_key, steps)
+    return fit_forecast(model, y, steps)[0]
+
+
+# Function to forecast `steps` months after the end of `y`, preferring the precomputed table
+def forecast_values(dataset, series_key, y, steps):
+    with span('fit', f'{dataset}/{series_key}'):
+        entry = lookup_forecast(dataset, series_key, steps)
+        if entry is not None:
+            values = entry['forecast'][:steps]
+        else:
+            values = fit_values(champion_model(dataset, series_key), series_key, y, steps, dataset_version(dataset))
+    return pd.Series(values, index=pd.RangeIndex(len(y), len(y) + steps))
+
+
+# Function to return the prediction interval bands for the first `steps` months of a forecast.
+# Bands only exist for precomputed forecasts; None when the series is not in the table.
+def forecast_bands(dataset, series_key, steps):
+    entry = lookup_forecast(dataset, series_key, steps)
+    if entry is None:
+        return None
+    return pd.DataFrame({band: entry[band][:steps] for band in BANDS if band in entry})
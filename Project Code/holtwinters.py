@@ -0,0 +1,254 @@
+# holtwinters.py
+# Vectorized Holt-Winters exponential smoothing over many aligned series at once.
+# `fit` takes a 2-D array (series x months) and runs the smoothing recursions for
+# every series and every candidate parameter set in the same NumPy pass, so a panel
+# of 30 HPI regions costs about as much as one statsmodels fit.
+#
+# The recursions follow statsmodels' ExponentialSmoothing (additive trend, additive or
+# multiplicative seasonality) exactly; given the same parameters and initial states both
+# produce the same SSE. Smoothing parameters are chosen by a batched grid search refined
+# around each series' best point, and initial states come from a heuristic (first seasons,
+# or a line through the first year) instead of being optimized as statsmodels does.
+#
+# Tolerance against statsmodels' default fit (`python benchmark.py holtwinters`): the median
+# series' in-sample SSE is within 5% and its 48-month forecast within 2% (median absolute
+# percentage difference); no series' SSE is more than 20% above statsmodels'.
+#
+# `simulate` runs the same recursions forward from the final states with random errors,
+# for every series and thousands of paths at once; batch_forecast.py turns the paths into
+# the prediction interval bands stored next to each forecast.
+import itertools
+
+import numpy as np
+
+# Smoothing parameters are searched inside (PARAM_MIN, PARAM_MAX)
+PARAM_MIN = 1e-4
+PARAM_MAX = 0.9999
+
+
+class HoltWintersResult:
+    # Fitted parameters and final smoothing state for every series in the panel
+    def __init__(self, trend, seasonal, seasonal_periods, params, state, sse, nobs):
+        self.trend = trend
+        self.seasonal = seasonal
+        self.seasonal_periods = seasonal_periods
+        self.params = params      # {'alpha', 'beta', 'gamma'} -> (S,) arrays (NaN when unused)
+        self.state = state        # {'level', 'trend', 'season', 't'} after the last observation
+        self.sse = sse            # (S,) in-sample sum of squared one-step errors
+        self.nobs = nobs
+
+    # Function to forecast `steps` months ahead for every series -> (S, steps)
+    def forecast(self, steps):
+        return forecast_state(self.state, steps, self.trend, self.seasonal, self.seasonal_periods)
+
+    # Function to simulate `n_paths` future paths for every series -> (S, n_paths, steps)
+    def simulate(self, steps, n_paths, rng=None):
+        return simulate(self.state, self.params, self.sigma(), steps, n_paths, self.trend, self.seasonal,
+                        self.seasonal_periods, rng)
+
+    # Function to return each series' one-step residual standard deviation -> (S,)
+    def sigma(self):
+        return np.sqrt(self.sse / self.nobs)
+
+    # Function to return the fitted values for a single series as plain Python types
+    def series_params(self, i):
+        return {name: float(values[i]) for name, values in self.params.items()}
+
+
+# Function to compute the initial level, trend and seasonal states for every series
+def initial_states(y, trend, seasonal, m):
+    if seasonal:
+        if y.shape[1] < 2 * m:
+            raise ValueError(f'At least {2 * m} observations are needed to initialize seasonality')
+        # Seasonal indices are averaged over up to four full seasons, each measured
+        # against that season's own mean so the underlying trend does not leak in
+        k = min(y.shape[1] // m, 4)
+        seasons = y[:, :k * m].reshape(len(y), k, m)
+        means = seasons.mean(axis=2, keepdims=True)
+        first = means[:, 0, 0]
+        level = first
+        slope = (means[:, 1, 0] - first) / m if trend else np.zeros(len(y))
+        if seasonal == 'mul':
+            season = (seasons / means).mean(axis=1)
+        else:
+            season = (seasons - means).mean(axis=1)
+    else:
+        n = min(y.shape[1], 12)
+        if trend and n > 1:
+            # Least-squares line through the first year, extrapolated back to t = 0
+            t = np.arange(1, n + 1) - (n + 1) / 2
+            head = y[:, :n] - y[:, :n].mean(axis=1, keepdims=True)
+            slope = (head * t).sum(axis=1) / (t * t).sum()
+            level = y[:, :n].mean(axis=1) - slope * (n + 1) / 2
+        else:
+            slope = np.zeros(len(y))
+            level = y[:, 0]
+        season = np.zeros((len(y), 1))
+    return level, slope, season
+
+
+# Function to compute the one-step-ahead fit from the current states -> (base, season, fitted).
+# States are (S, P) arrays (seasons (S, P, m)); `slot` is the seasonal index of the month.
+def one_step(level, slope, season, slot, trend, seasonal):
+    base = level + slope if trend else level
+    if not seasonal:
+        return base, None, base
+    s = season[:, :, slot]
+    return base, s, base * s if seasonal == 'mul' else base + s
+
+
+# Function to absorb one observation into the states -> (level, slope); seasons are updated in place
+def absorb(obs, base, s, level, slope, season, slot, alpha, beta, gamma, trend, seasonal):
+    if seasonal == 'mul':
+        new_level = alpha * (obs / s) + (1 - alpha) * base
+        season[:, :, slot] = gamma * (obs / base) + (1 - gamma) * s
+    elif seasonal == 'add':
+        new_level = alpha * (obs - s) + (1 - alpha) * base
+        season[:, :, slot] = gamma * (obs - base) + (1 - gamma) * s
+    else:
+        new_level = alpha * obs + (1 - alpha) * base
+    if trend:
+        slope = beta * (new_level - level) + (1 - beta) * slope
+    return new_level, slope
+
+
+# Function to run the smoothing recursions for every series and candidate parameter set.
+# Parameters have shape (S, P); returns the SSE (S, P) and the final states.
+# `t0` is the number of observations already absorbed into the initial states.
+def run_filter(y, alpha, beta, gamma, level0, trend0, season0, trend, seasonal, m, t0=0):
+    shape = alpha.shape
+    level = np.broadcast_to(level0[:, None], shape).copy()
+    slope = np.broadcast_to(trend0[:, None], shape).copy()
+    season = np.broadcast_to(season0[:, None, :], shape + (season0.shape[1],)).copy()
+    sse = np.zeros(shape)
+
+    for t in range(y.shape[1]):
+        obs = y[:, t, None]
+        slot = (t0 + t) % m
+        base, s, fitted = one_step(level, slope, season, slot, trend, seasonal)
+        error = obs - fitted
+        sse += error * error
+        level, slope = absorb(obs, base, s, level, slope, season, slot, alpha, beta, gamma, trend, seasonal)
+
+    return sse, level, slope, season
+
+
+# Function to absorb new observations into fitted states without re-estimating parameters.
+# `y_new` is (S, n) with the months that followed the end of the fitted data.
+# Returns the updated state and the SSE of the new one-step errors (S,).
+def update_state(state, params, y_new, trend, seasonal, m):
+    y_new = np.asarray(y_new, dtype=float)
+    if y_new.ndim == 1:
+        y_new = y_new[None, :]
+    n_series = len(y_new)
+    alpha = np.asarray(params['alpha'], dtype=float).reshape(n_series, 1)
+    beta = np.nan_to_num(np.asarray(params['beta'], dtype=float)).reshape(n_series, 1)
+    gamma = np.nan_to_num(np.asarray(params['gamma'], dtype=float)).reshape(n_series, 1)
+
+    sse, level, slope, season = run_filter(
+        y_new, alpha, beta, gamma,
+        np.asarray(state['level'], dtype=float).reshape(n_series),
+        np.asarray(state['trend'], dtype=float).reshape(n_series),
+        np.asarray(state['season'], dtype=float).reshape(n_series, -1),
+        trend, seasonal, m, t0=state['t'])
+    new_state = {'level': level[:, 0], 'trend': slope[:, 0], 'season': season[:, 0, :],
+                 't': state['t'] + y_new.shape[1]}
+    return new_state, sse[:, 0]
+
+
+# Function to forecast from a final smoothing state -> (S, steps)
+def forecast_state(state, steps, trend, seasonal, m):
+    h = np.arange(1, steps + 1)
+    base = state['level'][:, None] + (state['trend'][:, None] * h if trend else np.zeros(steps))
+    if not seasonal:
+        return base
+    season = state['season'][:, (state['t'] + h - 1) % m]
+    return base * season if seasonal == 'mul' else base + season
+
+
+# Function to simulate future paths from a final smoothing state -> (S, n_paths, steps).
+# Each path draws additive normal errors with the series' one-step standard deviation
+# `sigma` (S,) and feeds every simulated month back through the smoothing recursions, so
+# the spread grows the way the fitted model propagates shocks. All series and paths move
+# forward together, one NumPy step per month; no Python loop runs per path.
+def simulate(state, params, sigma, steps, n_paths, trend, seasonal, m, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    n_series = len(state['level'])
+    alpha = np.asarray(params['alpha'], dtype=float).reshape(n_series, 1)
+    beta = np.nan_to_num(np.asarray(params['beta'], dtype=float)).reshape(n_series, 1)
+    gamma = np.nan_to_num(np.asarray(params['gamma'], dtype=float)).reshape(n_series, 1)
+    sigma = np.asarray(sigma, dtype=float).reshape(n_series, 1)
+
+    # Paths play the role of candidate parameter sets in run_filter: (S, n_paths) states
+    shape = (n_series, n_paths)
+    level = np.broadcast_to(np.asarray(state['level'], dtype=float).reshape(n_series, 1), shape).copy()
+    slope = np.broadcast_to(np.asarray(state['trend'], dtype=float).reshape(n_series, 1), shape).copy()
+    season0 = np.asarray(state['season'], dtype=float).reshape(n_series, -1)
+    season = np.broadcast_to(season0[:, None, :], shape + (season0.shape[1],)).copy()
+
+    errors = rng.standard_normal((steps,) + shape)
+    paths = np.empty(shape + (steps,))
+    for h in range(steps):
+        slot = (state['t'] + h) % m
+        base, s, fitted = one_step(level, slope, season, slot, trend, seasonal)
+        obs = fitted + sigma * errors[h]
+        paths[:, :, h] = obs
+        level, slope = absorb(obs, base, s, level, slope, season, slot, alpha, beta, gamma, trend, seasonal)
+    return paths
+
+
+# Function to fit Holt-Winters models to every row of `y` (series x months).
+# `trend` is None or 'add'; `seasonal` is None, 'add' or 'mul'.
+def fit(y, trend=None, seasonal=None, seasonal_periods=12, grid=5, rounds=5):
+    y = np.asarray(y, dtype=float)
+    if y.ndim == 1:
+        y = y[None, :]
+    if not np.all(np.isfinite(y)):
+        raise ValueError('Series must not contain missing values')
+    if seasonal == 'mul' and np.any(y <= 0):
+        raise ValueError('Multiplicative seasonality requires strictly positive data')
+
+    m = seasonal_periods if seasonal else 1
+    n_series = len(y)
+    level0, trend0, season0 = initial_states(y, trend, seasonal, m)
+
+    # Only the smoothing parameters the model uses are searched
+    active = ['alpha'] + (['beta'] if trend else []) + (['gamma'] if seasonal else [])
+    centre = {name: np.full(n_series, 0.5) for name in active}
+    spacing = 0.5
+    offsets = np.array(list(itertools.product(np.linspace(-1, 1, grid), repeat=len(active))))
+
+    best_sse = np.full(n_series, np.inf)
+    best = {name: centre[name].copy() for name in active}
+    for _ in range(rounds):
+        # Candidate grid around each series' current best point -> (S, P) per parameter
+        candidates = {name: np.clip(centre[name][:, None] + spacing * offsets[:, i],
+                                    PARAM_MIN, PARAM_MAX)
+                      for i, name in enumerate(active)}
+        alpha = candidates['alpha']
+        beta = candidates.get('beta', np.zeros_like(alpha))
+        gamma = candidates.get('gamma', np.zeros_like(alpha))
+
+        with np.errstate(all='ignore'):
+            sse = run_filter(y, alpha, beta, gamma, level0, trend0, season0, trend, seasonal, m)[0]
+        sse = np.where(np.isfinite(sse), sse, np.inf)
+
+        choice = sse.argmin(axis=1)
+        rows = np.arange(n_series)
+        improved = sse[rows, choice] < best_sse
+        best_sse = np.where(improved, sse[rows, choice], best_sse)
+        for name in active:
+            best[name] = np.where(improved, candidates[name][rows, choice], best[name])
+            centre[name] = best[name]
+        spacing /= (grid - 1) / 2
+
+    alpha = best['alpha'][:, None]
+    beta = best.get('beta', np.zeros(n_series))[:, None]
+    gamma = best.get('gamma', np.zeros(n_series))[:, None]
+    sse, level, slope, season = run_filter(y, alpha, beta, gamma, level0, trend0, season0,
+                                           trend, seasonal, m)
+
+    nan = np.full(n_series, np.nan)
+    params = {'alpha': best['alpha'], 'beta': best.get('beta', nan), 'gamma': best.get('gamma', nan)}
+    state = {'level': level[:, 0], 'trend': slope[:, 0], 'season': season[:, 0, :], 't': y.shape[1]}
+    return HoltWintersResult(trend, seasonal, m, params, state, sse[:, 0], y.shape[1])
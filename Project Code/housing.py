@@ -1,55 +1,24 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from matplotlib.figure import Figure
 from io import BytesIO
+from data_store import get_dataset, dataset_version
+from forecasting import hpi_series, forecast_bands
+from forecast_pool import forecast_pool, page_forecast
+from chart_cache import cached_chart
+from client_charts import line_chart
+from rollups import get_rollup
+from housing_projections import get_projections
+from panels import get_panel
+from instrumentation import render_timer, span
 
 def load_housing_data():
-    try:
-        housing_df = pd.read_csv('housing.csv', encoding='utf-8')
-    except UnicodeDecodeError:
-        try:
-            housing_df = pd.read_csv('housing.csv', encoding='latin1')
-        except UnicodeDecodeError:
-            housing_df = pd.read_csv('housing.csv', encoding='ISO-8859-1')
-
-    # Handle Price column conversion
-    if housing_df['Price'].dtype == 'object':
-        # Remove commas and convert to numeric
-        housing_df['Price'] = pd.to_numeric(housing_df['Price'].str.replace(',', ''), errors='coerce')
-    else:
-        # Ensure Price is numeric
-        housing_df['Price'] = pd.to_numeric(housing_df['Price'], errors='coerce')
-    
-    # Fill or drop missing values as needed
-    housing_df['Price'].fillna(housing_df['Price'].mean(), inplace=True)
-    
-    return housing_df
+    # Cleaned housing.csv from the shared dataset registry (parsed once per process)
+    return get_dataset('housing')
 
 def load_and_preprocess_data():
-    # Load the data, ignoring the first unnamed column if present
-    hpi_df = pd.read_csv('hpi.csv', encoding='latin1', index_col=0)
-
-    # Remove leading and trailing spaces from column names
-    hpi_df.columns = hpi_df.columns.str.strip()
-
-    # Convert 'Month-year' to datetime and set as index
-    hpi_df['Month-year'] = pd.to_datetime(hpi_df['Month-year'], format='%b-%y')
-    hpi_df.set_index('Month-year', inplace=True)
-
-    # Filter out rows where the year is less than 1995
-    hpi_df = hpi_df[hpi_df.index.year >= 1995]
-
-    # Drop the unnecessary columns
-    hpi_df.drop(columns=['Type', 'Canada', 'year', 'month'], inplace=True)
-
-    # Sort data by date
-    hpi_df.sort_index(inplace=True)
-
-    # Handle missing data
-    hpi_df = hpi_df.ffill().bfill()
-
-    return hpi_df
+    # Region x month HPI from the cleaned hpi.csv, built once per dataset version
+    return get_panel('hpi')
 
 def calculate_base_price(current_price, current_hpi):
     base_price = (current_price * 100) / current_hpi
@@ -79,159 +48,153 @@ def predict_price(housing_df, city, num_beds, num_baths, province, forecasted_hp
     
     return current_price, forecasted_price
 
-def plot_hpi(region, data, forecast_dates=None, forecast=None):
-    data_resampled = data.resample('M').mean()
+def plot_hpi(region, data, forecast_dates=None, forecast=None, bands=None):
+    # `data` is the region's monthly HPI (month ends, from Panel.resample)
+    lines = [(f'{region} HPI', data.index, data.values, {'color': 'blue', 'width': 2})]
+    fan = None
 
-    plt.figure(figsize=(14, 8))
-    plt.plot(data_resampled.index, data_resampled, label=f'{region} HPI', color='blue', linewidth=2)
-    
     if forecast_dates is not None and forecast is not None:
         forecast_resampled = forecast.resample('M').mean()
-        plt.plot(forecast_resampled.index, forecast_resampled, label='Forecast', color='red', linestyle='--', linewidth=2)
-    
-    plt.title(f'Housing Price Index (HPI) for {region}')
-    plt.xlabel('Date')
-    plt.ylabel('HPI')
-    plt.legend(loc='upper left')
-    #plt.grid(True)
-
-    buf = BytesIO()
-    plt.savefig(buf, format='png', bbox_inches='tight')
-    #fig.savefig(buf, format='png', bbox_inches='tight')
-    buf.seek(0)
-    
-    return buf
+        lines.append(('Forecast', forecast_resampled.index, forecast_resampled.values,
+                      {'color': 'red', 'dash': True, 'width': 2}))
+        if bands is not None:
+            fan = (forecast_dates, bands)
 
-def forecast_hpi(hpi_df, region, start_date, end_date):
-    hpi_df.columns = hpi_df.columns.str.strip()
-    
-    matching_columns = [col for col in hpi_df.columns if region in col]
+    # Drawn in the browser from downsampled series; zooming in fetches the finer detail
+    line_chart('housing/plot_hpi', lines, title=f'Housing Price Index (HPI) for {region}', y_title='HPI', bands=fan)
+
+def forecast_hpi(hpi_panel, region, start_date, end_date):
+    # Every HPI region whose name contains the selected one
+    matching_columns = hpi_panel.match(region)
     
     if len(matching_columns) == 1:
         column_name = matching_columns[0]
-        data = hpi_df[column_name]
+        data = hpi_series(hpi_panel, column_name)
     elif len(matching_columns) > 1:
         st.error(f"Multiple columns found for region '{region}'. Please specify more precisely.")
         st.write(f"Matching columns: {', '.join(matching_columns)}")
-        return None, None
+        return None, None, None
     else:
-        st.error(f"Region '{region}' not found in the data. Available regions are: {', '.join(hpi_df.columns)}")
-        return None, None
-
-    model = ExponentialSmoothing(data, trend='add', seasonal=None, seasonal_periods=12)
-    fit = model.fit()
+        st.error(f"Region '{region}' not found in the data. Available regions are: {', '.join(hpi_panel.regions)}")
+        return None, None, None
 
     future_dates = pd.date_range(start=start_date, end=end_date, freq='M')
     
-    forecast = fit.predict(start=len(data), end=len(data) + len(future_dates) - 1)
+    # Precomputed by batch_forecast.py, or fitted by a forecast worker once per region and dataset version
+    forecast = page_forecast('hpi', column_name, data, len(future_dates))
     
     forecast_series = pd.Series(forecast.values, index=future_dates)
+    # Simulated prediction intervals for the fan chart (None when the forecast was fitted on demand)
+    bands = forecast_bands('hpi', column_name, len(future_dates))
     
-    return future_dates, forecast_series
+    return future_dates, forecast_series, bands
 
-def plot_regional_hpi(hpi_df, year, month):
+def plot_regional_hpi(hpi_panel, year, month):
     start_date = pd.to_datetime(f'{year}-{month}-01')
-    end_date = pd.to_datetime(start_date + pd.DateOffset(months=1) - pd.DateOffset(days=1))
-    
-    filtered_df = hpi_df.loc[start_date:end_date]
 
-    filtered_df = filtered_df.apply(pd.to_numeric, errors='coerce')
+    def draw():
+        # Monthly means per region come from the precomputed rollup of hpi.csv
+        regions, values = get_rollup('hpi').lookup(start_date.year, start_date.month)
+        avg_hpi_per_region = pd.Series(values, index=regions)
 
-    avg_hpi_per_region = filtered_df.mean()
+        fig = Figure(figsize=(17, 17))
+        ax = fig.subplots()
+        avg_hpi_per_region.plot(kind='bar', color='pink', ax=ax)
+        ax.set_title(f'Average HPI for All Regions in {start_date.strftime("%B %Y")}')
+        ax.set_xlabel('Region')
+        ax.set_ylabel('Average HPI')
+        ax.tick_params(axis='x', labelrotation=90)
+        #ax.grid(True)
+        return fig
 
-    plt.figure(figsize=(17, 17))
-    avg_hpi_per_region.plot(kind='bar', color='pink')
-    plt.title(f'Average HPI for All Regions in {start_date.strftime("%B %Y")}')
-    plt.xlabel('Region')
-    plt.ylabel('Average HPI')
-    plt.xticks(rotation=90)
-    #plt.grid(True)
-
-    buf = BytesIO()
-    plt.savefig(buf, format='png',bbox_inches='tight')
-    buf.seek(0)
-    return buf
+    state = {'year': year, 'month': month}
+    return BytesIO(cached_chart('housing/plot_regional_hpi', state, dataset_version('hpi'), draw, dpi=100))
 
 def housing_dashboard():
     st.sidebar.title("Navigation")
-    page = st.sidebar.selectbox("Go to", ["Home", "Housing Price Trend", "Regional Housing Analysis", "Housing Price Prediction"])
-
-    hpi_df = load_and_preprocess_data()
-    housing_df = load_housing_data()
-
-    if page == "Home":
-        st.markdown("""
-        <div style='font-size:36px; font-weight:bold;'>Welcome to the Housing Price Analysis Dashboard</div>
-        """, unsafe_allow_html=True)
-        st.write("Use the navigation menu to explore different analyses and visualizations of Canadian housing prices.")
-        st.image('static/housing.jpg', use_column_width=True)
-
-    elif page == "Housing Price Trend":
-        st.markdown("<div class='subtitle'>Housing Price Trend Analysis</div>", unsafe_allow_html=True)
+    page = st.sidebar.selectbox("Go to", ["Home", "Housing Price Trend", "Regional Housing Analysis", "Housing Price Prediction",
+                                          "HPI Forecasting"])
+
+    with span('load', 'hpi'):
+        hpi_panel = load_and_preprocess_data()
+    with span('load', 'housing'):
+        housing_df = load_housing_data()
+    # Forecast workers start in the background while the user picks a page
+    forecast_pool.start()
+
+    with render_timer(f"Housing: {page}"):
+        if page == "Home":
+            st.markdown("""
+            <div style='font-size:36px; font-weight:bold;'>Welcome to the Housing Price Analysis Dashboard</div>
+            """, unsafe_allow_html=True)
+            st.write("Use the navigation menu to explore different analyses and visualizations of Canadian housing prices.")
+            st.image('static/housing.jpg', use_column_width=True)
+
+        elif page == "Housing Price Trend":
+            st.markdown("<div class='subtitle'>Housing Price Trend Analysis</div>", unsafe_allow_html=True)
         
-        regions = hpi_df.columns.tolist()
-        selected_region = st.selectbox("Select Region", regions)
+            regions = hpi_panel.regions.tolist()
+            selected_region = st.selectbox("Select Region", regions)
         
-        buf = plot_hpi(region=selected_region, data=hpi_df[selected_region])
-        st.image(buf, use_column_width=True)
+            plot_hpi(region=selected_region, data=hpi_panel.resample('M')[selected_region])
 
-    elif page == "Regional Housing Analysis":
-        st.markdown("<div class='subtitle'>Regional Housing Analysis</div>", unsafe_allow_html=True)
+        elif page == "Regional Housing Analysis":
+            st.markdown("<div class='subtitle'>Regional Housing Analysis</div>", unsafe_allow_html=True)
         
-        forecast_year = st.slider("Select Year", min_value=1995, max_value=2023, value=2020)
-        forecast_month = st.selectbox("Select Month", pd.date_range(start='2023-01-01', periods=12, freq='M').strftime('%B').tolist())
+            forecast_year = st.slider("Select Year", min_value=1995, max_value=2023, value=2020)
+            forecast_month = st.selectbox("Select Month", pd.date_range(start='2023-01-01', periods=12, freq='M').strftime('%B').tolist())
 
-        buf = plot_regional_hpi(hpi_df, forecast_year, forecast_month)
-        if buf:
-            st.image(buf, use_column_width=True)
+            buf = plot_regional_hpi(hpi_panel, forecast_year, forecast_month)
+            if buf:
+                st.image(buf, use_column_width=True)
 
-    elif page == "Housing Price Prediction":
-        st.markdown("<div class='subtitle'>Housing Price Prediction</div>", unsafe_allow_html=True)
+        elif page == "Housing Price Prediction":
+            st.markdown("<div class='subtitle'>Housing Price Prediction</div>", unsafe_allow_html=True)
 
-        cities = housing_df['City'].unique().tolist()
-        selected_city = st.selectbox("Select City", cities)
+            cities = housing_df['City'].unique().tolist()
+            selected_city = st.selectbox("Select City", cities)
         
-        num_beds = st.slider("Select Number of Beds", min_value=int(housing_df['Number_Beds'].min()), max_value=5, value=int(housing_df['Number_Beds'].mean()))
-        num_baths = st.slider("Select Number of Baths", min_value=int(housing_df['Number_Baths'].min()), max_value=5, value=int(housing_df['Number_Baths'].mean()))
-        provinces = housing_df['Province'].unique().tolist()
-        selected_province = st.selectbox("Select Province", provinces)
+            num_beds = st.slider("Select Number of Beds", min_value=int(housing_df['Number_Beds'].min()), max_value=5, value=int(housing_df['Number_Beds'].mean()))
+            num_baths = st.slider("Select Number of Baths", min_value=int(housing_df['Number_Baths'].min()), max_value=5, value=int(housing_df['Number_Baths'].mean()))
+            provinces = housing_df['Province'].unique().tolist()
+            selected_province = st.selectbox("Select Province", provinces)
 
-        forecast_year = st.slider("Select Forecast Year", min_value=2024, max_value=2027, value=2025)
-        forecast_month = st.selectbox("Select Forecast Month", pd.date_range(start='2024-01-01', periods=12, freq='M').strftime('%B').tolist())
+            forecast_year = st.slider("Select Forecast Year", min_value=2024, max_value=2027, value=2025)
+            forecast_month = st.selectbox("Select Forecast Month", pd.date_range(start='2024-01-01', periods=12, freq='M').strftime('%B').tolist())
         
-        start_date = pd.to_datetime(f'{forecast_year}-{forecast_month}-01')
-        end_date = pd.to_datetime(f'{forecast_year + 3}-12-31')
-
-        forecast_dates, forecast_series = forecast_hpi(hpi_df, selected_city, start_date, end_date)
-
-        if forecast_dates is not None and forecast_series is not None:
-            current_price, forecasted_price = predict_price(housing_df, selected_city, num_beds, num_baths, selected_province, forecast_series.iloc[-1])
-
-            if current_price is not None and forecasted_price is not None:
-                st.write(f"Current average price in {selected_city} with {num_beds} beds and {num_baths} baths: ${current_price:.2f}")
-                st.write(f"Forecasted HPI: {forecast_series.iloc[-1]:.2f}")  # Added back this line
-                st.write(f"Predicted price based on forecasted HPI: ${forecasted_price:.2f}")
-
-            else:
+            # Group prices and HPI forecasts are precomputed, so this is a single lookup
+            with span('fit', 'housing projections'):
+                projection = get_projections().predict(selected_city, num_beds, num_baths, selected_province,
+                                                       forecast_year, forecast_month)
+
+            if projection['status'] == 'unknown_region':
+                st.error(f"Region '{selected_city}' not found in the data. Available regions are: {', '.join(hpi_panel.regions)}")
+            elif projection['status'] == 'ambiguous_region':
+                st.error(f"Multiple columns found for region '{selected_city}'. Please specify more precisely.")
+                st.write(f"Matching columns: {', '.join(projection['columns'])}")
+            elif projection['status'] == 'no_listings':
                 st.error("No data available for the selected criteria.")
+            else:
+                st.write(f"Current average price in {selected_city} with {num_beds} beds and {num_baths} baths: ${projection['current_price']:.2f}")
+                st.write(f"Forecasted HPI: {projection['forecast_hpi']:.2f}")  # Added back this line
+                st.write(f"Predicted price based on forecasted HPI: ${projection['predicted_price']:.2f}")
 
-    elif page == "HPI Forecasting":
-        st.markdown("<div class='subtitle'>HPI Forecasting</div>", unsafe_allow_html=True)
+        elif page == "HPI Forecasting":
+            st.markdown("<div class='subtitle'>HPI Forecasting</div>", unsafe_allow_html=True)
         
-        regions = hpi_df.columns.tolist()
-        selected_region = st.selectbox("Select Region", regions)
+            regions = hpi_panel.regions.tolist()
+            selected_region = st.selectbox("Select Region", regions)
         
-        forecast_year = st.slider("Select Forecast Year", min_value=2024, max_value=2027, value=2025)
-        start_date = pd.to_datetime(f'{forecast_year}-01-01')
-        end_date = pd.to_datetime(f'{forecast_year + 3}-12-31')
+            forecast_year = st.slider("Select Forecast Year", min_value=2024, max_value=2027, value=2025)
+            start_date = pd.to_datetime(f'{forecast_year}-01-01')
+            end_date = pd.to_datetime(f'{forecast_year + 3}-12-31')
 
-        forecast_dates, forecast_series = forecast_hpi(hpi_df, selected_region, start_date, end_date)
+            forecast_dates, forecast_series, bands = forecast_hpi(hpi_panel, selected_region, start_date, end_date)
         
-        if forecast_dates is not None and forecast_series is not None:
-            buf = plot_hpi(region=selected_region, data=hpi_df[selected_region], forecast_dates=forecast_dates, forecast=forecast_series)
-            st.image(buf, use_column_width=True)
-        else:
-            st.error("No forecast could be generated for the selected region.")
+            if forecast_dates is not None and forecast_series is not None:
+                plot_hpi(region=selected_region, data=hpi_panel.resample('M')[selected_region], forecast_dates=forecast_dates, forecast=forecast_series, bands=bands)
+            else:
+                st.error("No forecast could be generated for the selected region.")
 
 if __name__ == "__main__":
     housing_dashboard()
@@ -0,0 +1,172 @@
+# housing_projections.py
+# Precomputed housing price projections for the Housing Price Prediction page.
+# The page used to filter the listings with four boolean masks and forecast the city's
+# HPI region on every interaction. Here the listings are averaged once per
+# (Province, City, Number_Beds, Number_Baths) and every city's HPI region is forecast
+# once for the whole horizon, so a prediction is one dictionary lookup and one index.
+# Both tables are rebuilt when housing.csv or hpi.csv change.
+#
+# The full market (every group x every year and month the page offers) can be written
+# as one Parquet file:
+#
+#   python housing_projections.py [--parquet cache/housing_projections.parquet]
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_store import dataset_version, get_dataset
+from forecast_pool import page_forecasts
+from forecasting import MAX_STEPS, hpi_series
+from panels import get_panel
+
+GROUP_COLUMNS = ['Province', 'City', 'Number_Beds', 'Number_Baths']
+# Forecast years offered by the page's slider
+YEARS = range(2024, 2028)
+MONTHS = pd.date_range(start='2024-01-01', periods=12, freq='M').strftime('%B').tolist()
+
+PROJECTIONS_PARQUET = os.path.join('cache', 'housing_projections.parquet')
+
+
+# Function to count the forecast steps the page uses for a start month.
+# The page forecasts the month ends from `year-month` to December of `year + 3` and reads
+# the last value, i.e. len(pd.date_range(f'{year}-{month}-01', f'{year + 3}-12-31', freq='M')).
+def forecast_step(year, month):
+    # The rest of the start year plus three full years; the same for every start year
+    return (12 - month + 1) + 3 * 12
+
+
+# Function to turn a month name ("March") or number into 1..12
+def month_number(month):
+    if isinstance(month, str):
+        return MONTHS.index(month) + 1
+    return int(month)
+
+
+class Projections:
+    def __init__(self, groups, listings, prices, city_columns, columns, forecasts):
+        self.groups = groups              # (G,) (province, city, beds, baths) tuples, sorted
+        self.listings = listings          # (G,) number of listings per group
+        self.prices = prices              # (G,) mean listing price per group
+        self.city_columns = city_columns  # city -> HPI columns whose name contains the city
+        self.columns = columns            # (K,) HPI columns forecast
+        self.forecasts = forecasts        # (K, MAX_STEPS) HPI forecast, one step ahead first
+        self._group_pos = {group: i for i, group in enumerate(groups)}
+        self._column_pos = {column: i for i, column in enumerate(columns)}
+
+    # Function to return (mean price, listings) for a group, or None when nothing is listed
+    def current_price(self, province, city, beds, baths):
+        i = self._group_pos.get((province, city, int(beds), int(baths)))
+        if i is None:
+            return None
+        return float(self.prices[i]), int(self.listings[i])
+
+    # Function to predict a listing price the way the prediction page does.
+    # `status` is 'ok', 'unknown_region', 'ambiguous_region' (see 'columns') or 'no_listings'.
+    def predict(self, city, beds, baths, province, year, month):
+        columns = self.city_columns.get(city, [])
+        if not columns:
+            return {'status': 'unknown_region', 'columns': []}
+        if len(columns) > 1:
+            return {'status': 'ambiguous_region', 'columns': columns}
+
+        step = forecast_step(int(year), month_number(month))
+        forecast_hpi = float(self.forecasts[self._column_pos[columns[0]], step - 1])
+        result = {'status': 'ok', 'column': columns[0], 'forecast_hpi': forecast_hpi}
+        current = self.current_price(province, city, beds, baths)
+        if current is None:
+            return {**result, 'status': 'no_listings'}
+
+        # The base price is the price at HPI 100, scaled by the forecast HPI
+        current_price, listings = current
+        return {**result, 'current_price': current_price, 'listings': listings,
+                'predicted_price': current_price * forecast_hpi / 100}
+
+    # Function to list every group for every year and month the page offers, as one frame
+    def frame(self):
+        keys = pd.DataFrame(self.groups, columns=GROUP_COLUMNS)
+        dates = [(year, month) for year in YEARS for month in range(1, 13)]
+        steps = np.array([forecast_step(year, month) for year, month in dates])
+
+        # HPI column per group; -1 where the city matches no column or several
+        column_codes = np.array([self._column_pos[columns[0]] if len(columns) == 1 else -1
+                                 for columns in (self.city_columns.get(city, []) for city in keys['City'])],
+                                dtype=np.int64)
+        forecasts = np.vstack([self.forecasts, np.full((1, self.forecasts.shape[1]), np.nan)])
+        # (G, D) forecast HPI of every group at every date; row -1 is the NaN row
+        hpi = forecasts[column_codes][:, steps - 1]
+
+        repeat = len(dates)
+        frame = keys.loc[keys.index.repeat(repeat)].reset_index(drop=True)
+        frame['listings'] = np.repeat(self.listings, repeat)
+        frame['current_price'] = np.repeat(self.prices, repeat)
+        frame['hpi_region'] = np.repeat(np.append(np.asarray(self.columns, dtype=object), None)[column_codes], repeat)
+        frame['year'] = np.tile([year for year, _ in dates], len(keys))
+        frame['month'] = np.tile([month for _, month in dates], len(keys))
+        frame['forecast_hpi'] = hpi.ravel()
+        frame['predicted_price'] = frame['current_price'] * frame['forecast_hpi'] / 100
+        return frame
+
+
+# Function to build the projections from the listings and the HPI panel
+def build_projections(housing_df, hpi_panel):
+    grouped = housing_df.groupby(GROUP_COLUMNS, sort=True)['Price'].agg(['mean', 'size'])
+    groups = [(province, city, int(beds), int(baths)) for province, city, beds, baths in grouped.index]
+
+    # Same matching as forecast_hpi: every HPI region whose name contains the city
+    city_columns = {city: hpi_panel.match(city)
+                    for city in grouped.index.get_level_values('City').unique()}
+    columns = sorted({columns[0] for columns in city_columns.values() if len(columns) == 1})
+    # Regions missing from the forecast table are fitted in the worker pool together
+    values = page_forecasts('hpi', {column: hpi_series(hpi_panel, column) for column in columns}, MAX_STEPS)
+    forecasts = np.empty((len(columns), MAX_STEPS))
+    for i, column in enumerate(columns):
+        forecasts[i] = values[column]
+
+    return Projections(groups, grouped['size'].to_numpy(), grouped['mean'].to_numpy(), city_columns,
+                       columns, forecasts)
+
+
+_lock = threading.Lock()
+_current = {'versions': None, 'projections': None}
+
+
+# Function to return the projections, rebuilt when the listings or the HPI table change
+def get_projections():
+    versions = (dataset_version('housing'), dataset_version('hpi'))
+    with _lock:
+        if _current['versions'] == versions:
+            return _current['projections']
+
+    projections = build_projections(get_dataset('housing'), get_panel('hpi'))
+    with _lock:
+        _current['versions'] = versions
+        _current['projections'] = projections
+    return projections
+
+
+# Function to write every projection to one Parquet file (needs pyarrow)
+def export_parquet(path=PROJECTIONS_PARQUET, projections=None):
+    projections = projections if projections is not None else get_projections()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    frame = projections.frame()
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    frame.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return frame
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Project every housing group price through 2027')
+    parser.add_argument('--parquet', default=PROJECTIONS_PARQUET)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    projections = get_projections()
+    built = time.perf_counter() - start
+    frame = export_parquet(args.parquet, projections)
+    print(f'{len(projections.groups)} groups, {len(projections.columns)} HPI regions: built in {built:.2f}s, '
+          f'{len(frame)} projections written to {args.parquet} in {time.perf_counter() - start:.2f}s')
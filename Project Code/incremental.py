@@ -0,0 +1,152 @@
+# incremental.py
+# Incremental ingest for the monthly StatCan files (Oil.csv and Wage.csv).
+# When new months are appended to a source file only the appended rows are parsed and
+# cleaned (DatasetRegistry.ingest), and each series' saved Holt-Winters state is carried
+# forward over the new months instead of refitting the model from scratch.
+#
+#   python incremental.py [--table cache/forecast_table.csv]
+#
+# Run batch_forecast.py once first; it writes the table and the fitted states this job
+# continues from. A series is refit when its earlier values changed, it has no saved state,
+# or its champion model changed since the state was saved.
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import holtwinters
+from batch_forecast import (N_PATHS, SIMULATION_SEED, forecast_rows, load_model_states, model_record,
+                            save_model_states, states_path, write_table)
+from data_store import APPENDABLE, registry
+from forecast_cache import values_hash
+from forecasting import FORECAST_TABLE, champion_model, forecast_steps, oil_series, wage_series
+from models import DEFAULT_MODELS, MODELS, fit_forecast
+from panels import get_panel
+
+# Function preparing each series of an appendable dataset from its panel
+SERIES = {
+    'oil': oil_series,
+    'wage': wage_series,
+}
+
+
+# Function to turn one series' saved state into the panel form used by holtwinters
+def panel_state(state):
+    return {'level': np.array([state['level']]), 'trend': np.array([state['trend']]),
+            'season': np.asarray(state['season'])[None, :], 't': state['t']}
+
+
+# Function to bring one series' model up to date -> (mode, model record, forecast, simulated paths).
+# The record is None for models without a smoothing state, which are refit every time.
+def update_series(dataset, series_key, y, record):
+    model = champion_model(dataset, series_key)
+    family, spec = MODELS[model]
+    steps = forecast_steps(y.index.max())
+    if family != 'holtwinters':
+        forecast, paths = fit_forecast(model, y, steps, N_PATHS, np.random.default_rng(SIMULATION_SEED))
+        return 'refit', None, forecast, paths
+
+    trend, seasonal = spec.get('trend'), spec.get('seasonal')
+    # States saved before the champion registry existed belong to the dataset default
+    if record is not None and record.get('model', DEFAULT_MODELS[dataset]) != model:
+        record = None
+    nobs = record['nobs'] if record is not None else None
+
+    if nobs is not None and nobs <= len(y) and values_hash(y.iloc[:nobs]) == record['checksum']:
+        state, sse, mode = panel_state(record['state']), record['sse'], 'unchanged'
+        if nobs < len(y):
+            # Continue the smoothing over the new months with the fitted parameters
+            state, sse_delta = holtwinters.update_state(state, record['params'], y.to_numpy(dtype=float)[nobs:],
+                                                        trend, seasonal, state['season'].shape[1])
+            sse, mode = sse + float(sse_delta[0]), 'warm'
+        record = {**record, 'nobs': len(y), 'sse': sse, 'last_date': y.index.max(), 'checksum': values_hash(y),
+                  'state': {'level': float(state['level'][0]), 'trend': float(state['trend'][0]),
+                            'season': state['season'][0].copy(), 't': state['t']}}
+    else:
+        result = holtwinters.fit(y.to_numpy(dtype=float), **spec)
+        mode, record = 'refit', model_record(model, result, 0, y, result.sse[0])
+
+    state = panel_state(record['state'])
+    m = state['season'].shape[1]
+    forecast = holtwinters.forecast_state(state, steps, trend, seasonal, m)[0]
+    params = {name: np.array([value]) for name, value in record['params'].items()}
+    paths = holtwinters.simulate(state, params, np.sqrt([record['sse'] / record['nobs']]), steps, N_PATHS,
+                                 trend, seasonal, m, np.random.default_rng(SIMULATION_SEED))[0]
+    return mode, record, forecast, paths
+
+
+# Function to ingest new rows and update the forecasts of every series they touch
+def run(table_path=FORECAST_TABLE):
+    start = time.perf_counter()
+    if not os.path.exists(table_path):
+        raise FileNotFoundError(f'{table_path} not found; run batch_forecast.py first')
+    table = pd.read_csv(table_path)
+    states_file = states_path(table_path)
+    states = load_model_states(states_file)
+
+    ingested = {name: registry.ingest(name) for name in APPENDABLE}
+    # A dataset needs work when the table was built from an older version of it
+    stale = [name for name, info in ingested.items()
+             if (table.loc[table['dataset'] == name, 'dataset_version'] != info['version']).any()]
+
+    frames, series, failures = [], [], []
+    for dataset in stale:
+        version = ingested[dataset]['version']
+        panel = get_panel(dataset)
+        prepare = SERIES[dataset]
+        old = table[table['dataset'] == dataset]
+        for series_key in panel.regions:
+            try:
+                y = prepare(panel, series_key)
+                mode, record, forecast, paths = update_series(dataset, series_key, y,
+                                                              states.get((dataset, series_key)))
+                rows = forecast_rows(dataset, series_key, version, champion_model(dataset, series_key), y,
+                                     forecast, paths)
+            except Exception as exc:
+                failures.append({'dataset': dataset, 'series': series_key, 'error': f'{type(exc).__name__}: {exc}'})
+                continue
+            if record is not None:
+                states[(dataset, series_key)] = record
+            else:
+                states.pop((dataset, series_key), None)
+            frames.append(rows)
+
+            previous = old.loc[old['series'] == series_key, 'forecast'].to_numpy()
+            changed = len(previous) != len(rows) or not np.allclose(previous, rows['forecast'].to_numpy())
+            series.append({'dataset': dataset, 'series': series_key, 'mode': mode, 'forecast_changed': changed})
+
+    if stale:
+        # Rows of the other datasets are kept as they are
+        kept = table[~table['dataset'].isin(stale)]
+        write_table(pd.concat([kept] + frames, ignore_index=True), table_path)
+        save_model_states(states, states_file)
+
+    return {
+        'table': table_path,
+        'datasets': ingested,
+        'updated': stale,
+        'series': series,
+        'failures': failures,
+        'total_seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ingest appended months and warm-update the forecasts')
+    parser.add_argument('--table', default=FORECAST_TABLE)
+    args = parser.parse_args()
+
+    report = run(args.table)
+    for name, info in report['datasets'].items():
+        print(f"{name}: {info['mode']}, {info['rows_added']} rows added (version {info['version']})")
+    for item in report['series']:
+        if item['forecast_changed']:
+            print(f"  forecast changed: {item['dataset']}/{item['series']} ({item['mode']})")
+    unchanged = sum(not item['forecast_changed'] for item in report['series'])
+    if unchanged:
+        print(f"  {unchanged} series with unchanged forecasts")
+    for failure in report['failures']:
+        print(f"  failed: {failure['dataset']}/{failure['series']}: {failure['error']}")
+    print(f"Done in {report['total_seconds']}s -> {report['table']}")
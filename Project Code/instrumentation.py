@@ -0,0 +1,359 @@
+# instrumentation.py
+# Memory, render-time and per-stage instrumentation for the dashboards.
+# Pages are timed with `render_timer`; inside a page, `span(stage)` times one stage of
+# the hot path:
+#   load    a page fetching its datasets (includes parse and clean when the registry misses)
+#   parse   reading a CSV file
+#   clean   cleaning the parsed rows
+#   fit     fitting or looking up a forecast
+#   render  drawing and encoding a chart
+# and `render_timer` records the whole page as the stage 'page'.
+# Stage times are aggregated in process per (page, stage) as histograms. The debug panel
+# (open the app with ?debug=1) shows them next to open figures, process RSS, per-page render
+# times and the cache counters; `prometheus_text()` exports them in the Prometheus text format.
+#
+# Setting DASHBOARD_PROFILE_SLOW_MS turns on a sampling profiler: the stacks of threads
+# rendering a page are sampled every DASHBOARD_PROFILE_INTERVAL_MS milliseconds, and a
+# request slower than the threshold leaves a folded-stack file (flamegraph.pl, speedscope)
+# under cache/profiles/.
+import bisect
+import gc
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# Histogram bucket bounds for stage times, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Requests slower than this are profiled (0 turns the sampling profiler off)
+PROFILE_SLOW_MS = float(os.environ.get('DASHBOARD_PROFILE_SLOW_MS', '0'))
+PROFILE_INTERVAL_S = float(os.environ.get('DASHBOARD_PROFILE_INTERVAL_MS', '5')) / 1000
+PROFILE_DIR = os.environ.get('DASHBOARD_PROFILE_DIR', os.path.join('cache', 'profiles'))
+# Older profiles are deleted beyond this many
+MAX_PROFILES = 50
+
+_lock = threading.Lock()
+_render_times = {}
+_stage_times = {}
+_slow_requests = deque(maxlen=MAX_PROFILES)
+_local = threading.local()
+
+
+# Function to return this thread's page and stage stacks
+def _thread_state():
+    if not hasattr(_local, 'pages'):
+        _local.pages = []
+        _local.stages = []
+        _local.trace = None
+    return _local
+
+
+# Function to add one stage time to the (page, stage) histogram
+def _record(page, stage, elapsed):
+    with _lock:
+        stats = _stage_times.get((page, stage))
+        if stats is None:
+            stats = _stage_times[(page, stage)] = {'count': 0, 'total_s': 0.0, 'max_s': 0.0,
+                                                   'buckets': [0] * len(BUCKETS)}
+        stats['count'] += 1
+        stats['total_s'] += elapsed
+        stats['max_s'] = max(stats['max_s'], elapsed)
+        bucket = bisect.bisect_left(BUCKETS, elapsed)
+        if bucket < len(BUCKETS):
+            stats['buckets'][bucket] += 1
+
+
+# Context manager that times one stage of the current page.
+# A span inside another span of the same stage is only kept in the request trace, so
+# stage totals never count the same time twice.
+@contextmanager
+def span(stage, detail=None):
+    state = _thread_state()
+    outermost = stage not in state.stages
+    state.stages.append(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        state.stages.pop()
+        if state.trace is not None:
+            state.trace.append((len(state.stages), stage, detail, elapsed))
+        if outermost:
+            _record(state.pages[-1] if state.pages else '-', stage, elapsed)
+
+
+class Sampler:
+    # Background thread sampling the stacks of the threads it watches
+    def __init__(self, interval=PROFILE_INTERVAL_S):
+        self.interval = interval
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # Function to start sampling a thread
+    def watch(self, ident):
+        with self._lock:
+            self._watched[ident] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='dashboard-sampler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    # Function to stop sampling a thread and return its folded stacks -> sample counts
+    def release(self, ident):
+        with self._lock:
+            return self._watched.pop(ident, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idents = list(self._watched)
+            if not idents:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = folded_stack(frame)
+                with self._lock:
+                    counts = self._watched.get(ident)
+                    if counts is not None:
+                        counts[stack] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+# Function to fold a stack into "outer;...;inner" function names
+def folded_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        # Folded stacks separate frames with ';' and end with ' <count>'
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+                     .replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+sampler = Sampler()
+
+
+# Function to write a slow request's samples as a folded-stack file, keeping the newest MAX_PROFILES
+def write_profile(page, elapsed, samples):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '_', page).strip('_').lower()
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{elapsed * 1000:.0f}ms.folded")
+    with open(path, 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+    profiles = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith('.folded'))
+    for name in profiles[:-MAX_PROFILES]:
+        os.remove(os.path.join(PROFILE_DIR, name))
+    return path
+
+
+# Context manager that records how long a page took to render
+@contextmanager
+def render_timer(page):
+    state = _thread_state()
+    outermost = not state.pages
+    profiling = outermost and PROFILE_SLOW_MS > 0
+    if outermost:
+        state.trace = []
+    if profiling:
+        sampler.watch(threading.get_ident())
+    state.pages.append(page)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        state.pages.pop()
+        with _lock:
+            stats = _render_times.setdefault(page, {'count': 0, 'total_s': 0.0, 'max_s': 0.0, 'last_s': 0.0})
+            stats['count'] += 1
+            stats['total_s'] += elapsed
+            stats['max_s'] = max(stats['max_s'], elapsed)
+            stats['last_s'] = elapsed
+        _record(page, 'page', elapsed)
+
+        if outermost:
+            trace, state.trace = state.trace, None
+            samples = sampler.release(threading.get_ident()) if profiling else None
+            if profiling and elapsed * 1000 >= PROFILE_SLOW_MS:
+                try:
+                    path = write_profile(page, elapsed, samples)
+                except OSError:
+                    path = None
+                with _lock:
+                    _slow_requests.append({'page': page, 'seconds': elapsed, 'profile': path,
+                                           'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                           'spans': [{'depth': depth, 'stage': stage, 'detail': detail,
+                                                      'seconds': seconds}
+                                                     for depth, stage, detail, seconds in trace]})
+
+
+# Function to return per-page render statistics
+def render_stats():
+    with _lock:
+        return {page: {**stats, 'mean_s': stats['total_s'] / stats['count']}
+                for page, stats in _render_times.items()}
+
+
+# Function to return per-(page, stage) statistics
+def stage_stats():
+    with _lock:
+        return {key: {'count': stats['count'], 'total_s': stats['total_s'], 'max_s': stats['max_s'],
+                      'mean_s': stats['total_s'] / stats['count']}
+                for key, stats in _stage_times.items()}
+
+
+# Function to list the slow requests the sampling profiler captured, newest first
+def slow_requests():
+    with _lock:
+        return list(reversed(_slow_requests))
+
+
+# Function to read the resident set size of this process in bytes
+def rss_bytes():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS, but the best available without /proc
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+    except (ImportError, AttributeError):
+        return None
+
+
+# Function to count figures still registered with pyplot
+def open_pyplot_figures():
+    # Imported here so modules that only time spans do not pull in matplotlib
+    import matplotlib.pyplot as plt
+
+    return len(plt.get_fignums())
+
+
+# Function to count every matplotlib Figure object still alive (walks the heap, so debug only)
+def live_figures():
+    from matplotlib.figure import Figure
+
+    return sum(1 for obj in gc.get_objects() if isinstance(obj, Figure))
+
+
+# Function to collect everything the debug panel shows
+def snapshot():
+    from chart_cache import chart_cache
+    from data_store import registry
+    from forecast_cache import forecast_cache
+    from forecast_pool import forecast_pool
+
+    return {
+        'rss_bytes': rss_bytes(),
+        'open_pyplot_figures': open_pyplot_figures(),
+        'live_figures': live_figures(),
+        'threads': threading.active_count(),
+        'render_times': render_stats(),
+        'datasets': registry.stats(),
+        'forecast_cache': forecast_cache.stats(),
+        'chart_cache': chart_cache.stats(),
+        'forecast_pool': forecast_pool.stats(),
+    }
+
+
+# Function to quote a Prometheus label value
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Function to export the stage histograms, memory and cache counters in the Prometheus text format
+def prometheus_text():
+    from chart_cache import chart_cache
+    from data_store import registry
+    from forecast_cache import forecast_cache
+    from forecast_pool import forecast_pool
+
+    with _lock:
+        stages = {key: {**stats, 'buckets': list(stats['buckets'])} for key, stats in _stage_times.items()}
+        slow = len(_slow_requests)
+
+    lines = ['# HELP dashboard_stage_seconds Time spent in each stage of a dashboard page.',
+             '# TYPE dashboard_stage_seconds histogram']
+    for (page, stage), stats in sorted(stages.items()):
+        labels = f'page="{_label(page)}",stage="{_label(stage)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            cumulative += count
+            lines.append(f'dashboard_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'dashboard_stage_seconds_bucket{{{labels},le="+Inf"}} {stats["count"]}')
+        lines.append(f'dashboard_stage_seconds_sum{{{labels}}} {stats["total_s"]:.6f}')
+        lines.append(f'dashboard_stage_seconds_count{{{labels}}} {stats["count"]}')
+
+    rss = rss_bytes()
+    if rss is not None:
+        lines += ['# HELP dashboard_resident_memory_bytes Resident set size of the process.',
+                  '# TYPE dashboard_resident_memory_bytes gauge',
+                  f'dashboard_resident_memory_bytes {rss}']
+    lines += ['# HELP dashboard_open_figures Figures still registered with pyplot.',
+              '# TYPE dashboard_open_figures gauge',
+              f'dashboard_open_figures {open_pyplot_figures()}',
+              '# HELP dashboard_slow_requests Slow requests captured by the sampling profiler.',
+              '# TYPE dashboard_slow_requests gauge',
+              f'dashboard_slow_requests {slow}']
+
+    caches = {'datasets': registry.stats(), 'forecasts': forecast_cache.stats(), 'charts': chart_cache.stats(),
+              'forecast_pool': forecast_pool.stats()}
+    for counter in ('hits', 'misses'):
+        lines += [f'# HELP dashboard_cache_{counter}_total Cache {counter} per cache.',
+                  f'# TYPE dashboard_cache_{counter}_total counter']
+        lines += [f'dashboard_cache_{counter}_total{{cache="{name}"}} {stats[counter]}'
+                  for name, stats in caches.items()]
+    pool = caches['forecast_pool']
+    lines += ['# HELP dashboard_forecast_jobs_deduped_total Forecast requests that joined a fit already in flight.',
+              '# TYPE dashboard_forecast_jobs_deduped_total counter',
+              f'dashboard_forecast_jobs_deduped_total {pool["deduped"]}',
+              '# HELP dashboard_forecast_jobs_in_flight Fits running or queued in the forecast workers.',
+              '# TYPE dashboard_forecast_jobs_in_flight gauge',
+              f'dashboard_forecast_jobs_in_flight {pool["in_flight"]}']
+    return '\n'.join(lines) + '\n'
+
+
+# Function to draw the debug panel in the sidebar
+def debug_panel():
+    import pandas as pd
+    import streamlit as st
+
+    data = snapshot()
+    with st.sidebar.expander("Debug", expanded=True):
+        rss = data['rss_bytes']
+        st.write(f"RSS: {rss / 2 ** 20:.1f} MB" if rss else "RSS: unavailable")
+        st.write(f"Open pyplot figures: {data['open_pyplot_figures']}")
+        st.write(f"Live Figure objects: {data['live_figures']}")
+        st.write(f"Threads: {data['threads']}")
+        if data['render_times']:
+            st.dataframe(pd.DataFrame(data['render_times']).T.round(4))
+        stages = stage_stats()
+        if stages:
+            frame = pd.DataFrame(stages).T.rename_axis(['page', 'stage'])
+            st.dataframe(frame[['count', 'mean_s', 'max_s', 'total_s']].round(4))
+        for request in slow_requests()[:10]:
+            st.write(f"Slow: {request['page']} {request['seconds'] * 1000:.0f} ms at {request['time']}"
+                     + (f" -> {request['profile']}" if request['profile'] else ''))
+        st.download_button("Prometheus metrics", prometheus_text(), file_name="metrics.txt", mime="text/plain")
+        st.json({key: data[key] for key in ('datasets', 'forecast_cache', 'chart_cache', 'forecast_pool')},
+                expanded=False)
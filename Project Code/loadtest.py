@@ -0,0 +1,339 @@
+# loadtest.py
+# Latency and capacity benchmarks for the dashboard pages, driven through Streamlit's
+# AppTest harness. Each scenario opens a page and then changes its widgets in a scripted
+# order, one rerun per change, the way a user clicking through the page would.
+#
+# Every page runs in a fresh process so its peak RSS is its own. Per page the suite
+# reports the cold first render, p50/p95/p99 latency and CPU time of the reruns after it,
+# and (in a second, traced pass) the allocations of one rerun. The concurrency test runs
+# N simulated sessions against one process, as one Streamlit worker serves them, and
+# reports throughput and latency for each N plus the session count where adding
+# sessions stops adding throughput.
+#
+#   python loadtest.py [--interactions 30] [--sessions 1,2,4,8] [--json results.json]
+#   python loadtest.py --pages oil.price_forecasting --sessions 1,2
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import threading
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Script each scenario runs, the widget holding its page, and the widgets it then
+# changes in turn: (widget type, label, values to cycle through or None for every option)
+DASHBOARD_SCRIPT = "import {module}\n{module}.{function}()\n"
+SCENARIOS = {
+    'front_screen': {
+        'app': 'app.py',
+        'page': None,
+        'steps': [],
+    },
+    'oil.price_forecasting': {
+        'script': DASHBOARD_SCRIPT.format(module='oil', function='oil_dashboard'),
+        'page': ('selectbox', 'Select a Page', 'Price Forecasting'),
+        'steps': [('selectbox', 'Select Province', None),
+                  ('selectbox', 'Select Year (2024-2027)', None),
+                  ('selectbox', 'Select Month', None)],
+    },
+    'wage.regional_analysis': {
+        'script': DASHBOARD_SCRIPT.format(module='wage', function='wage_dashboard'),
+        'page': ('selectbox', 'Select a Page', 'Regional Analysis'),
+        'steps': [('selectbox', 'Select Year', None),
+                  ('selectbox', 'Select Month', None)],
+    },
+    'food.price_forecasting': {
+        'script': DASHBOARD_SCRIPT.format(module='food', function='food_dashboard'),
+        'page': ('selectbox', 'Select a Page', 'Price Forecasting'),
+        'steps': [('selectbox', 'Select Product', None),
+                  ('selectbox', 'Select Year (2024-2027)', None),
+                  ('selectbox', 'Select Month', None)],
+    },
+    'housing.forecast_hpi': {
+        'script': DASHBOARD_SCRIPT.format(module='housing', function='housing_dashboard'),
+        'page': ('selectbox', 'Go to', 'HPI Forecasting'),
+        'steps': [('selectbox', 'Select Region', None),
+                  ('slider', 'Select Forecast Year', [2024, 2025, 2026, 2027])],
+    },
+    'housing.predict_price': {
+        'script': DASHBOARD_SCRIPT.format(module='housing', function='housing_dashboard'),
+        'page': ('selectbox', 'Go to', 'Housing Price Prediction'),
+        'steps': [('selectbox', 'Select City', None),
+                  ('slider', 'Select Forecast Year', [2024, 2025, 2026, 2027]),
+                  ('selectbox', 'Select Forecast Month', None),
+                  ('slider', 'Select Number of Beds', [1, 2, 3, 4, 5]),
+                  ('slider', 'Select Number of Baths', [1, 2, 3, 4, 5])],
+    },
+    'housing.plot_regional_hpi': {
+        'script': DASHBOARD_SCRIPT.format(module='housing', function='housing_dashboard'),
+        'page': ('selectbox', 'Go to', 'Regional Housing Analysis'),
+        'steps': [('slider', 'Select Year', list(range(1995, 2024))),
+                  ('selectbox', 'Select Month', None)],
+    },
+}
+
+# Adding sessions must raise throughput by at least this much to count as not saturated
+SATURATION_GAIN = 1.1
+TIMEOUT_S = 120
+
+
+class ScenarioError(Exception):
+    pass
+
+
+# Function to keep warnings and Streamlit's deprecation notices out of the report
+def quiet():
+    warnings.simplefilter('ignore')
+    logging.disable(logging.WARNING)
+
+
+# Function to compute latency percentiles in milliseconds
+def percentiles(seconds):
+    if not seconds:
+        return {}
+    values = np.asarray(seconds) * 1000
+    return {'p50_ms': round(float(np.percentile(values, 50)), 2),
+            'p95_ms': round(float(np.percentile(values, 95)), 2),
+            'p99_ms': round(float(np.percentile(values, 99)), 2),
+            'mean_ms': round(float(values.mean()), 2),
+            'max_ms': round(float(values.max()), 2)}
+
+
+# Function to find a widget by type and label
+def find_widget(at, kind, label):
+    for widget in at.get(kind):
+        if widget.label == label:
+            return widget
+    raise ScenarioError(f'No {kind} labelled {label!r} on the page')
+
+
+# Function to rerun the app and raise if the script failed
+def rerun(at):
+    at.run(timeout=TIMEOUT_S)
+    if at.exception:
+        raise ScenarioError(at.exception[0].value)
+
+
+class Session:
+    # One simulated user: an AppTest instance and the next widget change to make
+    def __init__(self, name, offset=0):
+        from streamlit.testing.v1 import AppTest
+
+        scenario = SCENARIOS[name]
+        if 'app' in scenario:
+            self.at = AppTest.from_file(scenario['app'], default_timeout=TIMEOUT_S)
+        else:
+            self.at = AppTest.from_string(scenario['script'], default_timeout=TIMEOUT_S)
+        self.scenario = scenario
+        # Sessions start at different points of the script so they do not all ask for the same thing
+        self.step = offset
+
+    # Function to render the page for the first time
+    def open(self):
+        rerun(self.at)
+        if self.scenario['page'] is not None:
+            kind, label, value = self.scenario['page']
+            find_widget(self.at, kind, label).set_value(value)
+            rerun(self.at)
+
+    # Function to make the next scripted widget change and rerun
+    def interact(self):
+        steps = self.scenario['steps']
+        if not steps:
+            # Pages without widgets are measured as plain reruns
+            rerun(self.at)
+            return
+        kind, label, values = steps[self.step % len(steps)]
+        widget = find_widget(self.at, kind, label)
+        if values is None:
+            values = widget.options
+        # Walk each widget's values at its own pace so the combinations vary
+        widget.set_value(values[(self.step // len(steps) + 1) % len(values)])
+        self.step += 1
+        rerun(self.at)
+
+
+# Function to measure one page in the current process (runs in a fresh worker process)
+def measure_page(name, interactions, allocations=True):
+    quiet()
+    session = Session(name)
+    result = {'interactions': interactions}
+    try:
+        start, cpu = time.perf_counter(), time.process_time()
+        session.open()
+        result['cold_ms'] = round((time.perf_counter() - start) * 1000, 2)
+        result['cold_cpu_ms'] = round((time.process_time() - cpu) * 1000, 2)
+
+        latencies, cpu_times = [], []
+        for _ in range(interactions):
+            start, cpu = time.perf_counter(), time.process_time()
+            session.interact()
+            latencies.append(time.perf_counter() - start)
+            cpu_times.append(time.process_time() - cpu)
+        result.update(percentiles(latencies))
+        result['cpu_p50_ms'] = round(float(np.median(cpu_times)) * 1000, 2)
+        result['cpu_mean_ms'] = round(float(np.mean(cpu_times)) * 1000, 2)
+
+        if allocations:
+            # A separate traced pass, since tracing slows every allocation down
+            tracemalloc.start()
+            peaks, blocks = [], []
+            for _ in range(min(interactions, 10)):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                count = len(tracemalloc.take_snapshot().traces)
+                session.interact()
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+                blocks.append(len(tracemalloc.take_snapshot().traces) - count)
+            tracemalloc.stop()
+            result['alloc_peak_mb'] = round(float(np.median(peaks)) / 2 ** 20, 2)
+            result['retained_blocks'] = int(np.median(blocks))
+    except ScenarioError as exc:
+        result['error'] = str(exc)
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+# Function to run `sessions` concurrent sessions of a page for `duration` seconds
+def measure_sessions(name, sessions, duration):
+    quiet()
+    users = [Session(name, offset=i * 7) for i in range(sessions)]
+    for user in users:
+        user.open()
+
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def drive(user):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                user.interact()
+            except ScenarioError as exc:
+                with lock:
+                    errors.append(str(exc))
+                return
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    start, cpu = time.perf_counter(), time.process_time()
+    threads = [threading.Thread(target=drive, args=(user,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {'sessions': sessions,
+            'reruns': len(latencies),
+            'throughput_per_s': round(len(latencies) / elapsed, 2),
+            'cpu_utilization': round((time.process_time() - cpu) / elapsed, 2),
+            'errors': len(errors),
+            **percentiles(latencies),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+
+# Function to find where adding sessions stops adding throughput
+def saturation_point(levels):
+    best = None
+    for level in levels:
+        if best is not None and level['throughput_per_s'] < best['throughput_per_s'] * SATURATION_GAIN:
+            return best['sessions']
+        best = level
+    return None  # still scaling at the highest level tried
+
+
+# Function to run a measurement in a fresh process
+def in_fresh_process(fn, *args):
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(fn, *args).result()
+
+
+# Function to describe the code and machine the numbers came from
+def environment():
+    import streamlit
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'streamlit': streamlit.__version__, 'cpus': os.cpu_count()}
+
+
+# Function to run the whole suite
+def run_suite(pages=None, interactions=30, sessions=(1, 2, 4, 8), duration=10.0, concurrency_page=None,
+              allocations=True):
+    pages = pages or list(SCENARIOS)
+    results = {'environment': environment(), 'pages': {}, 'concurrency': {}}
+    for name in pages:
+        results['pages'][name] = in_fresh_process(measure_page, name, interactions, allocations)
+
+    # Saturation is measured on the first page that rendered, unless one is named
+    working = [name for name in pages if 'error' not in results['pages'][name]]
+    concurrency_page = concurrency_page or (working[0] if working else None)
+    if concurrency_page is not None and sessions:
+        levels = []
+        for count in sessions:
+            try:
+                levels.append(in_fresh_process(measure_sessions, concurrency_page, count, duration))
+            except ScenarioError as exc:
+                levels.append({'sessions': count, 'error': str(exc)})
+                break
+        results['concurrency'] = {'page': concurrency_page, 'duration_s': duration, 'levels': levels,
+                                  'saturation_sessions': saturation_point([level for level in levels
+                                                                           if 'error' not in level])}
+    return results
+
+
+# Function to print the suite results as a table
+def report(results):
+    print(f"commit {results['environment']['commit']}, {results['environment']['cpus']} CPUs")
+    print(f"{'page':28} {'cold':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'cpu p50':>8} {'alloc':>7} {'rss':>7}")
+    for name, page in results['pages'].items():
+        if 'error' in page:
+            print(f'{name:28} error: {page["error"]}')
+            continue
+        print(f"{name:28} {page['cold_ms']:>9.1f} {page['p50_ms']:>8.1f} {page['p95_ms']:>8.1f} "
+              f"{page['p99_ms']:>8.1f} {page['cpu_p50_ms']:>8.1f} {page.get('alloc_peak_mb', float('nan')):>7.1f} "
+              f"{page['peak_rss_mb']:>7.1f}")
+    concurrency = results['concurrency']
+    if concurrency:
+        print(f"concurrent sessions on {concurrency['page']} ({concurrency['duration_s']}s each)")
+        for level in concurrency['levels']:
+            if 'error' in level:
+                print(f"  {level['sessions']:>3} sessions: error: {level['error']}")
+                continue
+            print(f"  {level['sessions']:>3} sessions: {level['throughput_per_s']:>7.2f} reruns/s, "
+                  f"p50 {level['p50_ms']:.1f} ms, p95 {level['p95_ms']:.1f} ms, "
+                  f"cpu {level['cpu_utilization']:.2f}, rss {level['peak_rss_mb']:.1f} MB")
+        saturation = concurrency['saturation_sessions']
+        print(f'  saturates at {saturation} sessions' if saturation else '  still scaling at the highest level')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latency and capacity benchmarks for the dashboard pages')
+    parser.add_argument('--pages', help=f'comma-separated scenarios (default: all of {", ".join(SCENARIOS)})')
+    parser.add_argument('--interactions', type=int, default=30, help='scripted widget changes per page')
+    parser.add_argument('--sessions', default='1,2,4,8', help='concurrent session counts to try ("" to skip)')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per concurrency level')
+    parser.add_argument('--concurrency-page', help='scenario for the concurrency test (default: first that works)')
+    parser.add_argument('--no-allocations', action='store_true', help='skip the traced allocation pass')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    results = run_suite(args.pages.split(',') if args.pages else None, args.interactions,
+                        [int(count) for count in args.sessions.split(',') if count], args.duration,
+                        args.concurrency_page, not args.no_allocations)
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,90 @@
+# models.py
+# Candidate forecast models the backtest (backtest.py) chooses between for each series.
+# Every candidate is a (family, parameters) pair:
+#
+#   holtwinters     exponential smoothing (ETS with additive errors) through the NumPy engine;
+#                   the parameters are the ExponentialSmoothing keyword arguments
+#   seasonal_naive  every month repeats the same month of the last observed year
+#   arima           statsmodels ARIMA with the given order (statsmodels is imported on first use)
+#
+# `fit_forecast` fits any candidate to one series and returns its point forecast and, when
+# asked, simulated future paths for the prediction interval bands.
+import numpy as np
+
+import holtwinters
+
+MODELS = {
+    'hw_mul': ('holtwinters', {'seasonal': 'mul', 'seasonal_periods': 12}),
+    'hw_add': ('holtwinters', {'seasonal': 'add', 'seasonal_periods': 12}),
+    'hw_trend_mul': ('holtwinters', {'trend': 'add', 'seasonal': 'mul', 'seasonal_periods': 12}),
+    'hw_trend_add': ('holtwinters', {'trend': 'add', 'seasonal': 'add', 'seasonal_periods': 12}),
+    'holt': ('holtwinters', {'trend': 'add', 'seasonal': None, 'seasonal_periods': 12}),
+    'ses': ('holtwinters', {'trend': None, 'seasonal': None, 'seasonal_periods': 12}),
+    'seasonal_naive': ('seasonal_naive', {'seasonal_periods': 12}),
+    'arima': ('arima', {'order': (1, 1, 1)}),
+}
+
+# Model each dataset used before any backtest ran; also the fallback for unknown series
+DEFAULT_MODELS = {'oil': 'hw_mul', 'wage': 'hw_mul', 'hpi': 'holt', 'food_prices': 'hw_trend_add'}
+
+
+# Function to fit a seasonal naive model -> (forecast, paths).
+# Paths add a normal error per elapsed season, with the spread of the year-on-year changes.
+def seasonal_naive(y, steps, n_paths, rng, seasonal_periods=12):
+    m = seasonal_periods
+    if len(y) < 2 * m:
+        raise ValueError(f'At least {2 * m} observations are needed for a seasonal naive forecast')
+    seasons = -(-steps // m)
+    forecast = np.tile(y[-m:], seasons)[:steps]
+    if not n_paths:
+        return forecast, None
+
+    changes = y[m:] - y[:-m]
+    sigma = np.sqrt(np.mean(changes * changes))
+    # Month h of the forecast has absorbed one error per season up to and including its own
+    errors = rng.standard_normal((n_paths, seasons, m)) * sigma
+    paths = forecast + errors.cumsum(axis=1).reshape(n_paths, seasons * m)[:, :steps]
+    return forecast, paths
+
+
+# Function to fit an ARIMA model -> (forecast, paths).
+# Paths are drawn from the normal forecast distribution of each month.
+def arima(y, steps, n_paths, rng, order=(1, 1, 1)):
+    import warnings
+
+    from statsmodels.tsa.arima.model import ARIMA
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        prediction = ARIMA(y, order=order).fit().get_forecast(steps)
+    forecast = np.asarray(prediction.predicted_mean)
+    if not n_paths:
+        return forecast, None
+    return forecast, forecast + np.asarray(prediction.se_mean) * rng.standard_normal((n_paths, steps))
+
+
+# Function to fit a Holt-Winters model with the NumPy engine -> (forecast, paths)
+def holt_winters(y, steps, n_paths, rng, **spec):
+    result = holtwinters.fit(y, **spec)
+    forecast = result.forecast(steps)[0]
+    if not n_paths:
+        return forecast, None
+    return forecast, result.simulate(steps, n_paths, rng)[0]
+
+
+FAMILIES = {
+    'holtwinters': holt_winters,
+    'seasonal_naive': seasonal_naive,
+    'arima': arima,
+}
+
+
+# Function to fit candidate `name` to a series and forecast `steps` months -> (forecast, paths).
+# `paths` is (n_paths, steps), or None when no paths are asked for.
+def fit_forecast(name, y, steps, n_paths=0, rng=None):
+    family, params = MODELS[name]
+    y = np.asarray(y, dtype=float)
+    if not np.all(np.isfinite(y)):
+        raise ValueError('Series must not contain missing values')
+    rng = rng if rng is not None else np.random.default_rng()
+    return FAMILIES[family](y, steps, n_paths, rng, **params)
@@ -1,150 +1,143 @@
 # oil.py
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from matplotlib.figure import Figure
+from data_store import dataset_version
+from forecasting import oil_series, forecast_bands
+from forecast_pool import forecast_pool, page_forecast
+from chart_cache import cached_chart, encode_figure, plot_fan
+from client_charts import line_chart
+from rollups import get_rollup
+from panels import get_panel
+from instrumentation import render_timer, span
 
 # Function to load data
 def load_data():
-    # Load the data from CSV file
-    df = pd.read_csv('Oil.csv')
-    # Convert Date column to datetime
-    df['Date'] = pd.to_datetime(df['Date'])
-    # Convert non-numeric 'Value' entries to NaN and then to numeric
-    df['Value'] = pd.to_numeric(df['Value'], errors='coerce')
-    return df
+    # Province x month prices from the cleaned Oil.csv, built once per dataset version
+    return get_panel('oil')
 
 # Function to display the Regional Analysis page
-def regional_analysis(df):
+def regional_analysis(panel):
     st.subheader("Regional Analysis")
 
     # Sidebar filters
     st.sidebar.header("Filters")
 
+    # Per-province monthly means, precomputed once per dataset version
+    with span('load', 'oil rollup'):
+        rollup = get_rollup('oil')
+
     # Year and month dropdown filters
-    years = df['Date'].dt.year.unique()
+    years = rollup.years
     selected_year = st.sidebar.selectbox("Select Year", sorted(years))
     months = range(1, 13)
     selected_month = st.sidebar.selectbox("Select Month", months)
     
-    # Filter data based on selections
-    filtered_df = df[(df['Date'].dt.year == selected_year) & 
-                     (df['Date'].dt.month == selected_month)]
-
-    # Ensure the Date column is not duplicated
-    filtered_df = filtered_df.copy()
-    
-    # Group by province and compute average values
-    grouped_df = filtered_df.groupby('Province')['Value'].mean().reset_index()
+    # Average values per province for the selected month
+    grouped_df = rollup.frame(selected_year, selected_month, region_column='Province')
     
     # Remove provinces with no values
     grouped_df = grouped_df[grouped_df['Value'].notna() & (grouped_df['Value'] > 0)]
     
     # Plot data as a bar chart
     st.write(f"Average Oil Prices for Each Province in {selected_month}/0{selected_year}")
-    plt.figure(figsize=(12, 6))
-    plt.bar(grouped_df['Province'], grouped_df['Value'], color='skyblue')
-    plt.xlabel("Province")
-    plt.ylabel("Average Oil Price")
-    plt.title(f"Average Oil Prices by Province for ({selected_year}-{selected_month})")
-    plt.xticks(rotation=45, ha='right')
-    st.pyplot(plt)
+    def draw():
+        fig = Figure(figsize=(12, 6))
+        ax = fig.subplots()
+        ax.bar(grouped_df['Province'], grouped_df['Value'], color='skyblue')
+        ax.set_xlabel("Province")
+        ax.set_ylabel("Average Oil Price")
+        ax.set_title(f"Average Oil Prices by Province for ({selected_year}-{selected_month})")
+        ax.tick_params(axis='x', labelrotation=45)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment('right')
+        return fig
+    state = {'year': selected_year, 'month': selected_month}
+    st.image(cached_chart('oil/regional_analysis', state, dataset_version('oil'), draw), use_column_width=True)
 
 
 
 
 # Function to display the Product Trend page
-def product_trend(df):
+def product_trend(panel):
     st.subheader("Product Trend")
 
     # Sidebar filter
-    provinces = df['Province'].unique()
+    provinces = panel.regions
     selected_province = st.sidebar.selectbox("Select Province", provinces)
     
-    # Filter data from 1990 to 2024
-    filtered_df = df[(df['Date'].dt.year >= 1990) & (df['Date'].dt.year <= 2024)]
-    
-    if selected_province:
-        filtered_df = filtered_df[filtered_df['Province'] == selected_province]
+    # Monthly prices from 1990 to 2024
+    trend = panel.series(selected_province, '1990-01', '2024-12')
 
-    # Plot data
-    plt.figure(figsize=(10, 5))
-    plt.plot(filtered_df['Date'], filtered_df['Value'], label=selected_province)
-    
-    plt.xlabel("Date")
-    plt.ylabel("Oil Price")
-    plt.title("Oil Price Trends from 1990 to 2024")
-    plt.legend()
-    st.pyplot(plt)
+    # Drawn in the browser from a downsampled series; zooming in fetches the finer detail
+    line_chart('oil/product_trend', [(selected_province, trend.index, trend.values, {})],
+               title="Oil Price Trends from 1990 to 2024", y_title="Oil Price")
 
 # Function to display the Price Forecasting page
-def price_forecasting(df):
+def price_forecasting(panel):
     st.subheader("Price Forecasting")
 
     # Sidebar filters
     st.sidebar.header("Forecasting Options")
     
     # Province filter
-    provinces = df['Province'].unique()
+    provinces = panel.regions
     selected_province = st.sidebar.selectbox("Select Province", provinces)
     
     # Dropdown for selecting future date
     future_year = st.sidebar.selectbox("Select Year (2024-2027)", [2024, 2025, 2026, 2027])
     future_month = st.sidebar.selectbox("Select Month", range(1, 13), index=9)
 
-    # Filter data for the selected province
-    province_data = df[df['Province'] == selected_province]
+    # Gap-filled monthly series for the selected province
+    y = oil_series(panel, selected_province)
 
-    # Ensure data is sorted by date
-    province_data = province_data.sort_values(by='Date')
-    
-    # Handle missing values 
-    province_data['Value'].fillna(method='ffill', inplace=True)
-    province_data['Value'].fillna(method='bfill', inplace=True)  # In case there are NaNs at the start
-
-    # Create feature and target variables
-    province_data = province_data.set_index('Date')
-    y = province_data['Value']
-    
-    # Fit the time series model
-    model = ExponentialSmoothing(y, seasonal='mul', seasonal_periods=12)
-    model_fit = model.fit()
-
-    # Predict future value
+    # Predict future value (precomputed by batch_forecast.py, or fitted by a forecast worker on demand)
     future_date = pd.Timestamp(f"{future_year}-{future_month:02d}-01")
-    future_dates = pd.date_range(start=province_data.index.max(), periods=((future_year - 2024) * 12) + future_month, freq='M')
-    forecast = model_fit.predict(start=len(y), end=len(y) + len(future_dates) - 1)
+    future_dates = pd.date_range(start=y.index.max(), periods=((future_year - 2024) * 12) + future_month, freq='M')
+    forecast = page_forecast('oil', selected_province, y, len(future_dates))
+    # Simulated prediction intervals stored next to the forecast (None when it was fitted on demand)
+    bands = forecast_bands('oil', selected_province, len(future_dates))
     
     # Get the predicted value for the selected date
     predicted_value = forecast.iloc[-1]
 
     try:
-        june_2024_price = province_data.loc['2024-06']['Value'].mean() if '2024-06' in province_data.index else 'Data not available'
+        june_2024_price = y.loc['2024-06'].mean() if '2024-06' in y.index else 'Data not available'
     except KeyError:
         june_2024_price = 'Data not available'
 
-    # Plot historical and forecasted prices
-    plt.figure(figsize=(10, 5))
-    plt.plot(province_data.index, province_data['Value'], label='Historical Prices')
-    plt.plot(future_dates, forecast, label='Forecasted Prices', linestyle='--')
-    
-    plt.xlabel("Date")
-    plt.ylabel("Oil Price")
-    plt.title("Oil Price Forecasting")
-    plt.legend()
-    st.pyplot(plt)
+    # Plot historical and forecasted prices on a figure owned by this request
+    with span('render', 'oil/price_forecasting'):
+        fig = Figure(figsize=(10, 5))
+        ax = fig.subplots()
+        if bands is not None:
+            plot_fan(ax, future_dates, bands)
+        ax.plot(y.index, y.values, label='Historical Prices')
+        ax.plot(future_dates, forecast, label='Forecasted Prices', linestyle='--')
+
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Oil Price")
+        ax.set_title("Oil Price Forecasting")
+        ax.legend()
+        png = encode_figure(fig)
+    st.image(png, use_column_width=True)
 
     # Display the predicted value
     st.write(f"The current oil price for 9/2024 is {june_2024_price:.2f}" if isinstance(june_2024_price, (int, float)) else june_2024_price)
     st.write(f"The predicted oil price for {future_month}/{future_year} is {predicted_value:.2f}")
+    if bands is not None and 'p10' in bands:
+        st.write(f"80% prediction interval: {bands['p10'].iloc[-1]:.2f} to {bands['p90'].iloc[-1]:.2f}")
 
 # Function to display the oil price dashboard
 def oil_dashboard():
     #st.title("Welcome to Oil Price Analysis Dashboard")
 
     # Load data
-    df = load_data()
+    with span('load', 'oil'):
+        panel = load_data()
+    # Forecast workers start in the background while the user picks a page
+    forecast_pool.start()
 
     # Main navigation for the oil dashboard 
     page = st.sidebar.selectbox("Select a Page", ["Home","Regional Analysis", "Product Trend", "Price Forecasting"])
@@ -158,11 +151,14 @@ def oil_dashboard():
 
 
     elif page == "Regional Analysis":
-        regional_analysis(df)
+        with render_timer("Oil: Regional Analysis"):
+            regional_analysis(panel)
     elif page == "Product Trend":
-        product_trend(df)
+        with render_timer("Oil: Product Trend"):
+            product_trend(panel)
     elif page == "Price Forecasting":
-        price_forecasting(df)
+        with render_timer("Oil: Price Forecasting"):
+            price_forecasting(panel)
 
 if __name__ == "__main__":
     oil_dashboard()
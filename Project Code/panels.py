@@ -0,0 +1,234 @@
+# panels.py
+# Monthly panels of the regional indicators: oil prices, weekly earnings and the HPI.
+# Oil.csv and Wage.csv are long Region/Date/Value rows and hpi.csv a wide month x region table,
+# and every page used to filter, sort, fill and index its frame again on each rerun. A Panel holds
+# one dataset as a (regions x months) float array over consecutive month starts, built once per
+# dataset version: a region is a dict lookup, a date range a slice of columns, and two indicators
+# line up on the months they share without a merge.
+#
+# A month with several rows (two price series in some provinces, the three HPI types) holds
+# their mean, as the regional rollups and the HPI trend chart already showed it.
+#
+#   python panels.py      (prints each panel, then weekly earnings against the HPI by province)
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import dataset_version, get_dataset
+
+
+# Months in each period of the rules Panel.resample takes
+PERIOD_MONTHS = {'M': 1, 'Q': 3, 'A': 12, 'Y': 12}
+
+
+class Panel:
+    # Value per (region, month); NaN where a region has no figure for a month
+    def __init__(self, regions, months, values, spans, version=None):
+        self.regions = regions      # (R,) region names, in the order the source lists them
+        self.months = months        # (T,) DatetimeIndex of consecutive month starts
+        self.values = values        # (R, T) float64 monthly means
+        self.spans = spans          # (R, 2) first and last month each region has rows for (first > last: none)
+        self.version = version      # dataset version the panel was built from
+        self._region_pos = {region: i for i, region in enumerate(regions)}
+
+    def __contains__(self, region):
+        return region in self._region_pos
+
+    # Function to return the row of a region (KeyError for an unknown region)
+    def code(self, region):
+        return self._region_pos[region]
+
+    # Function to return the column of a month, counted from the panel's first month
+    def month_pos(self, date):
+        date = pd.Timestamp(date)
+        first = self.months[0] if len(self.months) else date
+        return (date.year - first.year) * 12 + date.month - first.month
+
+    # Function to return one region's monthly values as a Series, months without a figure dropped.
+    # `start` and `end` limit it to the months between them.
+    def series(self, region, start=None, end=None):
+        panel = self.window(start, end)
+        values = panel.values[panel.code(region)]
+        series = pd.Series(values, index=panel.months, name=region)
+        return series[np.isfinite(values)]
+
+    # Function to return the series a region is forecast from: every month from its first row to its
+    # last, a month without a figure taking the one before it (and months before the first figure, that one)
+    def filled(self, region):
+        i = self.code(region)
+        first, last = self.spans[i]
+        # A copy, so the caller can change the series without changing the panel
+        values = self.values[i, first:last + 1].copy()
+        finite = np.isfinite(values)
+        if finite.any() and not finite.all():
+            # Position of the latest figure at or before every month, the first figure before any
+            source = np.maximum.accumulate(np.where(finite, np.arange(len(values)), -1))
+            values = values[np.where(source < 0, finite.argmax(), source)]
+        return pd.Series(values, index=self.months[first:last + 1], name=region)
+
+    # Function to cut the panel to the months from `start` to `end` (either may be None); the values are a view
+    def window(self, start=None, end=None):
+        if start is None and end is None:
+            return self
+        size = len(self.months)
+        a = 0 if start is None else min(max(self.month_pos(start), 0), size)
+        b = size if end is None else min(max(self.month_pos(end) + 1, a), size)
+        spans = np.stack([np.maximum(self.spans[:, 0] - a, 0), np.minimum(self.spans[:, 1] - a, b - a - 1)], axis=1)
+        return Panel(self.regions, self.months[a:b], self.values[:, a:b], spans, self.version)
+
+    # Function to keep some regions, in the order given
+    def take(self, regions):
+        rows = [self.code(region) for region in regions]
+        return Panel(np.asarray(regions, dtype=object), self.months, self.values[rows], self.spans[rows],
+                     self.version)
+
+    # Function to line two panels up on the months both cover -> (this panel, other panel)
+    def align(self, other):
+        if len(self.months) and len(other.months):
+            start, end = max(self.months[0], other.months[0]), min(self.months[-1], other.months[-1])
+        else:
+            # Nothing in common: both come back without months
+            start, end = pd.Timestamp.max, pd.Timestamp.min
+        return self.window(start, end), other.window(start, end)
+
+    # Function to average every region's months by period -> DataFrame (periods x regions).
+    # Periods are labelled as DataFrame.resample(rule).mean() labels them: 'M', 'Q' and 'A' by their
+    # last day, 'MS', 'QS' and 'AS' by their first.
+    def resample(self, rule):
+        if rule.rstrip('S') not in PERIOD_MONTHS:
+            raise ValueError(f"Unsupported rule {rule!r}; expected one of {sorted(PERIOD_MONTHS)} (or with 'S')")
+        if not len(self.months):
+            return pd.DataFrame(columns=self.regions, dtype=float)
+        size = PERIOD_MONTHS[rule.rstrip('S')]
+        periods = month_numbers(self.months) // size
+        starts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+        finite = np.isfinite(self.values)
+        sums = np.add.reduceat(np.where(finite, self.values, 0.0), starts, axis=1)
+        counts = np.add.reduceat(finite, starts, axis=1)
+        with np.errstate(invalid='ignore'):
+            means = sums / counts
+
+        # Month arithmetic on datetime64; pandas' period conversions cost milliseconds
+        if rule.endswith('S'):
+            labels = (periods[starts] * size).astype('datetime64[M]').astype('datetime64[D]')
+        else:
+            ends = ((periods[starts] + 1) * size).astype('datetime64[M]').astype('datetime64[D]')
+            labels = ends - np.timedelta64(1, 'D')
+        return pd.DataFrame(means.T, index=pd.DatetimeIndex(labels), columns=self.regions)
+
+    # Function to average the regions of every month -> Series over the months any region has a figure for
+    def mean(self):
+        finite = np.isfinite(self.values)
+        with np.errstate(invalid='ignore'):
+            means = np.where(finite, self.values, 0.0).sum(axis=0) / finite.sum(axis=0)
+        series = pd.Series(means, index=self.months)
+        return series[finite.any(axis=0)]
+
+    # Function to list the regions whose name contains `text` (how the housing pages match a city to the HPI)
+    def match(self, text):
+        return [region for region in self.regions if text in region]
+
+    # Function to report the memory held by the panel
+    def nbytes(self):
+        return int(self.values.nbytes + self.spans.nbytes)
+
+
+# Function to number the months of some dates -> int64 months since January 1970
+def month_numbers(dates):
+    dates = pd.DatetimeIndex(dates)
+    return (dates.year.to_numpy(dtype=np.int64) - 1970) * 12 + dates.month.to_numpy(dtype=np.int64) - 1
+
+
+# Function to return the consecutive month starts from month number `first`
+def month_grid(first, count):
+    return pd.date_range(pd.Timestamp(year=1970 + first // 12, month=first % 12 + 1, day=1), periods=count, freq='MS')
+
+
+# Function to average values into (region, month) cells -> (R, T) means, NaN for cells without a figure
+def cell_means(codes, months, values, shape):
+    # Missing values are skipped, as groupby().mean() does
+    valid = ~np.isnan(values)
+    sums = np.zeros(shape)
+    counts = np.zeros(shape)
+    cells = (codes[valid], months[valid])
+    np.add.at(sums, cells, values[valid])
+    np.add.at(counts, cells, 1)
+    with np.errstate(invalid='ignore'):
+        return sums / counts
+
+
+# Function to build a panel from a long frame (one row per region and date)
+def build_long(df, region_column, date_column='Date', value_column='Value'):
+    # Regions keep the order they first appear in, as df[region_column].unique() lists them
+    codes, regions = pd.factorize(df[region_column])
+    months = month_numbers(df[date_column])
+    first = months.min()
+    months = months - first
+    shape = (len(regions), int(months.max()) + 1)
+    values = cell_means(codes, months, df[value_column].to_numpy(dtype=float), shape)
+
+    # A region's span covers its rows with a missing value too, which the forecast series fill in
+    spans = np.empty((len(regions), 2), dtype=np.int64)
+    spans[:, 0], spans[:, 1] = shape[1], -1
+    np.minimum.at(spans[:, 0], codes, months)
+    np.maximum.at(spans[:, 1], codes, months)
+    return Panel(np.asarray(regions, dtype=object), month_grid(first, shape[1]), values, spans)
+
+
+# Function to build a panel from a wide frame (dates as the index, one numeric column per region)
+def build_wide(df):
+    numeric = df.select_dtypes('number')
+    months = month_numbers(numeric.index)
+    first = months.min()
+    months = months - first
+    shape = (numeric.shape[1], int(months.max()) + 1)
+
+    # Every column has a row for every month of the table
+    rows = np.repeat(np.arange(shape[0]), len(months))
+    values = cell_means(rows, np.tile(months, shape[0]), numeric.to_numpy(dtype=float).T.ravel(), shape)
+    spans = np.tile([0, shape[1] - 1], (shape[0], 1)).astype(np.int64)
+    return Panel(numeric.columns.to_numpy(dtype=object), month_grid(first, shape[1]), values, spans)
+
+
+# How each dataset's panel is built
+BUILDERS = {
+    'oil': lambda df: build_long(df, 'Province'),
+    'wage': lambda df: build_long(df, 'Geography'),
+    'hpi': build_wide,
+}
+
+_lock = threading.Lock()
+_panels = {}
+
+
+# Function to return the panel of a dataset, rebuilding it when the dataset version changes
+def get_panel(name):
+    version = dataset_version(name)
+    with _lock:
+        cached = _panels.get(name)
+        if cached is not None and cached.version == version:
+            return cached
+
+    panel = BUILDERS[name](get_dataset(name))
+    panel.version = version
+    with _lock:
+        _panels[name] = panel
+    return panel
+
+
+if __name__ == '__main__':
+    for name in BUILDERS:
+        panel = get_panel(name)
+        print(f'{name}: {len(panel.regions)} regions x {len(panel.months)} months '
+              f'({panel.months.min():%Y-%m} to {panel.months.max():%Y-%m}), {panel.nbytes() / 1024:.1f} KB')
+
+    # Weekly earnings and the HPI of every province both list, over the months both cover
+    wage, hpi = get_panel('wage').align(get_panel('hpi'))
+    regions = [region for region in wage.regions if region in hpi]
+    wage, hpi = wage.take(regions), hpi.take(regions)
+    print(f'Weekly earnings against the HPI, {wage.months.min():%Y-%m} to {wage.months.max():%Y-%m}:')
+    for region in regions:
+        earnings, index = wage.series(region), hpi.series(region)
+        print(f'  {region}: earnings {earnings.iloc[-1] / earnings.iloc[0] - 1:+.0%}, '
+              f'HPI {index.iloc[-1] / index.iloc[0] - 1:+.0%}')
@@ -0,0 +1,244 @@
+# product_search.py
+# Cross-store product price search over the grocery price lists (<store>.csv).
+# An inverted token index over every product name is built once and pickled under
+# cache/, so a restart only reloads it. Query words match whole tokens, token prefixes
+# (so results appear while typing) and, for words of four letters or more, tokens one
+# edit away. Results come back ranked as Name/Price/Store rows.
+#
+#   python product_search.py [--rebuild] "query words"
+import argparse
+import bisect
+import os
+import pickle
+import re
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+from data_store import DATASETS, STORES, file_hash, get_dataset
+
+SEARCH_INDEX = os.path.join('cache', 'search_index.pkl')
+SEARCH_INDEX_FORMAT = 1
+
+# Weight of each kind of match; an exact token beats a prefix, which beats a typo
+EXACT, PREFIX, FUZZY = 1.0, 0.6, 0.4
+# Words shorter than this are only matched exactly or as prefixes
+MIN_FUZZY_LENGTH = 4
+# Prefixes matching more tokens than this keep only the most common ones
+MAX_PREFIX_TOKENS = 256
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+# Function to split text into lower-case ASCII tokens ("Crème Fraîche 2%" -> ['creme', 'fraiche', '2'])
+def tokenize(text):
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode()
+    return TOKEN_RE.findall(text.lower())
+
+
+# Function to list the strings one deletion away from a token
+def deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+# Function to check whether two tokens are at most one edit (insert, delete, substitute) apart
+def within_one_edit(a, b):
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    def __init__(self, names, prices, store_codes, stores, postings, sources):
+        self.names = names              # (N,) product names
+        self.prices = prices            # (N,) float64 prices, NaN when the list had none
+        self.store_codes = store_codes  # (N,) index into `stores`
+        self.stores = stores
+        self.postings = postings        # token -> sorted int32 product ids
+        self.sources = sources          # store dataset -> content hash it was built from
+
+        self.vocabulary = sorted(postings)
+        self.name_lengths = np.array([len(tokenize(name)) for name in names], dtype=np.int32)
+        # Rarer tokens say more about what the user wants
+        self.idf = {token: np.log(1 + len(names) / len(ids)) for token, ids in postings.items()}
+        # Deletion neighbourhood of every token, for one-edit fuzzy lookups
+        self.neighbours = {}
+        for token in self.vocabulary:
+            if len(token) >= MIN_FUZZY_LENGTH:
+                for variant in deletions(token):
+                    self.neighbours.setdefault(variant, []).append(token)
+
+    # Function to return (token, weight) pairs a query word matches
+    def expand(self, word):
+        matches = {}
+        # Tokens starting with the word follow it in the sorted vocabulary; walked by position, so only
+        # the matches are visited (a slice would copy the rest of the vocabulary for every word)
+        end = start = bisect.bisect_left(self.vocabulary, word)
+        while end < len(self.vocabulary) and self.vocabulary[end].startswith(word):
+            end += 1
+        prefixed = self.vocabulary[start:end]
+        if len(prefixed) > MAX_PREFIX_TOKENS:
+            prefixed = sorted(prefixed, key=lambda t: -len(self.postings[t]))[:MAX_PREFIX_TOKENS]
+        for token in prefixed:
+            matches[token] = EXACT if token == word else PREFIX
+
+        if len(word) >= MIN_FUZZY_LENGTH:
+            candidates = set(self.neighbours.get(word, ()))
+            for variant in deletions(word) | {word}:
+                candidates.update(self.neighbours.get(variant, ()))
+                if variant in self.postings:
+                    candidates.add(variant)
+            for token in candidates:
+                if token not in matches and within_one_edit(word, token):
+                    matches[token] = FUZZY
+        return matches
+
+    # Function to rank the products matching every query word -> list of Name/Price/Store dicts
+    def search(self, query, limit=50, stores=None):
+        words = tokenize(query)
+        if not words:
+            return []
+
+        total = np.zeros(len(self.names))
+        matched = np.ones(len(self.names), dtype=bool)
+        for word in words:
+            score = np.zeros(len(self.names))
+            for token, weight in self.expand(word).items():
+                ids = self.postings[token]
+                score[ids] = np.maximum(score[ids], weight * self.idf[token])
+            matched &= score > 0
+            total += score
+
+        if stores is not None:
+            allowed = [i for i, store in enumerate(self.stores) if store in stores]
+            matched &= np.isin(self.store_codes, allowed)
+
+        ids = np.flatnonzero(matched)
+        # Best score first, then the most specific (shortest) name, then the cheapest price
+        prices = np.where(np.isnan(self.prices[ids]), np.inf, self.prices[ids])
+        order = np.lexsort((prices, self.name_lengths[ids], -total[ids]))[:limit]
+        return [{'Name': self.names[i],
+                 'Price': None if np.isnan(self.prices[i]) else float(self.prices[i]),
+                 'Store': self.stores[self.store_codes[i]]}
+                for i in ids[order]]
+
+
+# Function to hash every store price list the index is built from
+def source_versions():
+    return {f'store_{store}': file_hash(DATASETS[f'store_{store}'][0]) for store in STORES}
+
+
+# Function to build the index from the cleaned store price lists
+def build_index(sources=None):
+    names, prices, store_codes = [], [], []
+    for code, store in enumerate(STORES):
+        df = get_dataset(f'store_{store}')
+        df = df[df['Name'].notna()]
+        names.extend(df['Name'].tolist())
+        prices.append(df['Price'].to_numpy(dtype=float))
+        store_codes.append(np.full(len(df), code, dtype=np.int16))
+
+    postings = {}
+    for i, name in enumerate(names):
+        for token in set(tokenize(name)):
+            postings.setdefault(token, []).append(i)
+    postings = {token: np.array(ids, dtype=np.int32) for token, ids in postings.items()}
+
+    return SearchIndex(np.array(names, dtype=object), np.concatenate(prices), np.concatenate(store_codes),
+                       list(STORES), postings, sources if sources is not None else source_versions())
+
+
+# Function to save an index atomically
+def save_index(index, path=SEARCH_INDEX):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        # Plain attributes rather than the object, so the file loads whichever module wrote it
+        pickle.dump((SEARCH_INDEX_FORMAT, vars(index)), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+# Function to load a saved index if it was built from the current store files, otherwise None
+def load_index(path=SEARCH_INDEX, sources=None):
+    try:
+        with open(path, 'rb') as f:
+            index_format, state = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+        return None
+    if index_format != SEARCH_INDEX_FORMAT:
+        return None
+    index = SearchIndex.__new__(SearchIndex)
+    index.__dict__.update(state)
+    if index.sources != (sources if sources is not None else source_versions()):
+        return None
+    return index
+
+
+_lock = threading.Lock()
+_current = {'stat': None, 'index': None}
+
+
+# Function to sign the store files cheaply so a running process notices when they change
+def source_stat():
+    stats = []
+    for store in STORES:
+        stat = os.stat(DATASETS[f'store_{store}'][0])
+        stats.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(stats)
+
+
+# Function to return the shared index, loading or rebuilding it when the store files change
+def get_index(path=SEARCH_INDEX):
+    stat = source_stat()
+    with _lock:
+        if _current['stat'] == stat:
+            return _current['index']
+
+        sources = source_versions()
+        index = load_index(path, sources)
+        if index is None:
+            index = build_index(sources)
+            try:
+                save_index(index, path)
+            except OSError:
+                # A read-only deployment can still search with the in-memory index
+                pass
+        _current['stat'] = stat
+        _current['index'] = index
+        return index
+
+
+# Function to search every store's price list
+def search_products(query, limit=50, stores=None):
+    return get_index().search(query, limit, stores)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search the grocery price lists')
+    parser.add_argument('query', nargs='?', default='')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--rebuild', action='store_true', help='rebuild and save the index first')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.rebuild:
+        save_index(build_index())
+    index = get_index()
+    print(f'Index ready in {time.perf_counter() - start:.3f}s '
+          f'({len(index.names)} products, {len(index.vocabulary)} tokens)')
+    if args.query:
+        start = time.perf_counter()
+        results = index.search(args.query, args.limit)
+        print(f'{len(results)} results in {(time.perf_counter() - start) * 1000:.2f} ms')
+        for item in results:
+            price = '' if item['Price'] is None else f"${item['Price']:.2f}"
+            print(f"  {item['Name']}  {price}  {item['Store']}")
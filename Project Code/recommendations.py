@@ -0,0 +1,190 @@
+# recommendations.py
+# "Frequently bought with" suggestions from precomputed association rules.
+# Rules are mined offline (basket_mining.py) and stored in an index keyed by antecedent:
+# the antecedent keys are sorted, and each key's rules are stored best first (lift, then
+# confidence), so a cart is answered with one binary search per subset of its items.
+# Every recommended item carries its cheapest store, looked up in the store price lists
+# when the index is built.
+#
+# Publishing a new index replaces the file atomically; running dashboards notice the new
+# file and swap it in without a restart, while requests in flight keep the old one.
+#
+#   python recommendations.py build [--min-support 0.001]
+#   python recommendations.py recommend "whole milk" "yogurt"
+import argparse
+import bisect
+import itertools
+import os
+import pickle
+import threading
+import time
+
+import numpy as np
+
+import basket_mining
+
+RULES_INDEX = os.path.join('cache', 'rules_index.pkl')
+RULES_INDEX_FORMAT = 1
+
+
+# Function to build the key of an antecedent (order of the items does not matter)
+def antecedent_key(items):
+    return '\x1f'.join(sorted(items))
+
+
+class RuleIndex:
+    def __init__(self, keys, starts, consequents, confidence, lift, support, cheapest, info):
+        self.keys = keys                # (K,) sorted antecedent keys
+        self.starts = starts            # (K + 1,) rules of keys[i] are starts[i]:starts[i + 1]
+        self.consequents = consequents  # (R,) tuple of items per rule
+        self.confidence = confidence    # (R,)
+        self.lift = lift                # (R,)
+        self.support = support          # (R,)
+        self.cheapest = cheapest        # item -> {'store', 'product', 'price'} or None
+        self.info = info                # how and when the index was mined
+
+    # Function to return the rule positions for one antecedent (binary search over the keys)
+    def rules_for(self, items):
+        key = antecedent_key(items)
+        i = bisect.bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return range(0)
+        return range(self.starts[i], self.starts[i + 1])
+
+    # Function to recommend items for a cart, best first
+    def recommend(self, cart, limit=10, max_antecedent=2):
+        cart = sorted({item.strip() for item in cart if item and item.strip()})
+        best = {}
+        for size in range(1, min(max_antecedent, len(cart)) + 1):
+            for antecedent in itertools.combinations(cart, size):
+                for r in self.rules_for(antecedent):
+                    score = (self.lift[r], self.confidence[r])
+                    for item in self.consequents[r]:
+                        if item in cart:
+                            continue
+                        if item not in best or score > best[item][0]:
+                            best[item] = (score, antecedent, r)
+
+        ranked = sorted(best.items(), key=lambda entry: entry[1][0], reverse=True)[:limit]
+        return [{
+            'item': item,
+            'because': list(antecedent),
+            'confidence': float(self.confidence[r]),
+            'lift': float(self.lift[r]),
+            'support': float(self.support[r]),
+            'cheapest': self.cheapest.get(item),
+        } for item, (_, antecedent, r) in ranked]
+
+
+# Function to find the cheapest store for every item -> {item: {'store', 'product', 'price'} or None}
+def cheapest_stores(items):
+    from basket_optimizer import get_catalogue
+
+    catalogue = get_catalogue()
+    costs, chosen = catalogue.item_costs(items)
+    result = {}
+    for i, item in enumerate(items):
+        s = int(costs[i].argmin())
+        if not np.isfinite(costs[i, s]):
+            result[item] = None
+            continue
+        result[item] = {'store': catalogue.stores[s], 'product': catalogue.names[chosen[i, s]],
+                        'price': round(float(costs[i, s]), 2)}
+    return result
+
+
+# Function to mine the transaction files and build the rule index
+def build_index(paths=basket_mining.TRANSACTION_FILES, min_support=0.001, max_len=3, min_confidence=0.05,
+                min_lift=1.0, workers=None):
+    start = time.perf_counter()
+    result = basket_mining.mine(paths, min_support, max_len, workers=workers)
+    rules = basket_mining.association_rules(result, min_confidence, min_lift)
+
+    # Group by antecedent, best rules first within each group
+    rules['key'] = [antecedent_key(items) for items in rules['antecedents']]
+    rules = rules.sort_values(['key', 'lift', 'confidence'], ascending=[True, False, False], ignore_index=True)
+    keys, starts = np.unique(rules['key'].to_numpy(), return_index=True)
+
+    items = sorted({item for consequent in rules['consequents'] for item in consequent})
+    info = {**result.stats, 'rules': len(rules), 'min_confidence': min_confidence, 'min_lift': min_lift,
+            'sources': list(paths), 'built': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'build_seconds': round(time.perf_counter() - start, 3)}
+    return RuleIndex(keys.tolist(), np.append(starts, len(rules)), rules['consequents'].tolist(),
+                     rules['confidence'].to_numpy(), rules['lift'].to_numpy(), rules['support'].to_numpy(),
+                     cheapest_stores(items), info)
+
+
+# Function to publish an index atomically; readers see either the old file or the new one
+def publish(index, path=RULES_INDEX):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        # Plain attributes rather than the object, so the file loads whichever module wrote it
+        pickle.dump((RULES_INDEX_FORMAT, vars(index)), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+_lock = threading.Lock()
+_current = {'stat': None, 'index': None}
+
+
+# Function to return the live index, swapping in a newly published file when there is one.
+# Returns None until an index has been built.
+def get_rule_index(path=RULES_INDEX):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    with _lock:
+        if _current['stat'] == stat:
+            return _current['index']
+        try:
+            with open(path, 'rb') as f:
+                index_format, state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            # Keep serving the previous index if the new file cannot be read
+            return _current['index']
+        if index_format != RULES_INDEX_FORMAT:
+            return _current['index']
+        index = RuleIndex.__new__(RuleIndex)
+        index.__dict__.update(state)
+        _current['stat'] = stat
+        _current['index'] = index
+        return index
+
+
+# Function to recommend items for a cart; empty when no index has been built yet
+def recommend(cart, limit=10):
+    index = get_rule_index()
+    return index.recommend(cart, limit) if index is not None else []
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or query the "frequently bought with" index')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build')
+    build.add_argument('paths', nargs='*', default=basket_mining.TRANSACTION_FILES)
+    build.add_argument('--min-support', type=float, default=0.001)
+    build.add_argument('--min-confidence', type=float, default=0.05)
+    build.add_argument('--workers', type=int, default=None)
+    query = commands.add_parser('recommend')
+    query.add_argument('cart', nargs='+')
+    query.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        index = build_index(args.paths, args.min_support, min_confidence=args.min_confidence, workers=args.workers)
+        publish(index)
+        print(f"Published {index.info['rules']} rules over {len(index.keys)} antecedents "
+              f"in {index.info['build_seconds']}s -> {RULES_INDEX}")
+    else:
+        start = time.perf_counter()
+        suggestions = recommend(args.cart, args.limit)
+        print(f'{len(suggestions)} suggestions in {(time.perf_counter() - start) * 1000:.2f} ms')
+        for suggestion in suggestions:
+            cheapest = suggestion['cheapest']
+            where = f"{cheapest['store']} ${cheapest['price']:.2f}" if cheapest else 'not in the price lists'
+            print(f"  {suggestion['item']} (lift {suggestion['lift']:.2f}, "
+                  f"because {', '.join(suggestion['because'])}) - {where}")
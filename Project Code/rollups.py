@@ -0,0 +1,76 @@
+# rollups.py
+# Pre-aggregated (year, month, region) means for the regional bar charts.
+# The regional pages used to mask the full frame and group it on every interaction;
+# the rollup is built once per dataset version as a dense years x 12 x regions array,
+# so a chart only indexes into it. It is the dataset's monthly panel (panels.py) cut into years.
+import threading
+
+import numpy as np
+import pandas as pd
+
+from panels import get_panel, month_numbers
+
+
+class Rollup:
+    # Mean value per (year, month, region); NaN where a region has no data for that month
+    def __init__(self, years, regions, values):
+        self.years = years        # (Y,) sorted years
+        self.regions = regions    # (R,) region names, in chart order
+        self.values = values      # (Y, 12, R) float64 means
+        self._year_pos = {int(year): i for i, year in enumerate(years)}
+
+    # Function to return (regions, means) for one month; regions without data are NaN
+    def lookup(self, year, month):
+        i = self._year_pos.get(int(year))
+        if i is None or not 1 <= month <= 12:
+            return self.regions, np.full(len(self.regions), np.nan)
+        return self.regions, self.values[i, month - 1]
+
+    # Function to return the lookup as a DataFrame with the region and value columns
+    def frame(self, year, month, region_column='Region', value_column='Value'):
+        regions, values = self.lookup(year, month)
+        return pd.DataFrame({region_column: regions, value_column: values})
+
+
+# Function to build a rollup from a monthly panel: its months padded to whole years, one year per row.
+# `sort_regions` lists the regions alphabetically rather than in the panel's order.
+def build_rollup(panel, sort_regions=False):
+    regions = panel.regions
+    order = np.argsort(regions.astype(str), kind='stable') if sort_regions else np.arange(len(regions))
+    if not len(panel.months):
+        return Rollup(np.empty(0, dtype=np.int64), regions[order], np.empty((0, 12, len(regions))))
+
+    first = month_numbers(panel.months[:1])[0]
+    lead = first % 12
+    end = lead + len(panel.months)
+    years = 1970 + first // 12 + np.arange(-(-end // 12))
+    values = np.full((len(regions), len(years) * 12), np.nan)
+    values[:, lead:end] = panel.values
+    values = values[order].reshape(len(regions), len(years), 12)
+    return Rollup(years, regions[order], np.ascontiguousarray(values.transpose(1, 2, 0)))
+
+
+# How each dataset's rollup is built from its panel; the long tables chart their regions
+# alphabetically, hpi.csv in column order
+BUILDERS = {
+    'oil': lambda panel: build_rollup(panel, sort_regions=True),
+    'wage': lambda panel: build_rollup(panel, sort_regions=True),
+    'hpi': build_rollup,
+}
+
+_lock = threading.Lock()
+_rollups = {}
+
+
+# Function to return the rollup for a dataset, rebuilding it when its panel is rebuilt
+def get_rollup(name):
+    panel = get_panel(name)
+    with _lock:
+        cached = _rollups.get(name)
+        if cached is not None and cached[0] == panel.version:
+            return cached[1]
+
+    rollup = BUILDERS[name](panel)
+    with _lock:
+        _rollups[name] = (panel.version, rollup)
+    return rollup
@@ -0,0 +1,127 @@
+# snapshot.py
+# Columnar snapshots of the cleaned datasets.
+# The cleaned DataFrames are written as uncompressed Feather (Arrow IPC) files so that
+# later loads memory-map them instead of parsing and cleaning the CSV again.
+# Run `python snapshot.py` to (re)build every snapshot.
+import json
+import os
+import sys
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # snapshots are optional; the loaders fall back to the CSV files
+    pa = None
+    feather = None
+
+SNAPSHOT_DIR = os.environ.get('DASHBOARD_SNAPSHOT_DIR', 'snapshots')
+# Bumped when a reader's output changes shape (2: food_prices keeps four typed columns)
+SNAPSHOT_FORMAT = 2
+
+
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f'{name}.feather')
+
+
+# Function to read the metadata stored in a snapshot without loading its data
+def snapshot_info(name):
+    path = snapshot_path(name)
+    if feather is None or not os.path.exists(path):
+        return None
+    try:
+        schema = feather.read_table(path, memory_map=True).schema
+    except (OSError, pa.ArrowInvalid):
+        return None
+    meta = schema.metadata or {}
+    if b'snapshot' not in meta:
+        return None
+    return json.loads(meta[b'snapshot'])
+
+
+# Function to write a cleaned DataFrame as a snapshot of the given source version.
+# `source_bytes` is how much of the source file the frame covers (used to detect appends).
+def write_snapshot(name, df, source, version, source_bytes=None):
+    if feather is None:
+        return None
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    info = {
+        'format': SNAPSHOT_FORMAT,
+        'dataset': name,
+        'source': source,
+        'source_version': version,
+        'source_bytes': source_bytes if source_bytes is not None else os.path.getsize(source),
+        'rows': len(df),
+        'schema': {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+        'index': str(df.index.dtype),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           b'snapshot': json.dumps(info).encode()})
+
+    # Write to a temporary file first so readers never see a half-written snapshot
+    path = snapshot_path(name)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+    return info
+
+
+# Function to read a snapshot if it matches the given source version, otherwise None
+def read_snapshot(name, version):
+    info = snapshot_info(name)
+    if info is None or info['format'] != SNAPSHOT_FORMAT or info['source_version'] != version:
+        return None
+    table = feather.read_table(snapshot_path(name), memory_map=True)
+    if table.num_rows != info['rows']:
+        return None
+    return table.to_pandas()
+
+
+# Function to load a dataset from its snapshot, falling back to the CSV when the snapshot is stale
+def load(name, path, reader, version):
+    df = read_snapshot(name, version)
+    if df is not None:
+        return df
+
+    df = reader(path)
+    try:
+        write_snapshot(name, df, path, version)
+    except OSError:
+        # A read-only deployment can still serve from the CSV files
+        pass
+    return df
+
+
+# Function to rebuild snapshots for every registered dataset
+def build_all(names=None):
+    from data_store import DATASETS, file_hash
+
+    results = {}
+    for name, (path, reader) in DATASETS.items():
+        if names and name not in names:
+            continue
+        if not os.path.exists(path):
+            results[name] = {'error': f'{path} not found'}
+            continue
+        start = time.perf_counter()
+        df = reader(path)
+        info = write_snapshot(name, df, path, file_hash(path))
+        csv_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        read_snapshot(name, info['source_version'])
+        snapshot_seconds = time.perf_counter() - start
+
+        results[name] = {'rows': info['rows'], 'csv_load_s': round(csv_seconds, 4),
+                         'snapshot_load_s': round(snapshot_seconds, 4)}
+    return results
+
+
+if __name__ == '__main__':
+    if feather is None:
+        sys.exit('pyarrow is required to build snapshots')
+    for name, result in build_all(sys.argv[1:]).items():
+        print(name, result)
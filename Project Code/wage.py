@@ -1,45 +1,40 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
-from statsmodels.tsa.holtwinters import ExponentialSmoothing
+from matplotlib.figure import Figure
+from data_store import dataset_version
+from forecasting import wage_series, forecast_bands
+from forecast_pool import forecast_pool, page_forecast
+from chart_cache import cached_chart, encode_figure, plot_fan
+from client_charts import line_chart
+from rollups import get_rollup
+from panels import get_panel
+from instrumentation import render_timer, span
 
 def load_data():
-    # Load the data from CSV file
-    df = pd.read_csv('Wage.csv')
-    df['Date'] = pd.to_datetime(df['Date'], format='%m/%d/%Y')
-
-    #df.head()
-    df = df[df['Geography'] != 'Canada']
-    df['Value'] = df['Value'].str.replace(',', '')  # Remove commas
-    df['Value'] = df['Value'].str.extract('(\d+)')  # Extract only numeric parts
-    df['Value'] = df['Value'].astype(float)  # Convert to float
-    df = df.dropna(subset=['Date', 'Value'])
-    return df
-
-def regional_analysis(df):
+    # Region x month earnings from the cleaned Wage.csv, built once per dataset version
+    return get_panel('wage')
+
+def regional_analysis(panel):
     st.subheader("Regional Analysis")
 
     # Sidebar filters
     st.sidebar.header("Filters")
 
+    # Per-region monthly means, precomputed once per dataset version
+    with span('load', 'wage rollup'):
+        rollup = get_rollup('wage')
+
     # Year and month dropdown filters
-    years = df['Date'].dt.year.unique()
+    years = rollup.years
     #print(years)
     selected_year = st.sidebar.selectbox("Select Year", sorted(years))
     months = range(1, 13)
     selected_month = st.sidebar.selectbox("Select Month", months, index=11)
 
     
-    # Filter data based on selections
-    filtered_df = df[(df['Date'].dt.year == selected_year) & 
-                     (df['Date'].dt.month == selected_month)]
-
-    # Ensure the Date column is not duplicated
-    filtered_df = filtered_df.copy()
-    
-    # Group by geography and compute average values
-    grouped_df = filtered_df.groupby('Geography')['Value'].mean().reset_index()
+    # Average values per geography for the selected month
+    grouped_df = rollup.frame(selected_year, selected_month, region_column='Geography')
     
     # Remove geographies with no values
     grouped_df = grouped_df[grouped_df['Value'].notna() & (grouped_df['Value'] > 0)]
@@ -47,42 +42,40 @@ def regional_analysis(df):
     # Plot data as a bar chart
     st.write(f"Average Weekly Earnings for Each Region in {selected_month}/{selected_year}")
     if not grouped_df.empty:
-        plt.figure(figsize=(12, 6))
-        plt.bar(grouped_df['Geography'], grouped_df['Value'], color='skyblue')
-        plt.xlabel("Region")
-        plt.ylabel("Average Weekly Earnings")
-        plt.title(f"Average Weekly Earnings by Region for ({selected_year}-{selected_month})")
-        plt.xticks(rotation=45, ha='right')
-        st.pyplot(plt)
+        def draw():
+            fig = Figure(figsize=(12, 6))
+            ax = fig.subplots()
+            ax.bar(grouped_df['Geography'], grouped_df['Value'], color='skyblue')
+            ax.set_xlabel("Region")
+            ax.set_ylabel("Average Weekly Earnings")
+            ax.set_title(f"Average Weekly Earnings by Region for ({selected_year}-{selected_month})")
+            ax.tick_params(axis='x', labelrotation=45)
+            for label in ax.get_xticklabels():
+                label.set_horizontalalignment('right')
+            return fig
+        state = {'year': selected_year, 'month': selected_month}
+        st.image(cached_chart('wage/regional_analysis', state, dataset_version('wage'), draw), use_column_width=True)
     else:
         st.write("No data available for the selected month and year.")
 
-def product_trend(df):
+def product_trend(panel):
     st.subheader("Product Trend")
 
-    # Filter data from 1990 to 2024
-    df = df[(df['Date'].dt.year >= 1990) & (df['Date'].dt.year <= 2024)]
-    
-    # Group by date and compute mean values
-    trend_df = df.groupby('Date')['Value'].mean().reset_index()
-    
-    # Plot the trend
-    plt.figure(figsize=(12, 6))
-    plt.plot(trend_df['Date'], trend_df['Value'], marker='o', linestyle='-')
-    plt.xlabel("Date")
-    plt.ylabel("Average Weekly Earnings")
-    plt.title("Product Trend from 1990 to 2024")
-    plt.grid(True)
-    st.pyplot(plt)
-
-def price_forecasting(df):
+    # Mean over the regions of every month from 1990 to 2024
+    trend_df = panel.window('1990-01', '2024-12').mean()
+
+    # Drawn in the browser from a downsampled series; zooming in fetches the finer detail
+    line_chart('wage/product_trend', [('Average Weekly Earnings', trend_df.index, trend_df.values, {})],
+               title="Product Trend from 1990 to 2024", y_title="Average Weekly Earnings", markers=True)
+
+def price_forecasting(panel):
     st.subheader("Price Forecasting")
 
     # Sidebar filters
     st.sidebar.header("Forecasting Options")
     
     # Region filter
-    regions = df['Geography'].unique()
+    regions = panel.regions
     selected_region = st.sidebar.selectbox("Select Region", regions)
     
     # Dropdown for selecting future date
@@ -90,66 +83,59 @@ def price_forecasting(df):
     future_month = st.sidebar.selectbox("Select Month", range(1, 13), index=11)
 
 
-    # Filter data for the selected region
-    region_data = df[df['Geography'] == selected_region]
-
-    # Ensure data is sorted by date
-    region_data = region_data.sort_values(by='Date')
-    
-    # Handle missing values (e.g., by filling forward)
-    region_data['Value'] = region_data['Value'].ffill()
-    region_data['Value'] = region_data['Value'].bfill()  # In case there are NaNs at the start
-
-    # Filter out non-positive values
-    region_data = region_data[region_data['Value'] > 0]
-
-    # Ensure there are at least 24 months of data
-    if len(region_data) < 24:
+    # Gap-filled monthly series for the selected region (needs at least 24 months of data)
+    try:
+        y = wage_series(panel, selected_region)
+    except ValueError:
         st.write("Not enough data to compute initial seasonals. Please select a region with more data.")
         return
 
-    # Create feature and target variables
-    region_data = region_data.set_index('Date')
-    y = region_data['Value']
-    
-    # Fit the time series model
-    model = ExponentialSmoothing(y, seasonal='mul', seasonal_periods=12)
-    model_fit = model.fit()
-
-    # Predict future value
+    # Predict future value (precomputed by batch_forecast.py, or fitted by a forecast worker on demand)
     future_date = pd.Timestamp(f"{future_year}-{future_month:02d}-01")
-    future_dates = pd.date_range(start=region_data.index.max(), periods=((future_year - 2024) * 12) + future_month, freq='M')
-    forecast = model_fit.predict(start=len(y), end=len(y) + len(future_dates) - 1)
+    future_dates = pd.date_range(start=y.index.max(), periods=((future_year - 2024) * 12) + future_month, freq='M')
+    forecast = page_forecast('wage', selected_region, y, len(future_dates))
+    # Simulated prediction intervals stored next to the forecast (None when it was fitted on demand)
+    bands = forecast_bands('wage', selected_region, len(future_dates))
     
     # Get the predicted value for the selected date
     predicted_value = forecast.iloc[-1]
 
     # Current data for June 2024
     try:
-        june_2024_value = region_data.loc['2024-05']['Value'].mean() if '2024-05' in region_data.index else 'Data not available'
+        june_2024_value = y.loc['2024-05'].mean() if '2024-05' in y.index else 'Data not available'
     except KeyError:
         june_2024_value = 'Data not available'
 
-    # Plot historical and forecasted values
-    plt.figure(figsize=(10, 5))
-    plt.plot(region_data.index, region_data['Value'], label='Historical Earnings')
-    plt.plot(future_dates, forecast, label='Forecasted Earnings', linestyle='--')
-    
-    plt.xlabel("Date")
-    plt.ylabel("Weekly Earnings")
-    plt.title("Weekly Earnings Forecasting")
-    plt.legend()
-    st.pyplot(plt)
+    # Plot historical and forecasted values on a figure owned by this request
+    with span('render', 'wage/price_forecasting'):
+        fig = Figure(figsize=(10, 5))
+        ax = fig.subplots()
+        if bands is not None:
+            plot_fan(ax, future_dates, bands)
+        ax.plot(y.index, y.values, label='Historical Earnings')
+        ax.plot(future_dates, forecast, label='Forecasted Earnings', linestyle='--')
+
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Weekly Earnings")
+        ax.set_title("Weekly Earnings Forecasting")
+        ax.legend()
+        png = encode_figure(fig)
+    st.image(png, use_column_width=True)
 
     # Display the predicted value
     st.write(f"The current weekly earnings for 9/2024 is {june_2024_value:.2f}" if isinstance(june_2024_value, (int, float)) else june_2024_value)
     st.write(f"The predicted weekly earnings for {future_month}/{future_year} is {predicted_value:.2f}")
+    if bands is not None and 'p10' in bands:
+        st.write(f"80% prediction interval: {bands['p10'].iloc[-1]:.2f} to {bands['p90'].iloc[-1]:.2f}")
 
 def wage_dashboard():
     #st.title("Welcome to Weekly Earnings Analysis Dashboard")
 
     # Load data
-    df = load_data()
+    with span('load', 'wage'):
+        panel = load_data()
+    # Forecast workers start in the background while the user picks a page
+    forecast_pool.start()
 
     # Main navigation for the wage dashboard
     page = st.sidebar.selectbox("Select a Page", ["Home","Regional Analysis", "Product Trend", "Price Forecasting"])
@@ -162,11 +148,14 @@ def wage_dashboard():
         st.image('static/wage.jpeg', use_column_width=True)
 
     elif page == "Regional Analysis":
-        regional_analysis(df)
+        with render_timer("Wage: Regional Analysis"):
+            regional_analysis(panel)
     elif page == "Product Trend":
-        product_trend(df)
+        with render_timer("Wage: Product Trend"):
+            product_trend(panel)
     elif page == "Price Forecasting":
-        price_forecasting(df)
+        with render_timer("Wage: Price Forecasting"):
+            price_forecasting(panel)
 
 if __name__ == "__main__":
     wage_dashboard()